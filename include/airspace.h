@@ -2,6 +2,18 @@
 #define AIRSPACE_H
 
 //#define EARTH_RADIUS_FT 20902260
+#define EARTH_RADIUS_M 6371008.8
+
+// number of flight vertices sharing one list of candidate airspaces
+#define CANDIDATE_WINDOW 16
+
+// safety margins when reusing containment results between nearby points
+#define COHERENCE_MARGIN_RELATIVE 0.01
+#define COHERENCE_MARGIN_ABSOLUTE 10.0
+
+// safety margins (the latter in feet) when bounding airspace distances by bounding box distances
+#define NEAREST_MARGIN_RELATIVE 0.01
+#define NEAREST_MARGIN_ABSOLUTE 100.0
 
 #include <boost/geometry.hpp>
 #include <boost/geometry/index/rtree.hpp>
@@ -13,6 +25,9 @@
 #include <cassert>
 #include <fstream>
 #include <utility>
+#include <limits>
+#include <algorithm>
+#include <queue>
 
 #include <nlohmann/json.hpp>
 using json = nlohmann::json;
@@ -20,6 +35,9 @@ using json = nlohmann::json;
 #include "polygon.h"
 #include "flight.h"
 #include "helpers.h"
+#include "handovers.h"
+#include "polygon_grid.h"
+#include "projection.h"
 
 using namespace std;
 
@@ -38,33 +56,102 @@ public:
 class AirspaceBoost {
 public:
     AirspaceBoost(multi_polygon shape, int lower, int upper);
+    AirspaceBoost(multi_polygon shape, int lower, int upper, box bounds);
     AirspaceBoost(string wkt, int lower, int upper);
     bool inside(float x, float y, int height);
     bool inside_bbox(float x, float y, int height);
+    bool inside_bbox(point_xy &xy, int height);
     float distance(float x, float y, int height);
     float distance(point_xy &xy, int height);
+    bool inside_polygon(point_xy &xy);
+    float boundary_distance(point_xy &xy); // metres to the nearest edge, inside or out
+    // the same tests against the planar copy of the airspace, once projected
+    bool inside(planar_point &xy, int height);
+    bool inside_bbox(planar_point &xy, int height);
+    float distance(planar_point &xy, int height);
+    bool inside_polygon(planar_point &xy);
+    float boundary_distance(planar_point &xy);
+    void project(const Projection &projection);
+    void unproject();
+    bool is_projected();
+    float height_distance(float distance_xy, int height); // combines a horizontal distance with the distance to the height limits
+    void build_grid(); // over the planar copy if projected, rebuilt after projecting
+    bool has_grid();
     multi_polygon polygon;
     int lower_limit, upper_limit;
     box bounds;
+    planar_multi_polygon planar;
+    planar_box planar_bounds;
 private:
     bool inside_height(int height);
+    PolygonGrid grid;
+    bool projected = false;
+};
+
+// Result of the last full containment test of a flight against one airspace,
+// valid for any point within radius metres of the anchor.
+template<typename Point>
+struct CoherenceEntry {
+    Point anchor;
+    float radius = 0;
+    bool inside = false;
+    bool valid = false;
+    // the flight the entry was filled for, as numbered by FlightScratch
+    unsigned long flight = 0;
+};
+
+// Working buffers for processing a flight, kept per thread and reused.
+// The caches are indexed by airspace and only entries of the current flight count.
+struct FlightScratch {
+    unsigned long flight = 0;
+    vector<int> window;
+    vector<int> active;
+    vector<int> next;
+    vector<CoherenceEntry<point_xy>> cache;
+    vector<CoherenceEntry<planar_point>> planar_cache;
+    vector<planar_point> projected;
 };
 
 class MultiAirspace {
 public:
-    MultiAirspace();
+    MultiAirspace(bool use_grid = false);
     int add_airspace(AirspaceBoost &airspace);
+    // adds many airspaces at once, packing the R-tree rather than inserting into it; returns the first new identifier
+    int add_airspaces(vector<AirspaceBoost> &new_airspaces, int num_threads=0);
     int add_airspaces_file(string location);
+    // snapshot of every airspace, see airspace_index.h; loading replaces any existing airspaces
+    void save_index(string location);
+    int load_index(string location);
     vector<int> query_point(float x, float y, int height);
     vector<int> query_box(box query);
-    vector<pair<int, float>> airspaces_near_point(float x, float y, int height, int k=5);
+    void query_box(box query, vector<int> &out);
+    // the k nearest airspaces not containing the point, by exact distance in feet, nearest first;
+    // all of them within max_distance if k is not positive
+    vector<pair<int, float>> airspaces_near_point(float x, float y, int height, int k=5, float max_distance=numeric_limits<float>::infinity());
     long unsigned int size();
-    void process_flight(Flight &flight, vector<vector<int>> &out);
+    void process_flight(Flight &flight, HandoverCounts &out);
     vector<pair<int, int>> process_single_flight(Flight &flight);
     float distance_to_airspace(float x, float y, int height, int id);
+    // distance from one point to several airspaces, NaN for unknown ids
+    void distances_to_airspaces(float x, float y, int height, const int *ids, int count, float *out);
+    // reuse containment results between consecutive flight vertices, on by default; no effect on
+    // airspaces with a polygon grid, which are those of at least GRID_MIN_EDGES points when it is enabled
+    void set_temporal_coherence(bool enabled);
+    // test against airspaces projected into the plane rather than on the ellipsoid, or geodesically again if null
+    void set_projection(shared_ptr<const Projection> projection, int num_threads=0);
+    shared_ptr<const Projection> get_projection();
 private:
+    template<typename Handover>
+    void traverse_flight(Flight &flight, Handover handover);
+    template<typename Point>
+    bool inside_candidate(int id, Point &point, int height, CoherenceEntry<Point> &entry);
+    void window_candidates(Flight &flight, int start, int end, vector<int> &window);
+    void pack_rtree();
     vector<AirspaceBoost> airspaces;
     bgi::rtree<value, bgi::rstar<16>> rtree;
+    bool temporal_coherence = true;
+    bool polygon_grid;
+    shared_ptr<const Projection> projection;
 };
 
 #endif
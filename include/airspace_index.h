@@ -0,0 +1,53 @@
+#ifndef AIRSPACE_INDEX_H
+#define AIRSPACE_INDEX_H
+
+#include <boost/interprocess/file_mapping.hpp>
+#include <boost/interprocess/mapped_region.hpp>
+
+#include <cstdint>
+#include <cstring>
+#include <fstream>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+#include "airspace.h"
+
+#define AIRSPACE_INDEX_MAGIC "FPAI"
+#define AIRSPACE_INDEX_VERSION 1
+
+namespace bip = boost::interprocess;
+using namespace std;
+
+// Binary snapshot of the airspaces held by a MultiAirspace, as written by
+// MultiAirspace::save_index. All values are little-endian:
+//
+//   char[4]   magic ("FPAI")
+//   uint32    version
+//   uint64    number of airspaces A
+//   uint64    number of polygons G
+//   uint64    number of rings R
+//   uint64    number of points P
+//   int32     lower_limits[A]
+//   int32     upper_limits[A]
+//   float64   bounds[A][4]          (min x, min y, max x, max y)
+//   uint64    polygon_offsets[A+1]  (airspace a is polygons polygon_offsets[a] to polygon_offsets[a+1])
+//   uint64    ring_offsets[G+1]     (polygon g is rings ring_offsets[g] to ring_offsets[g+1], outer ring first)
+//   uint64    point_offsets[R+1]    (ring r is points point_offsets[r] to point_offsets[r+1])
+//   float64   xs[P]
+//   float64   ys[P]
+//
+// Every section is 8-byte aligned, so the file is memory-mapped and read in
+// place: no WKT is parsed and no bounds are recomputed on loading.
+struct AirspaceIndexHeader {
+    char magic[4];
+    uint32_t version;
+    uint64_t num_airspaces;
+    uint64_t num_polygons;
+    uint64_t num_rings;
+    uint64_t num_points;
+};
+
+bool is_airspace_index(string location);
+
+#endif
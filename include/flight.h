@@ -6,6 +6,8 @@
 #include <boost/geometry/geometries/point_xy.hpp>
 
 #include <cassert>
+#include <cstddef>
+#include <memory>
 #include <vector>
 
 #include "helpers.h"
@@ -15,16 +17,52 @@
 
 using namespace std;
 
+// A column of coordinates read in place from a float32 or float64 buffer, with a stride in bytes.
+// The column does not own the buffer, which must outlive it.
+class FlightColumn {
+public:
+    FlightColumn();
+    FlightColumn(const float *data, ptrdiff_t stride = sizeof(float));
+    FlightColumn(const double *data, ptrdiff_t stride = sizeof(double));
+    // the same column starting at entry i
+    FlightColumn from(long i) const;
+    double operator[](long i) const {
+        const char *p = data + i * stride;
+        return is_double ? *reinterpret_cast<const double*>(p) : *reinterpret_cast<const float*>(p);
+    }
+private:
+    const char *data;
+    ptrdiff_t stride;
+    bool is_double;
+};
+
 class Flight {
 public:
+    // copies the coordinates, with heights in metres unless ft is set
     Flight(int vs, vector<float> xs, vector<float> ys, vector<int> hs, bool ft = false);
+    // reads the coordinates in place from buffers which must outlive the flight, with heights in metres
+    // rounded to the nearest metre, or truncated as when reading a binary flight dump
+    Flight(int vs, FlightColumn xs, FlightColumn ys, FlightColumn hs, bool round = true);
+    float x(int i) const {
+        return (float) column_x[i];
+    }
+    float y(int i) const {
+        return (float) column_y[i];
+    }
+    // height in ft
+    int height(int i) const {
+        return vertices_height[i];
+    }
     int vertices;
-    vector<float> vertices_x;
-    vector<float> vertices_y;
-    vector<int> vertices_height;
     float x_lower, x_upper, y_lower, y_upper;
     int height_lower, height_upper;
     box bbox;
+private:
+    void compute_bounds();
+    // coordinates copied by the first constructor, shared by copies of the flight
+    shared_ptr<const vector<float>> owned_x, owned_y;
+    FlightColumn column_x, column_y;
+    vector<int> vertices_height;
 };
 
 #endif
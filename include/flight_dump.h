@@ -0,0 +1,53 @@
+#ifndef FLIGHT_DUMP_H
+#define FLIGHT_DUMP_H
+
+#include <boost/interprocess/file_mapping.hpp>
+#include <boost/interprocess/mapped_region.hpp>
+
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <fstream>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+#include "flight.h"
+
+#define FLIGHT_DUMP_MAGIC "FPFD"
+#define FLIGHT_DUMP_VERSION 1
+
+namespace bip = boost::interprocess;
+using namespace std;
+
+// Binary flight dump, as written by FlightDownloader. All values are little-endian:
+//
+//   char[4]   magic ("FPFD")
+//   uint32    version
+//   uint64    number of flights F
+//   uint64    total number of points P
+//   uint64    offsets[F+1]    (flight i is points offsets[i] to offsets[i+1])
+//   float32   longitudes[P]
+//   float32   latitudes[P]
+//   float32   altitudes[P]    (metres, NaN where unknown)
+//
+// The file is memory-mapped so flights are read in place without any parsing or copying,
+// and must stay open while they are in use.
+class FlightDump {
+public:
+    FlightDump(string location);
+    long unsigned int size();
+    // flights with an unknown altitude are skipped, as with JSON dumps
+    bool valid(int i);
+    Flight flight(int i);
+private:
+    bip::file_mapping file;
+    bip::mapped_region region;
+    uint64_t num_flights, num_points;
+    const uint64_t *offsets;
+    const float *xs, *ys, *hs;
+};
+
+bool is_flight_dump(string location);
+
+#endif
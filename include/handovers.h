@@ -0,0 +1,25 @@
+#ifndef HANDOVERS_H
+#define HANDOVERS_H
+
+#include <algorithm>
+#include <cstdint>
+#include <unordered_map>
+#include <vector>
+
+using namespace std;
+
+// Sparse accumulator of handover counts between pairs of airspaces.
+// Memory scales with the number of distinct handovers rather than N^2.
+class HandoverCounts {
+public:
+    void add(int from, int to, int count = 1);
+    void merge(const HandoverCounts &other);
+    void clear();
+    long unsigned int nnz() const;
+    // row-major (from, to, count) triplets, ready for a CSR matrix
+    void to_coo(vector<int> &rows, vector<int> &cols, vector<int> &values) const;
+private:
+    unordered_map<uint64_t, int> counts;
+};
+
+#endif
@@ -19,10 +19,18 @@ using namespace std;
 
 typedef bg::model::d2::point_xy<double, bg::cs::geographic<bg::degree>> point_xy;
 typedef bg::model::polygon<point_xy> polygon;
+typedef polygon::ring_type polygon_ring;
 typedef bg::model::multi_polygon<polygon> multi_polygon;
 typedef bg::model::box<point_xy> box;
 typedef pair<box, int> value;
 
+// the same geometries in projected coordinates, in metres, see projection.h
+typedef bg::model::d2::point_xy<double> planar_point;
+typedef bg::model::polygon<planar_point> planar_polygon;
+typedef planar_polygon::ring_type planar_ring;
+typedef bg::model::multi_polygon<planar_polygon> planar_multi_polygon;
+typedef bg::model::box<planar_point> planar_box;
+
 //typedef bg::strategy::distance::haversine<float> haversine;
 
 // adapted from https://stackoverflow.com/questions/14539867/how-to-display-a-progress-indicator-in-pure-c-c-cout-printf
@@ -30,4 +38,8 @@ void progress_bar(float progress, int barWidth = 70);
 
 float metre_to_ft(float metres);
 
+// height in whole ft of a position given in metres, rounded to the nearest metre first,
+// so that flights and point queries place the same position at the same height
+int metres_to_height_ft(double metres);
+
 #endif
\ No newline at end of file
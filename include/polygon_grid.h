@@ -0,0 +1,40 @@
+#ifndef POLYGON_GRID_H
+#define POLYGON_GRID_H
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <vector>
+
+#include "helpers.h"
+
+#define GRID_MIN_EDGES 32
+#define GRID_MAX_CELLS 64
+
+using namespace std;
+
+// Uniform grid over an airspace's bounding box, classifying each cell as
+// entirely inside, entirely outside, or touched by the boundary.
+// Points in inside/outside cells are answered in O(1); only points in boundary
+// cells need a full point-in-polygon test.
+// The grid can be built over a polygon in longitude/latitude or in projected
+// coordinates, and must then be queried in the same coordinates.
+class PolygonGrid {
+public:
+    template<typename MultiPolygon, typename Box>
+    void build(const MultiPolygon &polygon, const Box &bounds);
+    bool built();
+    // GRID_INSIDE, GRID_OUTSIDE, or GRID_BOUNDARY if a full test is needed
+    int classify(double x, double y);
+    static const int8_t GRID_BOUNDARY = -1;
+    static const int8_t GRID_OUTSIDE = 0;
+    static const int8_t GRID_INSIDE = 1;
+private:
+    template<typename Point>
+    void mark_segment(const Point &a, const Point &b);
+    int nx = 0, ny = 0;
+    double x0, y0, dx, dy;
+    vector<int8_t> cells;
+};
+
+#endif
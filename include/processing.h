@@ -5,6 +5,15 @@
 #include <fstream>
 #include <vector>
 #include <tuple>
+#include <thread>
+#include <atomic>
+#include <mutex>
+#include <condition_variable>
+#include <deque>
+#include <memory>
+#include <functional>
+#include <stdexcept>
+#include <exception>
 
 #include <nlohmann/json.hpp>
 using json = nlohmann::json;
@@ -13,9 +22,65 @@ using json = nlohmann::json;
 #include "airspace.h"
 #include "flight.h"
 #include "helpers.h"
+#include "handovers.h"
+#include "flight_dump.h"
 
 using namespace std;
 
+// SAX handler for flight dumps of the form {"flights": [[[x, y, h], ...], ...]}.
+// Each flight is handed to the callback as soon as it has been read, so only
+// one flight is held in memory at a time.
+class FlightSaxHandler : public nlohmann::json_sax<json> {
+public:
+    FlightSaxHandler(function<void(Flight &)> callback);
+    bool null() override;
+    bool boolean(bool val) override;
+    bool number_integer(number_integer_t val) override;
+    bool number_unsigned(number_unsigned_t val) override;
+    bool number_float(number_float_t val, const string_t &s) override;
+    bool string(string_t &val) override;
+    bool binary(binary_t &val) override;
+    bool start_object(size_t elements) override;
+    bool key(string_t &val) override;
+    bool end_object() override;
+    bool start_array(size_t elements) override;
+    bool end_array() override;
+    bool parse_error(size_t position, const std::string &last_token, const nlohmann::detail::exception &ex) override;
+    std::string error;
+private:
+    void coordinate_value(double val, bool is_null);
+    function<void(Flight &)> handle_flight;
+    int depth = 0;
+    bool flights_next = false;
+    bool in_flights = false;
+    bool broken = false;
+    int component = 0;
+    bool component_null = false;
+    double coordinate[3];
+    vector<float> xs;
+    vector<float> ys;
+    vector<int> hs;
+};
+
+// Bounded queue handing parsed flights from the parser to worker threads.
+class FlightQueue {
+public:
+    FlightQueue(int cap);
+    bool push(unique_ptr<Flight> flight); // false once aborted, discarding the flight
+    unique_ptr<Flight> pop(); // nullptr once closed and drained
+    void close();
+    void abort(); // close and discard any waiting flights
+private:
+    deque<unique_ptr<Flight>> items;
+    long unsigned int capacity;
+    bool closed = false;
+    bool aborted = false;
+    mutex m;
+    condition_variable not_empty, not_full;
+};
+
+void stream_flights(string location, function<void(Flight &)> handle_flight);
+
 vector<Flight> extract_flights(string location);
 
 
@@ -24,6 +89,23 @@ MultiAirspace extract_airspaces2(string location);
 void extract_airspaces_new(string location, MultiAirspace &airspaces);
 */
 
-void process_flights(vector<Flight> &flights, MultiAirspace &airspaces, vector<vector<int>> &out, bool progress = false);
+// Run work(i, thread) for i in [0, count) on num_threads threads, where thread
+// is the index of the worker running item i. num_threads <= 0 uses every
+// available core.
+void parallel_for(int count, int num_threads, function<void(int, int)> work);
+
+// Run work(i, accumulator) for i in [0, count) on num_threads threads, each with
+// its own accumulator, merging the accumulators into out at the end.
+// num_threads <= 0 uses every available core, 1 processes flights serially
+void process_indexed(int count, int num_threads, HandoverCounts &out, bool progress, function<void(int, HandoverCounts &)> work);
+
+void process_flights(vector<Flight> &flights, MultiAirspace &airspaces, HandoverCounts &out, bool progress = false, int num_threads = 1);
+
+void process_flights_dump(FlightDump &dump, MultiAirspace &airspaces, HandoverCounts &out, int num_threads = 1);
+
+// parse and process a flight dump in a single pass, without loading every flight first
+void process_flights_stream(string location, MultiAirspace &airspaces, HandoverCounts &out, int num_threads = 1);
+
+int default_num_threads();
 
 #endif
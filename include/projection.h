@@ -0,0 +1,32 @@
+#ifndef PROJECTION_H
+#define PROJECTION_H
+
+#include <memory>
+#include <stdexcept>
+#include <string>
+
+#include "helpers.h"
+
+using namespace std;
+
+// A map projection from longitude and latitude in degrees to planar
+// coordinates in metres, given as a PROJ.4 string (e.g. "+proj=lcc ...").
+// Airspaces and flights projected with a local projection can be tested with
+// Cartesian arithmetic, which is much cheaper than the geodesic strategies
+// used for point_xy, at the cost of the projection's distortion.
+//
+// The projection itself is kept out of this header, since the projection
+// library is slow to compile.
+class Projection {
+public:
+    // throws runtime_error if the definition is not a valid projection
+    Projection(string definition);
+    planar_point forward(const point_xy &point) const;
+    void forward(const multi_polygon &shape, planar_multi_polygon &out) const;
+    string definition;
+private:
+    struct Impl;
+    shared_ptr<const Impl> impl;
+};
+
+#endif
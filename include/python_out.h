@@ -4,11 +4,16 @@
 #include <vector>
 #include <iostream>
 #include <utility>
+#include <limits>
 
 #include "processing.h"
 #include "airspace.h"
+#include "airspace_index.h"
+#include "wkb.h"
+#include "projection.h"
 #include "flight.h"
 #include "polygon.h"
+#include "handovers.h"
 
 #include <boost/geometry.hpp>
 #include <boost/python.hpp>
@@ -32,24 +37,61 @@ py::list vector_to_list(const std::vector<T>& v)
 }
 */
 
+// Copy a vector into a new one-dimensional NumPy array.
+template<class T>
+np::ndarray vector_to_array(const std::vector<T>& v)
+{
+    np::ndarray out = np::empty(py::make_tuple(v.size()), np::dtype::get_builtin<T>());
+    copy(v.begin(), v.end(), reinterpret_cast<T*>(out.get_data()));
+    return out;
+}
+
+// Releases the GIL for the lifetime of the object, so that long-running C++
+// work does not block other Python threads.
+class ScopedGILRelease {
+public:
+    ScopedGILRelease() { state = PyEval_SaveThread(); }
+    ~ScopedGILRelease() { PyEval_RestoreThread(state); }
+private:
+    PyThreadState *state;
+};
+
 class AirspaceHandler {
 public:
-    AirspaceHandler();
+    AirspaceHandler(bool polygon_grid=true);
     int add_airspace(string wkt, int lower, int upper);
     int add_airspaces_file(string location);
-    //void add_airspaces(); TODO
+    int add_airspaces(py::object wkbs, np::ndarray &lower, np::ndarray &upper, int num_threads=0);
+    int save_index(string location);
+    int load_index(string location);
     py::list process_single_flight(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs);
+    py::tuple process_flights_batch(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &offsets, int num_threads=0);
     void process_flight(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs);
-    void process_flights_file(string location);
+    void process_flights_arrays(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &offsets, int num_threads=0);
+    void process_flights_file(string location, int num_threads=0);
+    // handovers of the given flights only, as (rows, cols, counts), leaving the accumulated result untouched,
+    // so several threads may call these at once
+    py::tuple count_flights_file(string location, int num_threads=0);
+    py::tuple count_flights_arrays(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &offsets, int num_threads=0);
     py::list airspaces_at_point(float x, float y, int height, bool ft=true);
-    py::list airspaces_near_point(float x, float y, int height, bool ft=true);
+    py::list airspaces_near_point(float x, float y, int height, bool ft=true, int k=5, float max_distance_ft=numeric_limits<float>::infinity());
+    py::tuple airspaces_at_points(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, bool ft=true, int num_threads=0);
+    py::tuple airspaces_near_points(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, int k=5, bool ft=true, int num_threads=0, float max_distance_ft=numeric_limits<float>::infinity());
     float distance_to_airspace(float x, float y, int height, int id);
+    np::ndarray distances_to_airspaces(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &ids, bool outer=false, int num_threads=0);
+    // no effect on airspaces with a polygon grid, which with the default polygon_grid=true are all
+    // those of at least GRID_MIN_EDGES (32) points; the handovers found are the same either way
+    void set_temporal_coherence(bool enabled);
+    // a PROJ.4 string giving coordinates in metres, or None (or an empty string) for geodesic tests again
+    int set_projection(py::object definition, int num_threads=0);
+    string get_projection();
     int size();
     void reset_result();
     np::ndarray get_result();
+    py::tuple get_result_sparse();
 private:
     MultiAirspace airspaces;
-    vector<vector<int>> result;
+    HandoverCounts result;
     bool ready = false;
     int N;
 };
@@ -0,0 +1,19 @@
+#ifndef WKB_H
+#define WKB_H
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+
+#include "helpers.h"
+
+using namespace std;
+
+// Parse a polygon or multipolygon from well-known binary, as written by
+// shapely. Either byte order is accepted, as are Z and M coordinates (in ISO
+// or PostGIS extended form), which are ignored. Rings are read as-is, in the
+// same way as bg::read_wkt. Returns false if the data is malformed or holds
+// any other type of geometry.
+bool read_wkb(const unsigned char *data, size_t length, multi_polygon &out);
+
+#endif
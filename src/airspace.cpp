@@ -1,4 +1,5 @@
 #include "airspace.h"
+#include "processing.h"
 
 Airspace::Airspace(Polygon poly, int lower, int upper, int ident) {
     polygon = poly;
@@ -29,7 +30,18 @@ AirspaceBoost::AirspaceBoost(multi_polygon poly, int lower, int upper) {
     polygon = poly;
     lower_limit = lower;
     upper_limit = upper;
-    bg::envelope(polygon, bounds);
+    if (!bg::is_empty(polygon)) {
+        bg::envelope(polygon, bounds);
+    } else {
+        bounds = box(point_xy(0,0), point_xy(0,0));
+    }
+}
+
+AirspaceBoost::AirspaceBoost(multi_polygon poly, int lower, int upper, box b) {
+    polygon = poly;
+    lower_limit = lower;
+    upper_limit = upper;
+    bounds = b;
 }
 
 AirspaceBoost::AirspaceBoost(string wkt, int lower, int upper) {
@@ -56,21 +68,77 @@ bool AirspaceBoost::inside_height(int height) {
 }
 
 bool AirspaceBoost::inside(float x, float y, int height) {
-    return inside_bbox(x, y, height) && bg::within(point_xy(x, y), polygon);
+    if (!inside_bbox(x, y, height)) {
+        return false;
+    }
+    point_xy xy = point_xy(x, y);
+    return inside_polygon(xy);
 }
 
 bool AirspaceBoost::inside_bbox(float x, float y, int height) {
     return inside_height(height) && bg::within(point_xy(x, y), bounds);
 }
 
+bool AirspaceBoost::inside_bbox(point_xy &xy, int height) {
+    return inside_height(height) && bg::within(xy, bounds);
+}
+
+bool AirspaceBoost::inside_polygon(point_xy &xy) {
+    if (grid.built() && !projected) {
+        int cell = grid.classify(xy.x(), xy.y());
+        if (cell != PolygonGrid::GRID_BOUNDARY) {
+            return cell == PolygonGrid::GRID_INSIDE;
+        }
+    }
+    return bg::within(xy, polygon);
+}
+
+bool AirspaceBoost::has_grid() {
+    return grid.built();
+}
+
+void AirspaceBoost::build_grid() {
+    if (projected) {
+        if (!bg::is_empty(planar)) {
+            grid.build(planar, planar_bounds);
+        }
+    } else if (!bg::is_empty(polygon)) {
+        grid.build(polygon, bounds);
+    }
+}
+
+float AirspaceBoost::boundary_distance(point_xy &xy) {
+    // spherical rather than geodesic, this is only used as a conservative bound
+    bg::strategy::distance::cross_track<> strategy(EARTH_RADIUS_M);
+    double result = numeric_limits<double>::infinity();
+
+    auto ring_distance = [&](const polygon_ring &ring) {
+        for (int k = 1; k < ring.size(); k++) {
+            bg::model::referring_segment<const point_xy> segment(ring[k-1], ring[k]);
+            result = min(result, (double) bg::distance(xy, segment, strategy));
+        }
+    };
+
+    for (auto const &poly : polygon) {
+        ring_distance(poly.outer());
+        for (auto const &inner : poly.inners()) {
+            ring_distance(inner);
+        }
+    }
+
+    return result;
+}
+
 float AirspaceBoost::distance(float x, float y, int height) {
     point_xy xy = point_xy(x, y);
     return distance(xy, height);
 }
 
 float AirspaceBoost::distance(point_xy &xy, int height) {
-    float distance_xy = metre_to_ft(bg::distance(xy, polygon));
+    return height_distance(metre_to_ft(bg::distance(xy, polygon)), height);
+}
 
+float AirspaceBoost::height_distance(float distance_xy, int height) {
     float distance_height;
     if (inside_height(height)) {
         distance_height = 0;
@@ -82,18 +150,106 @@ float AirspaceBoost::distance(point_xy &xy, int height) {
     return sqrt(pow(distance_xy, 2) + pow(distance_height, 2));
 }
 
+void AirspaceBoost::project(const Projection &projection) {
+    projection.forward(polygon, planar);
+    if (!bg::is_empty(planar)) {
+        bg::envelope(planar, planar_bounds);
+    } else {
+        planar_bounds = planar_box(planar_point(0,0), planar_point(0,0));
+    }
+    projected = true;
+}
+
+void AirspaceBoost::unproject() {
+    planar.clear();
+    projected = false;
+}
+
+bool AirspaceBoost::is_projected() {
+    return projected;
+}
+
+bool AirspaceBoost::inside(planar_point &xy, int height) {
+    return inside_bbox(xy, height) && inside_polygon(xy);
+}
 
-MultiAirspace::MultiAirspace() {
+bool AirspaceBoost::inside_bbox(planar_point &xy, int height) {
+    return inside_height(height) && bg::within(xy, planar_bounds);
+}
 
+bool AirspaceBoost::inside_polygon(planar_point &xy) {
+    if (grid.built()) {
+        int cell = grid.classify(xy.x(), xy.y());
+        if (cell != PolygonGrid::GRID_BOUNDARY) {
+            return cell == PolygonGrid::GRID_INSIDE;
+        }
+    }
+    return bg::within(xy, planar);
+}
+
+float AirspaceBoost::boundary_distance(planar_point &xy) {
+    double result = numeric_limits<double>::infinity();
+
+    auto ring_distance = [&](const planar_ring &ring) {
+        for (int k = 1; k < ring.size(); k++) {
+            bg::model::referring_segment<const planar_point> segment(ring[k-1], ring[k]);
+            result = min(result, (double) bg::distance(xy, segment));
+        }
+    };
+
+    for (auto const &poly : planar) {
+        ring_distance(poly.outer());
+        for (auto const &inner : poly.inners()) {
+            ring_distance(inner);
+        }
+    }
+
+    return result;
+}
+
+float AirspaceBoost::distance(planar_point &xy, int height) {
+    return height_distance(metre_to_ft(bg::distance(xy, planar)), height);
+}
+
+
+MultiAirspace::MultiAirspace(bool use_grid) {
+    polygon_grid = use_grid;
 }
 
 int MultiAirspace::add_airspace(AirspaceBoost &airspace) {
     int id = airspaces.size();
     airspaces.push_back(airspace);
+    if (projection) {
+        airspaces.back().project(*projection);
+    }
+    if (polygon_grid) {
+        airspaces.back().build_grid();
+    }
     rtree.insert(make_pair(airspace.bounds, id));
     return id;
 }
 
+int MultiAirspace::add_airspaces(vector<AirspaceBoost> &new_airspaces, int num_threads) {
+    int first = airspaces.size();
+    for (auto &airspace : new_airspaces) {
+        airspaces.push_back(move(airspace));
+    }
+
+    if (polygon_grid || projection) {
+        parallel_for(new_airspaces.size(), num_threads, [&](int i, int t) {
+            if (projection) {
+                airspaces[first + i].project(*projection);
+            }
+            if (polygon_grid) {
+                airspaces[first + i].build_grid();
+            }
+        });
+    }
+
+    pack_rtree();
+    return first;
+}
+
 int MultiAirspace::add_airspaces_file(string location) {
     ifstream regions_file(location);
     json regions;
@@ -114,6 +270,7 @@ int MultiAirspace::add_airspaces_file(string location) {
 
 vector<int> MultiAirspace::query_point(float x, float y, int height) {
     point_xy point = point_xy(x, y);
+    planar_point projected = projection ? projection->forward(point) : planar_point(0, 0);
     //box point = box(point_xy(x, y), point_xy(x, y));
 
     vector<value> result_rtree;
@@ -122,11 +279,13 @@ vector<int> MultiAirspace::query_point(float x, float y, int height) {
     vector<int> result;
     BOOST_FOREACH(value const &v, result_rtree) {
         int id = v.second;
-        if (airspaces[id].inside(x, y, height)) {
+        bool inside = projection ? airspaces[id].inside(projected, height) : airspaces[id].inside(x, y, height);
+        if (inside) {
             result.push_back(id);
         }
     }
 
+    sort(result.begin(), result.end());
     return result;
 }
 
@@ -140,30 +299,78 @@ vector<int> MultiAirspace::query_box(box query) {
             range | boost::adaptors::transformed([](value const& p) { return p.second; }));
 }
 
-vector<pair<int, float>> MultiAirspace::airspaces_near_point(float x, float y, int height, int k) {
+void MultiAirspace::query_box(box query, vector<int> &out) {
+    out.clear();
+    for (auto it = bgi::qbegin(rtree, bgi::intersects(query)); it != bgi::qend(rtree); ++it) {
+        out.push_back(it->second);
+    }
+}
+
+vector<pair<int, float>> MultiAirspace::airspaces_near_point(float x, float y, int height, int k, float max_distance) {
+    vector<pair<int, float>> result;
+    if (rtree.empty()) {
+        return result;
+    }
+
     point_xy point = point_xy(x, y);
+    planar_point projected = projection ? projection->forward(point) : planar_point(0, 0);
+
+    // the nearest airspaces so far, furthest on top, with ties broken by
+    // identifier so the result does not depend on the layout of the tree
+    priority_queue<pair<float, int>> nearest;
+    auto cutoff = [&]() -> float {
+        return (k > 0 && nearest.size() == k) ? min(max_distance, nearest.top().first) : max_distance;
+    };
+
+    // Boxes are visited in order of distance from the point, and the distance
+    // to a box bounds the distance to every airspace not yet visited, so the
+    // search stops once it passes the k-th nearest airspace found so far. The
+    // margins absorb the difference between the box and polygon distance
+    // strategies, and the distortion of the projection in planar mode.
+    for (auto it = bgi::qbegin(rtree, bgi::nearest(point, rtree.size())); it != bgi::qend(rtree); ++it) {
+        float bound = metre_to_ft(bg::distance(point, it->first)) * (1 - NEAREST_MARGIN_RELATIVE) - NEAREST_MARGIN_ABSOLUTE;
+        if (bound > cutoff()) {
+            break;
+        }
 
-    vector<value> result_rtree;
-    rtree.query(bgi::intersects(point), back_inserter(result_rtree));
+        int id = it->second;
+        AirspaceBoost &airspace = airspaces[id];
 
-    int n = result_rtree.size();
-    result_rtree.clear();
+        // the height limits tighten the bound for this airspace alone
+        if (bg::is_empty(airspace.polygon) || airspace.height_distance(max(bound, 0.0f), height) > cutoff()) {
+            continue;
+        }
 
-    rtree.query(bgi::nearest(point, n+k), back_inserter(result_rtree));
+        float distance;
+        if (projection) {
+            if (airspace.inside(projected, height)) {
+                continue;
+            }
+            distance = airspace.distance(projected, height);
+        } else {
+            if (airspace.inside(x, y, height)) {
+                continue;
+            }
+            distance = airspace.distance(point, height);
+        }
 
-    vector<pair<int, float>> result;
-    BOOST_FOREACH(value const &v, result_rtree) {
-        int id = v.second;
-        if (!airspaces[id].inside(x, y, height)) {
-            float distance = airspaces[id].distance(point, height);
-            result.push_back(pair<int, float>(id, distance));
+        // also skips NaN, for a point outside the projection
+        if (!(distance <= max_distance)) {
+            continue;
+        }
+
+        nearest.push(make_pair(distance, id));
+        if (k > 0 && nearest.size() > k) {
+            nearest.pop();
         }
     }
 
-    sort(result.begin(), result.end(), [](const pair<int, float> &a, const pair<int, float> &b) -> bool
-    {
-        return a.second < b.second;
-    });
+    result.reserve(nearest.size());
+    while (!nearest.empty()) {
+        result.push_back(make_pair(nearest.top().second, nearest.top().first));
+        nearest.pop();
+    }
+    reverse(result.begin(), result.end());
 
     return result;
 }
@@ -184,11 +391,11 @@ void MultiAirspace::process_flight(Flight &flight, vector<vector<int>> &out) {
 
     for (int i = 0; i < flight.vertices; i++) {
         vector<value> result_rtree;
-        rtree.query(bgi::intersects(point_xy(flight.vertices_x[i], flight.vertices_y[i])), back_inserter(result_rtree));
+        rtree.query(bgi::intersects(point_xy(flight.x(i), flight.y(i))), back_inserter(result_rtree));
 
         BOOST_FOREACH(value const &v, result_rtree) {
             int j = v.second;
-            if (airspaces[j].inside(flight.vertices_x[i], flight.vertices_y[i], flight.vertices_height[i])) {
+            if (airspaces[j].inside(flight.x(i), flight.y(i), flight.height(i))) {
                 spaces2->at(j) = true;
                 if (!spaces1->at(j)) {
                     for (int k = 0; k < N; k++) {
@@ -205,87 +412,205 @@ void MultiAirspace::process_flight(Flight &flight, vector<vector<int>> &out) {
 }
 */
 
-void MultiAirspace::process_flight(Flight &flight, vector<vector<int>> &out) {
-    int N = size();
-    assert(out.size() >= N && out[0].size() >= N);
-
-    vector<int> do_check = query_box(flight.bbox);
-
-    vector<bool> *spaces1 = new vector<bool>(N);
-    vector<bool> *spaces2 = new vector<bool>(N);
-    fill(spaces1->begin(), spaces1->end(), false);
-    fill(spaces2->begin(), spaces2->end(), false);
+template<typename Point>
+static CoherenceEntry<Point> &coherence_entry(vector<CoherenceEntry<Point>> &cache, int id, unsigned long flight) {
+    CoherenceEntry<Point> &entry = cache[id];
+    if (entry.flight != flight) {
+        entry = CoherenceEntry<Point>();
+        entry.flight = flight;
+    }
+    return entry;
+}
 
-    int count;
+template<typename Handover>
+void MultiAirspace::traverse_flight(Flight &flight, Handover handover) {
+    // reused between flights processed on the same thread, so no per-flight allocation
+    thread_local FlightScratch scratch;
+
+    vector<int> &window = scratch.window;
+    vector<int> &active = scratch.active; // airspaces containing the last vertex inside any airspace, ascending
+    vector<int> &next = scratch.next;
+    vector<CoherenceEntry<point_xy>> &cache = scratch.cache;
+    vector<CoherenceEntry<planar_point>> &planar_cache = scratch.planar_cache;
+    vector<planar_point> &projected = scratch.projected;
+
+    // entries left by earlier flights are told apart by their flight number rather than cleared
+    unsigned long number = ++scratch.flight;
+
+    active.clear();
+    if (projection) {
+        // Candidates are still found from the longitude/latitude bounds, and
+        // only the containment tests are planar. Each vertex is projected
+        // once, however many airspaces it is tested against.
+        if (planar_cache.size() < size()) {
+            planar_cache.resize(size());
+        }
+        projected.resize(flight.vertices);
+        for (int i = 0; i < flight.vertices; i++) {
+            projected[i] = projection->forward(point_xy(flight.x(i), flight.y(i)));
+        }
+    } else if (cache.size() < size()) {
+        cache.resize(size());
+    }
 
     for (int i = 0; i < flight.vertices; i++) {
-        count = 0;
-        BOOST_FOREACH(int const &j, do_check) {
-            if (airspaces[j].inside(flight.vertices_x[i], flight.vertices_y[i], flight.vertices_height[i])) {
-                count++;
-                spaces2->at(j) = true;
-                if (!spaces1->at(j)) {
-                    for (int k = 0; k < N; k++) {
-                        if (spaces1->at(k)) {
-                            out[k][j] += 1;
-                        }
+        if (i % CANDIDATE_WINDOW == 0) {
+            window_candidates(flight, i, min(i + CANDIDATE_WINDOW, flight.vertices), window);
+        }
+        next.clear();
+        for (int const &j : window) {
+            bool inside;
+            if (projection) {
+                inside = inside_candidate(j, projected[i], flight.height(i), coherence_entry(planar_cache, j, number));
+            } else {
+                point_xy point = point_xy(flight.x(i), flight.y(i));
+                inside = inside_candidate(j, point, flight.height(i), coherence_entry(cache, j, number));
+            }
+            if (inside) {
+                next.push_back(j);
+                if (!binary_search(active.begin(), active.end(), j)) {
+                    for (int const &k : active) {
+                        handover(k, j);
                     }
                 }
             }
         }
-        if (count > 0) {
-            fill(spaces1->begin(), spaces1->end(), false);
-            swap(spaces1, spaces2);
-        }
-        else {
+        if (!next.empty()) {
+            sort(next.begin(), next.end());
+            swap(active, next);
         }
     }
 }
 
-vector<pair<int, int>> MultiAirspace::process_single_flight(Flight &flight) {
-    int N = size();
+void MultiAirspace::process_flight(Flight &flight, HandoverCounts &out) {
+    traverse_flight(flight, [&out](int from, int to) {
+        out.add(from, to);
+    });
+}
 
+vector<pair<int, int>> MultiAirspace::process_single_flight(Flight &flight) {
     vector<pair<int, int>> out;
 
-    vector<int> do_check = query_box(flight.bbox);
+    traverse_flight(flight, [&out](int from, int to) {
+        out.push_back(make_pair(from, to));
+    });
 
-    vector<bool> *spaces1 = new vector<bool>(N);
-    vector<bool> *spaces2 = new vector<bool>(N);
-    fill(spaces1->begin(), spaces1->end(), false);
-    fill(spaces2->begin(), spaces2->end(), false);
+    return out;
+}
 
-    int count;
+void MultiAirspace::window_candidates(Flight &flight, int start, int end, vector<int> &window) {
+    float x_lower = flight.x(start), x_upper = x_lower;
+    float y_lower = flight.y(start), y_upper = y_lower;
+    int height_lower = flight.height(start), height_upper = height_lower;
+    for (int i = start + 1; i < end; i++) {
+        x_lower = min(x_lower, flight.x(i));
+        x_upper = max(x_upper, flight.x(i));
+        y_lower = min(y_lower, flight.y(i));
+        y_upper = max(y_upper, flight.y(i));
+        height_lower = min(height_lower, flight.height(i));
+        height_upper = max(height_upper, flight.height(i));
+    }
 
-    for (int i = 0; i < flight.vertices; i++) {
-        count = 0;
-        BOOST_FOREACH(int const &j, do_check) {
-            if (airspaces[j].inside(flight.vertices_x[i], flight.vertices_y[i], flight.vertices_height[i])) {
-                count++;
-                spaces2->at(j) = true;
-                if (!spaces1->at(j)) {
-                    for (int k = 0; k < N; k++) {
-                        if (spaces1->at(k)) {
-                            out.push_back(make_pair(k, j));
-                        }
-                    }
-                }
-            }
+    // only the airspaces near these vertices, however far the rest of the flight goes
+    window.clear();
+    box query = box(point_xy(x_lower, y_lower), point_xy(x_upper, y_upper));
+    for (auto it = bgi::qbegin(rtree, bgi::intersects(query)); it != bgi::qend(rtree); ++it) {
+        AirspaceBoost &airspace = airspaces[it->second];
+        if (airspace.lower_limit <= height_upper && airspace.upper_limit >= height_lower) {
+            window.push_back(it->second);
         }
-        if (count > 0) {
-            fill(spaces1->begin(), spaces1->end(), false);
-            swap(spaces1, spaces2);
+    }
+
+    // in identifier order, so handovers are reported in the same order however the tree is laid out
+    sort(window.begin(), window.end());
+}
+
+void MultiAirspace::set_temporal_coherence(bool enabled) {
+    temporal_coherence = enabled;
+}
+
+void MultiAirspace::set_projection(shared_ptr<const Projection> proj, int num_threads) {
+    projection = proj;
+
+    parallel_for(airspaces.size(), num_threads, [&](int i, int t) {
+        if (projection) {
+            airspaces[i].project(*projection);
+        } else {
+            airspaces[i].unproject();
         }
-        else {
+        if (polygon_grid) {
+            airspaces[i].build_grid();
         }
+    });
+}
+
+shared_ptr<const Projection> MultiAirspace::get_projection() {
+    return projection;
+}
+
+static double moved_distance(const point_xy &a, const point_xy &b) {
+    return bg::distance(a, b, bg::strategy::distance::haversine<double>(EARTH_RADIUS_M));
+}
+
+static double moved_distance(const planar_point &a, const planar_point &b) {
+    return bg::distance(a, b);
+}
+
+template<typename Point>
+bool MultiAirspace::inside_candidate(int id, Point &point, int height, CoherenceEntry<Point> &entry) {
+    // the grid already answers most points in constant time
+    if (!temporal_coherence || airspaces[id].has_grid()) {
+        return airspaces[id].inside_bbox(point, height) && airspaces[id].inside_polygon(point);
     }
 
-    return out;
+    if (!airspaces[id].inside_bbox(point, height)) {
+        return false;
+    }
+
+    // The point cannot have crossed the boundary if it is closer to the last
+    // tested point than that point was to the boundary, so the previous
+    // answer still holds. The margins absorb the difference between the
+    // spherical distances used here and the geodesic within test.
+    if (entry.valid) {
+        double moved = moved_distance(entry.anchor, point);
+        if (moved * (1 + COHERENCE_MARGIN_RELATIVE) + COHERENCE_MARGIN_ABSOLUTE < entry.radius) {
+            return entry.inside;
+        }
+    }
+
+    entry.anchor = point;
+    entry.inside = airspaces[id].inside_polygon(point);
+    entry.radius = airspaces[id].boundary_distance(point);
+    entry.valid = true;
+
+    return entry.inside;
 }
 
 float MultiAirspace::distance_to_airspace(float x, float y, int height, int id) {
     point_xy point = point_xy(x, y);
 
+    if (projection) {
+        planar_point projected = projection->forward(point);
+        return airspaces[id].distance(projected, height);
+    }
+
     float distance = airspaces[id].distance(point, height);
 
     return distance;
+}
+
+void MultiAirspace::distances_to_airspaces(float x, float y, int height, const int *ids, int count, float *out) {
+    point_xy point = point_xy(x, y);
+    planar_point projected = projection ? projection->forward(point) : planar_point(0, 0);
+    int N = size();
+
+    for (int i = 0; i < count; i++) {
+        if (ids[i] < 0 || ids[i] >= N) {
+            out[i] = numeric_limits<float>::quiet_NaN();
+        } else if (projection) {
+            out[i] = airspaces[ids[i]].distance(projected, height);
+        } else {
+            out[i] = airspaces[ids[i]].distance(point, height);
+        }
+    }
 }
\ No newline at end of file
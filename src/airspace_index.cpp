@@ -0,0 +1,195 @@
+#include "airspace_index.h"
+
+template<class T>
+static void write_values(ofstream &file, const vector<T> &values) {
+    file.write(reinterpret_cast<const char *>(values.data()), values.size() * sizeof(T));
+}
+
+void MultiAirspace::save_index(string location) {
+    vector<int32_t> lower_limits, upper_limits;
+    vector<double> bounds;
+    vector<uint64_t> polygon_offsets(1, 0), ring_offsets(1, 0), point_offsets(1, 0);
+    vector<double> xs, ys;
+
+    auto add_ring = [&](const polygon_ring &ring) {
+        for (auto const &point : ring) {
+            xs.push_back(point.x());
+            ys.push_back(point.y());
+        }
+        point_offsets.push_back(xs.size());
+    };
+
+    for (auto const &airspace : airspaces) {
+        lower_limits.push_back(airspace.lower_limit);
+        upper_limits.push_back(airspace.upper_limit);
+        bounds.push_back(bg::get<bg::min_corner, 0>(airspace.bounds));
+        bounds.push_back(bg::get<bg::min_corner, 1>(airspace.bounds));
+        bounds.push_back(bg::get<bg::max_corner, 0>(airspace.bounds));
+        bounds.push_back(bg::get<bg::max_corner, 1>(airspace.bounds));
+
+        for (auto const &poly : airspace.polygon) {
+            add_ring(poly.outer());
+            for (auto const &inner : poly.inners()) {
+                add_ring(inner);
+            }
+            ring_offsets.push_back(point_offsets.size() - 1);
+        }
+        polygon_offsets.push_back(ring_offsets.size() - 1);
+    }
+
+    AirspaceIndexHeader header;
+    memcpy(header.magic, AIRSPACE_INDEX_MAGIC, 4);
+    header.version = AIRSPACE_INDEX_VERSION;
+    header.num_airspaces = airspaces.size();
+    header.num_polygons = ring_offsets.size() - 1;
+    header.num_rings = point_offsets.size() - 1;
+    header.num_points = xs.size();
+
+    ofstream file(location, ios::binary | ios::trunc);
+    if (!file) {
+        throw runtime_error("Could not open " + location + " for writing.");
+    }
+
+    file.write(reinterpret_cast<const char *>(&header), sizeof(AirspaceIndexHeader));
+    write_values(file, lower_limits);
+    write_values(file, upper_limits);
+    write_values(file, bounds);
+    write_values(file, polygon_offsets);
+    write_values(file, ring_offsets);
+    write_values(file, point_offsets);
+    write_values(file, xs);
+    write_values(file, ys);
+
+    if (!file) {
+        throw runtime_error("Could not write airspace index " + location + ".");
+    }
+}
+
+// Check that a table of n+1 offsets starts at 0, ends at total and never decreases,
+// so that every range it describes lies within the table that follows.
+static bool valid_offsets(const uint64_t *offsets, uint64_t n, uint64_t total) {
+    if (offsets[0] != 0 || offsets[n] != total) {
+        return false;
+    }
+    for (uint64_t i = 0; i < n; i++) {
+        if (offsets[i] > offsets[i+1]) {
+            return false;
+        }
+    }
+    return true;
+}
+
+int MultiAirspace::load_index(string location) {
+    bip::file_mapping file;
+    bip::mapped_region region;
+    try {
+        file = bip::file_mapping(location.c_str(), bip::read_only);
+        region = bip::mapped_region(file, bip::read_only);
+    } catch (bip::interprocess_exception &e) {
+        throw runtime_error("Could not open airspace index " + location + ": " + e.what());
+    }
+
+    const char *data = static_cast<const char *>(region.get_address());
+    long unsigned int length = region.get_size();
+
+    if (length < sizeof(AirspaceIndexHeader)) {
+        throw runtime_error("Airspace index " + location + " is truncated.");
+    }
+
+    AirspaceIndexHeader header;
+    memcpy(&header, data, sizeof(AirspaceIndexHeader));
+    if (memcmp(header.magic, AIRSPACE_INDEX_MAGIC, 4) != 0) {
+        throw runtime_error("File " + location + " is not an airspace index.");
+    }
+    if (header.version != AIRSPACE_INDEX_VERSION) {
+        throw runtime_error("Airspace index " + location + " has unsupported version " + to_string(header.version) + ".");
+    }
+
+    uint64_t A = header.num_airspaces, G = header.num_polygons, R = header.num_rings, P = header.num_points;
+
+    // counts from a corrupt header could overflow the expected size
+    long unsigned int words = length / sizeof(uint64_t);
+    if (A >= words || G >= words || R >= words || P >= words / 2) {
+        throw runtime_error("Airspace index " + location + " has the wrong size for its header.");
+    }
+
+    long unsigned int expected = sizeof(AirspaceIndexHeader)
+        + 2 * A * sizeof(int32_t)
+        + 4 * A * sizeof(double)
+        + (A + 1 + G + 1 + R + 1) * sizeof(uint64_t)
+        + 2 * P * sizeof(double);
+    if (length != expected) {
+        throw runtime_error("Airspace index " + location + " has the wrong size for its header.");
+    }
+
+    const int32_t *lower_limits = reinterpret_cast<const int32_t *>(data + sizeof(AirspaceIndexHeader));
+    const int32_t *upper_limits = lower_limits + A;
+    const double *bounds = reinterpret_cast<const double *>(upper_limits + A);
+    const uint64_t *polygon_offsets = reinterpret_cast<const uint64_t *>(bounds + 4 * A);
+    const uint64_t *ring_offsets = polygon_offsets + A + 1;
+    const uint64_t *point_offsets = ring_offsets + G + 1;
+    const double *xs = reinterpret_cast<const double *>(point_offsets + R + 1);
+    const double *ys = xs + P;
+
+    if (!valid_offsets(polygon_offsets, A, G)) {
+        throw runtime_error("Airspace index " + location + " has invalid polygon offsets.");
+    }
+    if (!valid_offsets(ring_offsets, G, R)) {
+        throw runtime_error("Airspace index " + location + " has invalid ring offsets.");
+    }
+    if (!valid_offsets(point_offsets, R, P)) {
+        throw runtime_error("Airspace index " + location + " has invalid point offsets.");
+    }
+
+    vector<AirspaceBoost> loaded;
+    loaded.reserve(A);
+
+    for (uint64_t a = 0; a < A; a++) {
+        multi_polygon shape;
+        for (uint64_t g = polygon_offsets[a]; g < polygon_offsets[a+1]; g++) {
+            polygon poly;
+            for (uint64_t r = ring_offsets[g]; r < ring_offsets[g+1]; r++) {
+                polygon_ring ring;
+                ring.reserve(point_offsets[r+1] - point_offsets[r]);
+                for (uint64_t k = point_offsets[r]; k < point_offsets[r+1]; k++) {
+                    ring.push_back(point_xy(xs[k], ys[k]));
+                }
+                if (r == ring_offsets[g]) {
+                    poly.outer() = move(ring);
+                } else {
+                    poly.inners().push_back(move(ring));
+                }
+            }
+            shape.push_back(move(poly));
+        }
+
+        box b(point_xy(bounds[4*a], bounds[4*a+1]), point_xy(bounds[4*a+2], bounds[4*a+3]));
+        loaded.push_back(AirspaceBoost(move(shape), lower_limits[a], upper_limits[a], b));
+    }
+
+    airspaces.clear();
+    add_airspaces(loaded);
+
+    return A;
+}
+
+void MultiAirspace::pack_rtree() {
+    vector<value> values;
+    values.reserve(airspaces.size());
+    for (int id = 0; id < airspaces.size(); id++) {
+        values.push_back(make_pair(airspaces[id].bounds, id));
+    }
+
+    // the packing constructor sorts the values into a balanced tree in one pass,
+    // which is much faster than inserting them one at a time and gives better queries
+    rtree = bgi::rtree<value, bgi::rstar<16>>(values.begin(), values.end());
+}
+
+bool is_airspace_index(string location) {
+    ifstream file(location, ios::binary);
+    char magic[4];
+    if (!file.read(magic, 4)) {
+        return false;
+    }
+    return memcmp(magic, AIRSPACE_INDEX_MAGIC, 4) == 0;
+}
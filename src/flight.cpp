@@ -1,35 +1,75 @@
 #include "flight.h"
 
+FlightColumn::FlightColumn() : data(nullptr), stride(0), is_double(false) {
+}
+
+FlightColumn::FlightColumn(const float *data, ptrdiff_t stride)
+    : data(reinterpret_cast<const char*>(data)), stride(stride), is_double(false) {
+}
+
+FlightColumn::FlightColumn(const double *data, ptrdiff_t stride)
+    : data(reinterpret_cast<const char*>(data)), stride(stride), is_double(true) {
+}
+
+FlightColumn FlightColumn::from(long i) const {
+    FlightColumn column = *this;
+    column.data += i * stride;
+    return column;
+}
+
 Flight::Flight(int vs, vector<float> xs, vector<float> ys, vector<int> hs, bool ft) {
     assert(xs.size() == vs && ys.size() == vs && hs.size() == vs);
 
     vertices = vs;
-    vertices_x = xs;
-    vertices_y = ys;
+    owned_x = make_shared<const vector<float>>(move(xs));
+    owned_y = make_shared<const vector<float>>(move(ys));
+    column_x = FlightColumn(owned_x->data());
+    column_y = FlightColumn(owned_y->data());
 
     if (!ft) {
-        vector<int> hs2;
-        for (int i = 0; i < hs.size(); i++) {
-            hs2.push_back(metre_to_ft(hs[i]));
+        vertices_height.resize(vs);
+        for (int i = 0; i < vs; i++) {
+            vertices_height[i] = metre_to_ft(hs[i]);
         }
-        vertices_height = hs2;
     } else {
-        vertices_height = hs;
+        vertices_height = move(hs);
     }
 
+    compute_bounds();
+}
+
+Flight::Flight(int vs, FlightColumn xs, FlightColumn ys, FlightColumn hs, bool round) {
+    vertices = vs;
+    column_x = xs;
+    column_y = ys;
+
+    vertices_height.resize(vs);
+    for (int i = 0; i < vs; i++) {
+        if (round) {
+            vertices_height[i] = metres_to_height_ft(hs[i]);
+        } else {
+            // binary flight dumps hold heights as float32
+            vertices_height[i] = metre_to_ft((int) (float) hs[i]);
+        }
+    }
+
+    compute_bounds();
+}
+
+void Flight::compute_bounds() {
     x_lower = COORD_LIMIT;
     y_lower = COORD_LIMIT;
     x_upper = -COORD_LIMIT;
     y_upper = -COORD_LIMIT;
     height_lower = HEIGHT_LIMIT;
     height_upper = -HEIGHT_LIMIT;
-    for (int i = 0; i < vs; i++) {
-        x_lower = min(x_lower, vertices_x[i]);
-        y_lower = min(y_lower, vertices_y[i]);
+    for (int i = 0; i < vertices; i++) {
+        x_lower = min(x_lower, x(i));
+        y_lower = min(y_lower, y(i));
         height_lower = min(height_lower, vertices_height[i]);
-        x_upper = max(x_upper, vertices_x[i]);
-        y_upper = max(y_upper, vertices_y[i]);
+        x_upper = max(x_upper, x(i));
+        y_upper = max(y_upper, y(i));
         height_upper = max(height_upper, vertices_height[i]);
     }
     bbox = box(point_xy(x_lower, y_lower), point_xy(x_upper, y_upper));
-}
\ No newline at end of file
+}
@@ -0,0 +1,94 @@
+#include "flight_dump.h"
+
+struct FlightDumpHeader {
+    char magic[4];
+    uint32_t version;
+    uint64_t num_flights;
+    uint64_t num_points;
+};
+
+FlightDump::FlightDump(string location) {
+    try {
+        file = bip::file_mapping(location.c_str(), bip::read_only);
+        region = bip::mapped_region(file, bip::read_only);
+    } catch (bip::interprocess_exception &e) {
+        throw runtime_error("Could not open flight dump " + location + ": " + e.what());
+    }
+
+    const char *data = static_cast<const char *>(region.get_address());
+    long unsigned int length = region.get_size();
+
+    if (length < sizeof(FlightDumpHeader)) {
+        throw runtime_error("Flight dump " + location + " is truncated.");
+    }
+
+    FlightDumpHeader header;
+    memcpy(&header, data, sizeof(FlightDumpHeader));
+    if (memcmp(header.magic, FLIGHT_DUMP_MAGIC, 4) != 0) {
+        throw runtime_error("File " + location + " is not a flight dump.");
+    }
+    if (header.version != FLIGHT_DUMP_VERSION) {
+        throw runtime_error("Flight dump " + location + " has unsupported version " + to_string(header.version) + ".");
+    }
+
+    num_flights = header.num_flights;
+    num_points = header.num_points;
+
+    // counts from a corrupt header could overflow the expected size
+    long unsigned int body = length - sizeof(FlightDumpHeader);
+    if (num_flights >= body / sizeof(uint64_t) || num_points > body / (3 * sizeof(float))) {
+        throw runtime_error("Flight dump " + location + " has the wrong size for its header.");
+    }
+
+    long unsigned int expected = sizeof(FlightDumpHeader)
+        + (num_flights + 1) * sizeof(uint64_t)
+        + 3 * num_points * sizeof(float);
+    if (length != expected) {
+        throw runtime_error("Flight dump " + location + " has the wrong size for its header.");
+    }
+
+    // every flight must lie within the points, so that no flight is read past the end of the file
+    offsets = reinterpret_cast<const uint64_t *>(data + sizeof(FlightDumpHeader));
+    if (offsets[0] != 0 || offsets[num_flights] != num_points) {
+        throw runtime_error("Flight dump " + location + " has invalid offsets.");
+    }
+    for (uint64_t i = 0; i < num_flights; i++) {
+        if (offsets[i] > offsets[i+1]) {
+            throw runtime_error("Flight dump " + location + " has invalid offsets.");
+        }
+    }
+
+    xs = reinterpret_cast<const float *>(offsets + num_flights + 1);
+    ys = xs + num_points;
+    hs = ys + num_points;
+}
+
+long unsigned int FlightDump::size() {
+    return num_flights;
+}
+
+bool FlightDump::valid(int i) {
+    for (uint64_t k = offsets[i]; k < offsets[i+1]; k++) {
+        if (std::isnan(hs[k])) {
+            return false;
+        }
+    }
+    return true;
+}
+
+Flight FlightDump::flight(int i) {
+    uint64_t start = offsets[i];
+    uint64_t end = offsets[i+1];
+
+    // read in place from the mapped file
+    return Flight(end - start, FlightColumn(xs + start), FlightColumn(ys + start), FlightColumn(hs + start), false);
+}
+
+bool is_flight_dump(string location) {
+    ifstream file(location, ios::binary);
+    char magic[4];
+    if (!file.read(magic, 4)) {
+        return false;
+    }
+    return memcmp(magic, FLIGHT_DUMP_MAGIC, 4) == 0;
+}
@@ -1,7 +1,14 @@
 __version__ = '1.0.0'
 
 from .process_flights import AirspaceHandler
-from .utils import config, DataConfig
+from .utils import DataConfig
 
 import logging
-logging.getLogger(__name__).addHandler(logging.NullHandler())
\ No newline at end of file
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+def __getattr__(name):
+    # the config is only parsed on first access
+    if name == "config":
+        from .utils import get_config
+        return get_config()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
\ No newline at end of file
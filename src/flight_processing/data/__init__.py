@@ -1,3 +1,6 @@
 from .airspace_graph import AirspaceGraph
 from .flight_downloader import FlightDownloader
-from .graph_builder import GraphBuilder
\ No newline at end of file
+from .graph_builder import GraphBuilder
+from .handover_store import HandoverStore
+from .flight_sources import OpenSkySource, TrafficDirectorySource
+from .graph_manifest import GraphManifest
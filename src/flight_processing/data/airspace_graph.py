@@ -1,8 +1,10 @@
 from ..process_flights import AirspaceHandler
 from ..utils import DataConfig, check_file, execute_bulk, execute_bulk_between, lerp
 from ..scalebar import scale_bar
-from .data_utils import graph_add_node, graph_increment_edge, build_graph_from_sparse_matrix, build_graph_from_matrix, get_zone_centre, save_graph_to_file, process_dataframe
-from .. import config
+from .data_utils import graph_add_node, graph_increment_edge, build_graph_from_sparse_matrix, build_graph_from_matrix, get_zone_centre, save_graph_to_file, process_dataframe, sparse_lookup, load_npz_files, add_airspaces, project_airspaces
+from .handover_store import HandoverStore
+from .graph_manifest import airspace_dataset_hash
+from .flight_downloader import flight_to_arrays, flights_to_arrays
 
 from pathlib import Path
 from scipy import sparse
@@ -15,15 +17,7 @@ import geopandas
 import pyproj
 from shapely.geometry import Point
 from shapely.ops import transform
-import holoviews as hv
 import networkx as nx
-import hvplot.networkx as hvnx
-from traffic.data import opensky
-from traffic.core.flight import Flight
-from traffic.core.traffic import Traffic
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.io.img_tiles as cimgt
 import logging
 
 logger = logging.getLogger(__name__)
@@ -49,24 +43,30 @@ class AirspaceGraph:
           `confidence <#flight_processing.data.AirspaceGraph.confidence>`_,
           `test_point <#flight_processing.data.AirspaceGraph.test_point>`_,
           `test_handover <#flight_processing.data.AirspaceGraph.test_handover>`_,
-          `test_flight <#flight_processing.data.AirspaceGraph.test_flight>`_
+          `test_flight <#flight_processing.data.AirspaceGraph.test_flight>`_,
+          `test_traffic <#flight_processing.data.AirspaceGraph.test_traffic>`_
         - visualisation:
           `visualise_graph <#flight_processing.data.AirspaceGraph.visualise_graph>`_,
           `draw_graph_map <#flight_processing.data.AirspaceGraph.draw_graph_map>`_
         - miscellaneous:
           `get_airspace <#flight_processing.data.AirspaceGraph.get_airspace>`_,
+          `airspace_id <#flight_processing.data.AirspaceGraph.airspace_id>`_,
           `airspace_distance <#flight_processing.data.AirspaceGraph.airspace_distance>`_,
+          `airspace_distances <#flight_processing.data.AirspaceGraph.airspace_distances>`_,
           `edge_weight <#flight_processing.data.AirspaceGraph.edge_weight>`_,
           `zone_centre <#flight_processing.data.AirspaceGraph.zone_centre>`_,
           `average_edge_weight <#flight_processing.data.AirspaceGraph.average_edge_weight>`_,
           `process_single_flight <#flight_processing.data.AirspaceGraph.process_single_flight>`_
     """
 
-    def __init__(self, dataset, df=None, dataset_location=None):
+    def __init__(self, dataset, df=None, dataset_location=None, use_index=True, planar=False):
         """
         Initialise the graph builder with a given dataset, either from a file or directly from a dataframe.
 
         By default the dataframe will be loaded from a file as specified in the config.
+        Unless `use_index` is disabled, the parsed airspaces are saved to `DataConfig.data_airspace_index` for the dataset's hash
+        the first time they are loaded, and read back from there by later instances.
+        In planar mode flights are tested against airspaces projected with the dataset's `DataConfig.projection`, see `GraphBuilder`.
 
         A loaded dataframe must have the following columns:
 
@@ -83,6 +83,10 @@ class AirspaceGraph:
         :type df: pandas.core.frame.DataFrame or geopandas.geodataframe.GeoDataFrame, optional
         :param dataset_location: location of saved dataframe
         :type dataset_location: pathlib.Path or str, optional
+        :param use_index: reuse a saved index of the airspaces, default True
+        :type use_index: bool, optional
+        :param planar: test flights in planar mode, default False
+        :type planar: bool, optional
 
         :return: object
         :rtype: AirspaceGraph
@@ -111,13 +115,33 @@ class AirspaceGraph:
 
         logger.info("Initialising AirspaceHandler C++ object.")
         self.__airspaces = AirspaceHandler()
-        self.__gdf['ident'] = self.__gdf.apply(self.__add_airspace, axis=1)
+        index_location = self.__data_config.data_airspace_index(airspace_dataset_hash(self.__gdf)) if use_index else None
+        self.__gdf['ident'] = add_airspaces(self.__airspaces, self.__gdf, index_location)
         self.__gdf.set_index('ident', inplace=True)
 
+        if planar:
+            if self.__data_config.projection is None:
+                raise ValueError("Dataset {} has no projection for planar mode.".format(self.dataset))
+            project_airspaces(self.__airspaces, self.__data_config.projection)
+
         self.num_airspaces = self.__airspaces.size()
         logger.info("Successfully loaded airspaces, {} in total.".format(self.num_airspaces))
 
+        # graph nodes are airspace names, which need not be unique, so keep a code for each identifier's name
+        self.__names = self.__gdf['name'].reindex(np.arange(self.num_airspaces)).to_numpy()
+        self.__name_codes, self.__name_uniques = pd.factorize(self.__names)
+
+        # first identifier with each name, matching a scan of the dataframe in order
+        self.__name_index = dict()
+        for i, name in enumerate(self.__names):
+            self.__name_index.setdefault(name, i)
+        self.__centres = None
+
         self.__graph = None
+        self.__matrix = None
+        self.__weights = None
+        self.__weights_adjusted = None
+        self.__total_weight = None
 
         self.__distance_zero = 5000
         self.__distance_one = 3000
@@ -150,7 +174,7 @@ class AirspaceGraph:
 
         return self.__graph
 
-    def load_graphs(self, time_start, time_end):
+    def load_graphs(self, time_start, time_end, max_workers=None, use_store=True):
         """
         Load the graph of handovers from a series of NPZ files within a given time range.
 
@@ -159,30 +183,55 @@ class AirspaceGraph:
         - `dataset` is the name of the dataset as specified on construction,
         - `date` and `time` are determined by the timestamp.
 
+        If the dataset has a `HandoverStore` it is used instead of the individual files,
+        and the range is summed from its rollups rather than hour by hour.
+
+        Hours with no saved file are skipped with a warning and returned.
+
         :param time_start: start time
         :type time_start: datetime.datetime or str
         :param time_end: end time
         :type time_end: datetime.datetime or str
+        :param max_workers: maximum number of threads used to read files
+        :type max_workers: int, optional
+        :param use_store: use the dataset's `HandoverStore` if it exists, default True
+        :type use_store: bool, optional
+
+        :return: files (or, when using the store, hours) which could not be found
+        :rtype: list(pathlib.Path) or list(datetime.datetime)
         """
 
-        logger.info("Loading matrix of handovers.")
-        matrix = self.__load_npz_bulk(time_start, time_end)
+        if use_store and HandoverStore.exists(self.__data_config.data_graph_store()):
+            logger.info("Loading matrix of handovers from store, from {} to {}.".format(time_start, time_end))
+            matrix, missing = HandoverStore.for_dataset(self.__data_config, self.num_airspaces).range_sum(time_start, time_end)
+            if len(missing) > 0:
+                logger.warning("{} hours are not in the handover store: {}".format(len(missing), ", ".join(str(t) for t in missing)))
+            self.__add_matrix(matrix)
+            return missing
 
-        logger.info("Building graph from matrix.")
-        if self.__graph is None:
-            self.__graph = build_graph_from_sparse_matrix(self.__gdf, matrix)
-        else:
-            self.__graph = build_graph_from_sparse_matrix(self.__gdf, matrix, self.__graph)
+        t_start = parser.parse(str(time_start))
+        t_end = parser.parse(str(time_end))
+        t_delta = timedelta(hours=1)
+        count = math.floor((t_end - t_start) / t_delta)
 
-        logger.info("Computing adjusted weights.")
-        self.__graph_relative_weights()
+        logger.info("Loading {} saved NPZ files, from {} to {}.".format(count, t_start, t_end))
+        files = [self.__data_config.data_graph_npz(t_start + (i * t_delta)) for i in range(count)]
 
-    def load_graph_files(self, files):
+        return self.__load_npz_files(files, max_workers)
+
+    def load_graph_files(self, files, max_workers=None):
         """
         Load the graph of handovers from a given list of NPZ file locations.
 
+        Files which do not exist are skipped with a warning and returned.
+
         :param files: file or files to load
         :type files: list(pathlib.Path) or list(str) or pathlib.Path or str
+        :param max_workers: maximum number of threads used to read files
+        :type max_workers: int, optional
+
+        :return: files which could not be found
+        :rtype: list(pathlib.Path) or list(str)
         """
 
         if isinstance(files, str) or isinstance(files, Path):
@@ -192,9 +241,24 @@ class AirspaceGraph:
         else:
             raise ValueError("Argument 'files' must be list(pathlib.Path) or list(str) or pathlib.Path or str.")
 
+        return self.__load_npz_files(to_load, max_workers)
+
+    def __load_npz_files(self, files, max_workers):
         logger.info("Loading matrix of handovers.")
-        matrix = self.__load_npz_files(to_load)
+        matrix, missing = load_npz_files(files, max_workers)
+
+        if len(missing) > 0:
+            logger.warning("{} of {} graph files could not be found: {}".format(len(missing), len(files), ", ".join(str(f) for f in missing)))
+
+        if matrix is None:
+            logger.warning("No graph files loaded, graph left unchanged.")
+            return missing
 
+        self.__add_matrix(matrix)
+
+        return missing
+
+    def __add_matrix(self, matrix):
         logger.info("Building graph from matrix.")
         if self.__graph is None:
             self.__graph = build_graph_from_sparse_matrix(self.__gdf, matrix)
@@ -202,74 +266,49 @@ class AirspaceGraph:
             self.__graph = build_graph_from_sparse_matrix(self.__gdf, matrix, self.__graph)
 
         logger.info("Computing adjusted weights.")
+        self.__matrix = matrix if self.__matrix is None else self.__matrix + matrix
         self.__graph_relative_weights()
 
-    def __load_npz_files(self, files):
-        matrix = None
-
-        for f in files:
-            matrix_new = sparse.load_npz(f)
-            if matrix is None:
-                matrix = matrix_new
-            else:
-                matrix += matrix_new
-
-        return matrix
-
-    def __load_npz(self, time):
-        file_load = self.__data_config.data_graph_npz(time)
-
-        logger.info("Loading saved graph from location {}.".format(file_load))
-        return sparse.load_npz(file_load)
-
-    def __load_npz_bulk(self, time_start, time_end):
-        t_start = parser.parse(str(time_start))
-        t_end = parser.parse(str(time_end))
-        t_delta = timedelta(hours=1)
-        count = math.floor((t_end - t_start) / t_delta)
-
-        logger.info("Loading {} saved NPZ files, from {} to {}.".format(count, t_start, t_end))
+    def get_airspace(self, airspace):
+        """
+        Returns the row corresponding to the given airspace name or identifier.
 
-        matrix = None
+        :param airspace: airspace name or identifier
+        :type airspace: str or int
 
-        for i in range(count):
-            t = t_start + (i * t_delta)
-            matrix_new = self.__load_npz(t)
-            if matrix is None:
-                matrix = matrix_new
-            else:
-                matrix += matrix_new
+        :return: airspace data
+        :rtype: pandas.core.series.Series
+        """
 
-        return matrix
+        a = self.airspace_id(airspace)
+        if a is None:
+            if isinstance(airspace, int):
+                raise KeyError(airspace)
+            return None
 
-    def __add_airspace(self, row):
-        logger.debug("Adding airspace {} to AirspaceHandler C++ object.".format(row['name']))
-        return self.__airspaces.add_airspace(row.wkt, row.lower_limit, row.upper_limit)
+        return self.__gdf.loc[a]
 
-    def get_airspace(self, airspace):
+    def airspace_id(self, airspace):
         """
-        Returns the row corresponding to the given airspace name or identifier.
+        Returns the identifier of the given airspace name or identifier, or None if there is no such airspace.
+
+        If several airspaces share a name, the first is returned.
 
         :param airspace: airspace name or identifier
         :type airspace: str or int
 
-        :return: airspace data
-        :rtype: pandas.core.series.Series
+        :return: airspace identifier
+        :rtype: int
         """
 
         if isinstance(airspace, str):
-            gdf_temp = self.__gdf[self.__gdf['name'] == airspace]
-            if len(gdf_temp) == 0:
-                return None
-            return gdf_temp.iloc[0]
-        elif isinstance(airspace, int):
-            return self.__gdf.loc[airspace]
-        else:
-            try:
-                a = int(airspace)
-                return self.__gdf.loc[a]
-            except:
-                return None
+            return self.__name_index.get(airspace)
+
+        try:
+            a = int(airspace)
+        except:
+            return None
+        return a if a in self.__gdf.index else None
 
     def airspace_distance(self, long, lat, height, airspace):
         """
@@ -293,6 +332,44 @@ class AirspaceGraph:
         logger.debug("Getting airspace distance using C++ AirspaceHandler object.")
         return self.__airspaces.distance_to_airspace(long, lat, height, int(a.name))
 
+    def airspace_distances(self, longs, lats, heights, airspaces, outer=False, num_threads=0):
+        """
+        Returns the distances from many points to many airspaces in feet.
+
+        By default the distances are computed pairwise, so point `i` is measured against airspace `i` and the result has one entry per point.
+        If `outer` is set, every point is measured against every airspace and the result is a matrix with one row per point.
+        Unknown airspaces give a distance of NaN.
+
+        :param longs: longitudes of points
+        :type longs: numpy.ndarray
+        :param lats: latitudes of points
+        :type lats: numpy.ndarray
+        :param heights: heights in ft
+        :type heights: numpy.ndarray
+        :param airspaces: airspace names or identifiers
+        :type airspaces: list(str or int)
+        :param outer: compute the distance between every point and every airspace, defaults to False
+        :type outer: bool, optional
+        :param num_threads: number of threads to use, defaults to 0 (all cores)
+        :type num_threads: int, optional
+
+        :return: distances to airspaces in feet
+        :rtype: numpy.ndarray
+        """
+
+        ids = [self.airspace_id(airspace) for airspace in airspaces]
+        ids = [-1 if a is None else a for a in ids]
+
+        logger.debug("Getting airspace distances using C++ AirspaceHandler object.")
+        return self.__airspaces.distances_to_airspaces(
+            np.asarray(longs, dtype=np.float64).reshape(-1),
+            np.asarray(lats, dtype=np.float64).reshape(-1),
+            np.asarray(heights, dtype=np.float64).reshape(-1),
+            np.array(ids, dtype=np.int32),
+            outer,
+            num_threads
+        )
+
     def edge_weight(self, airspace1, airspace2):
         """
         Get the weight of the edge between the given airspaces on the graph.
@@ -326,15 +403,43 @@ class AirspaceGraph:
         :rtype: shapely.geometry.point.Point
         """
 
-        return get_zone_centre(self.__gdf, self.get_airspace(name)['name'])
+        a = self.airspace_id(name)
+        if a is None:
+            return None
+
+        return Point(self.__get_centres()[0][a])
+
+    def __get_centres(self):
+        # centroid of every airspace in WGS84 and Mercator, indexed by identifier
+        if self.__centres is None:
+            logger.info("Computing the centre of each airspace.")
+            geometries = self.__gdf.geometry.reindex(np.arange(self.num_airspaces))
+            centres = np.zeros((self.num_airspaces, 2))
+            for i, geometry in enumerate(geometries):
+                if geometry is not None:
+                    centres[i] = geometry.centroid.coords[0]
+
+            xs, ys = wgs84_to_mercator_transformer.transform(centres[:, 0], centres[:, 1])
+            self.__centres = (centres, np.column_stack((xs, ys)))
+
+        return self.__centres
+
+    def __mercator_positions(self):
+        # as mercator_positions, but using the cached centres
+        centres_mercator = self.__get_centres()[1]
+        return {name: tuple(centres_mercator[self.__name_index[name]]) for name in nx.nodes(self.__graph)}
 
     def visualise_graph(self):
         """
         Visualise the graph interactively using HoloViews.
         """
 
+        # holoviews is slow to import, so is only loaded when the graph is visualised
+        import holoviews as hv
+        import hvplot.networkx as hvnx
+
         logger.info("Drawing graph using holoviews.")
-        return hvnx.draw(self.__graph, mercator_positions(self.__gdf, self.__graph), edge_width=hv.dim('weight')*0.003, node_size=30, arrowhead_length=0.0001)
+        return hvnx.draw(self.__graph, self.__mercator_positions(), edge_width=hv.dim('weight')*0.003, node_size=30, arrowhead_length=0.0001)
 
     def draw_graph_map(self, flight=None, subset=None, logscale=False, file_out=None):
         """
@@ -353,6 +458,13 @@ class AirspaceGraph:
         :type file_out: pathlib.Path or str, optional
         """
 
+        # the plotting libraries are slow to import, so are only loaded when a map is drawn
+        from traffic.core.flight import Flight
+        from traffic.core.traffic import Traffic
+        import matplotlib.pyplot as plt
+        import cartopy.crs as ccrs
+        import cartopy.io.img_tiles as cimgt
+
         fig = plt.figure(dpi=300, figsize=(7,7))
 
         logger.info("Downloading terrain data from Stamen.")
@@ -372,7 +484,7 @@ class AirspaceGraph:
             weights = tuple(map(lambda x: math.log(x), weights_original))
         else:
             weights = weights_original
-        positions_transformed = mercator_positions(self.__gdf, self.__graph)
+        positions_transformed = self.__mercator_positions()
         cmap = plt.cm.Purples
 
         logger.info("Plotting graph on map.")
@@ -454,20 +566,31 @@ class AirspaceGraph:
 
             return weight_total / count
 
-    def __airspace_total_weight(self, name):
-        total = 0
-        for k, v in self.__graph[name].items():
-            if k != name:
-                total += v['weight']
-        return total
-
     def __graph_relative_weights(self):
-        self.__gdf['total_weight'] = self.__gdf['name'].apply(lambda x: self.__airspace_total_weight(x))
+        # Collapse the handovers onto airspace names (the nodes of the graph), take the
+        # out-strength of each name excluding its self-loop, then row-normalise.
+        n = len(self.__name_uniques)
+        matrix = self.__matrix.tocoo()
+        weights = sparse.csr_matrix((matrix.data, (self.__name_codes[matrix.row], self.__name_codes[matrix.col])), shape=(n, n))
+        weights.sum_duplicates()
+        weights.eliminate_zeros()
+
+        total_weight = np.asarray(weights.sum(axis=1)).reshape(-1) - weights.diagonal()
+        rows = np.repeat(np.arange(n), np.diff(weights.indptr))
+        totals = total_weight[rows]
+        weights_adjusted = sparse.csr_matrix(
+            (np.divide(weights.data, totals, out=np.zeros(len(totals)), where=totals != 0), weights.indices, weights.indptr),
+            shape=(n, n)
+        )
+
+        self.__weights = weights
+        self.__weights_adjusted = weights_adjusted
+        self.__total_weight = total_weight[self.__name_codes]
+        self.__gdf['total_weight'] = pd.Series(self.__total_weight, index=np.arange(self.num_airspaces))
 
-        for name in self.__graph.nodes:
-            total_weight = self.__gdf[self.__gdf['name'] == name].iloc[0].total_weight
-            for k, v in self.__graph[name].items():
-                v['weight_adjusted'] = v['weight'] / total_weight if total_weight != 0 else 0
+        names = self.__name_uniques
+        cols = weights_adjusted.indices
+        nx.set_edge_attributes(self.__graph, {(names[i], names[j]): v for i, j, v in zip(rows, cols, weights_adjusted.data)}, 'weight_adjusted')
 
     def set_confidence_values(self,
                               distance_zero=None,
@@ -617,18 +740,16 @@ class AirspaceGraph:
         """
 
         logger.info("Converting flight to arrays of coordinates.")
-        xs = np.array([c[0] for c in list(flight.coords)])
-        ys = np.array([c[1] for c in list(flight.coords)])
-        hs = np.array([c[2] for c in list(flight.coords)])
+        xs, ys, hs = flight_to_arrays(flight)
 
         logger.info("Processing flight using AirspaceHandler C++ object.")
         return self.__airspaces.process_single_flight(xs, ys, hs)
 
-    def test_point(self, long, lat, height):
+    def test_point(self, long, lat, height, k=5, max_distance=None):
         """
         Test a point, returning a list of potential handovers which could occur at that point and their confidence.
 
-        For each airspace which contains the given point we return a number of airspaces near that point,
+        For each airspace which contains the given point we return the `k` airspaces nearest to that point,
         along with the confidence value of that (potential) handover.
         This takes the form of a list of dictionaries.
 
@@ -638,6 +759,10 @@ class AirspaceGraph:
         :type lat: float
         :param height: height in ft
         :type height: float
+        :param k: number of nearby airspaces to consider, default 5
+        :type k: int, optional
+        :param max_distance: only consider airspaces within this distance in ft, which also makes the search cheaper
+        :type max_distance: float, optional
 
         :return: information about handovers
         :rtype: list(dict)
@@ -648,7 +773,10 @@ class AirspaceGraph:
         logger.info("Getting airspaces at the given point using AirspaceHandler C++ object.")
         ids_at_point = self.__airspaces.airspaces_at_point(long, lat, height, ft)
         logger.info("Getting airspaces near to the given point using AirspaceHandler C++ object.")
-        near_point = self.__airspaces.airspaces_near_point(long, lat, height, ft)
+        if max_distance is None:
+            near_point = self.__airspaces.airspaces_near_point(long, lat, height, ft, k)
+        else:
+            near_point = self.__airspaces.airspaces_near_point(long, lat, height, ft, k, max_distance)
 
         out = []
 
@@ -700,8 +828,14 @@ class AirspaceGraph:
         edge = self.__graph[a1['name']].get(a2['name'])
 
         logger.debug("Getting airspace distances using C++ AirspaceHandler object.")
-        distance1 = self.__airspaces.distance_to_airspace(long, lat, height, int(a1.name))
-        distance2 = self.__airspaces.distance_to_airspace(long, lat, height, int(a2.name))
+        distance1, distance2 = self.__airspaces.distances_to_airspaces(
+            np.array([long], dtype=np.float64),
+            np.array([lat], dtype=np.float64),
+            np.array([height], dtype=np.float64),
+            np.array([int(a1.name), int(a2.name)], dtype=np.int32),
+            True,
+            1
+        )[0]
 
         logger.debug("Computing handover confidence.")
         confidence = self.confidence(edge, distance1, distance2)
@@ -719,6 +853,8 @@ class AirspaceGraph:
         :rtype: list(dict)
         """
 
+        from traffic.core.flight import Flight
+
         if not isinstance(flight, Flight):
             raise ValueError("Argument must be of type Flight!")
 
@@ -745,10 +881,72 @@ class AirspaceGraph:
 
         return out
 
+    def test_traffic(self, traffic, num_threads=None):
+        """
+        Test every flight in a collection, returning each of the handovers that could have occurred and information about their confidence.
+
+        This gives the same values as calling
+        `test_flight <#flight_processing.data.AirspaceGraph.test_flight>`_
+        on each flight, but the handovers for all flights are found in a single call to the C++ object
+        and the confidence values are computed on whole columns at once.
+        The result has one row per handover, tagged with the identifier of its flight
+        (or the position of the flight in the collection if it has no ``flight_id``).
+
+        :param traffic: flights to test
+        :type traffic: traffic.core.traffic.Traffic
+        :param num_threads: number of threads used to find handovers, defaults to all available cores
+        :type num_threads: int, optional
+
+        :return: information about handovers
+        :rtype: pandas.core.frame.DataFrame
+        """
+
+        from traffic.core.traffic import Traffic
+
+        if not isinstance(traffic, Traffic):
+            raise ValueError("Argument must be of type Traffic!")
+
+        logger.info("Converting flights to columns of coordinates.")
+        xs, ys, hs, offsets, flight_ids = flights_to_arrays(traffic)
+
+        logger.info("Getting all handovers along {} flights using AirspaceHandler C++ object.".format(len(flight_ids)))
+        handover_offsets, airspace1, airspace2 = self.__airspaces.process_flights_batch(xs, ys, hs, offsets, num_threads if num_threads is not None else 0)
+
+        logger.info("Computing confidence values for {} handovers.".format(len(airspace1)))
+        code1 = self.__name_codes[airspace1]
+        code2 = self.__name_codes[airspace2]
+        if self.__weights is not None:
+            weight = sparse_lookup(self.__weights, code1, code2)
+            weight_adjusted = sparse_lookup(self.__weights_adjusted, code1, code2)
+        else:
+            weight = np.zeros(len(airspace1), dtype=int)
+            weight_adjusted = np.zeros(len(airspace1))
+
+        confidence_weight = (weight >= self.__minimum_weight).astype(int) * self.__confidence_weight
+        confidence_weight_adjusted = (weight_adjusted >= self.__minimum_weight_adjusted).astype(int) * self.__confidence_weight_adjusted
+        confidence_distance = np.zeros(len(airspace1))
+
+        return pd.DataFrame(dict(
+            flight_id = np.repeat(np.asarray(flight_ids, dtype=object), np.diff(handover_offsets)),
+            airspace1 = airspace1,
+            airspace2 = airspace2,
+            name1 = self.__names[airspace1],
+            name2 = self.__names[airspace2],
+            distance1 = np.full(len(airspace1), np.nan),
+            distance2 = np.full(len(airspace1), np.nan),
+            confidence = confidence_distance + confidence_weight + confidence_weight_adjusted,
+            weight = weight,
+            weight_adjusted = weight_adjusted,
+            confidence_distance = confidence_distance,
+            confidence_weight = confidence_weight,
+            confidence_weight_adjusted = confidence_weight_adjusted
+        ))
+
 
 wgs84 = pyproj.CRS('EPSG:4326')
 mercator = pyproj.CRS('EPSG:3857') # Note: if we change the map source this will need to change too!
-wgs84_to_mercator = pyproj.Transformer.from_crs(wgs84, mercator, always_xy=True).transform
+wgs84_to_mercator_transformer = pyproj.Transformer.from_crs(wgs84, mercator, always_xy=True)
+wgs84_to_mercator = wgs84_to_mercator_transformer.transform
 
 def point_to_mercator(point):
     """
@@ -778,7 +976,13 @@ def mercator_positions(gdf, graph):
 
     logger.debug("Getting the coordinates of the centre of each airspace in the Mercator projection.")
 
-    positions_transformed = dict()
-    for name in list(nx.nodes(graph)):
-        positions_transformed[name] = list(point_to_mercator(get_zone_centre(gdf, name)).coords)[0]
-    return positions_transformed
+    first = gdf.drop_duplicates('name').set_index('name')
+    names = [name for name in nx.nodes(graph) if name in first.index]
+
+    centres = np.zeros((len(names), 2))
+    for i, geometry in enumerate(first.geometry.reindex(names)):
+        if geometry is not None:
+            centres[i] = geometry.centroid.coords[0]
+
+    xs, ys = wgs84_to_mercator_transformer.transform(centres[:, 0], centres[:, 1])
+    return dict(zip(names, zip(xs, ys)))
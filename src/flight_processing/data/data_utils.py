@@ -2,10 +2,15 @@ from ..utils import check_file
 
 import networkx as nx
 from scipy import sparse
+import numpy as np
 import pandas as pd
 import geopandas
 import shapely.wkt
 from shapely.geometry import Point
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import os
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -42,6 +47,45 @@ def graph_increment_edge(graph, u, v, amount=1):
     else:
         graph.add_edge(u, v, weight=amount)
 
+def graph_add_weighted_edges(graph, us, vs, amounts):
+    """
+    Increment many edges at once, adding edges where necessary.
+
+    Repeated pairs of nodes are summed first, so each edge in the graph is only touched once.
+
+    :param graph: graph to which the edges should be added
+    :type graph: networkx.classes.digraph.DiGraph
+    :param us: names of first nodes
+    :type us: numpy.ndarray
+    :param vs: names of second nodes
+    :type vs: numpy.ndarray
+    :param amounts: amounts by which to increment the edges
+    :type amounts: numpy.ndarray
+    """
+
+    if len(amounts) == 0:
+        return
+
+    summed = pd.DataFrame(dict(u=us, v=vs, amount=amounts)).groupby(['u', 'v'], sort=False, dropna=False)['amount'].sum()
+
+    edges = []
+    for (u, v), amount in summed.items():
+        edge = graph.get_edge_data(u, v)
+        edges.append((u, v, amount + edge['weight'] if edge is not None else amount))
+
+    graph.add_weighted_edges_from(edges)
+
+def _node_names(gdf, n):
+    # name of every airspace identifier 0..n-1, so that indices can be mapped to names with one array lookup
+    return gdf.loc[np.arange(n), 'name'].to_numpy()
+
+def _new_graph(names):
+    logger.info("Generating new graph from dataframe.")
+
+    graph = nx.DiGraph()
+    graph.add_nodes_from(names)
+    return graph
+
 def build_graph_from_sparse_matrix(gdf, matrix, graph=None):
     """
     Given a sparse matrix, construct a NetworkX graph.
@@ -63,24 +107,13 @@ def build_graph_from_sparse_matrix(gdf, matrix, graph=None):
     n, m = matrix.shape
     assert(n == m)
 
-    if graph is None:
-        logger.info("Generating new graph from dataframe.")
+    names = _node_names(gdf, n)
 
-        graph = nx.DiGraph()
-        for i in range(n):
-            name = gdf.loc[i]['name']
-            graph_add_node(graph, name)
+    if graph is None:
+        graph = _new_graph(names)
 
     I, J, V = sparse.find(matrix)
-    N = I.size
-
-    for k in range(N):
-        i = I[k]
-        j = J[k]
-        v = V[k]
-        name_i = gdf.loc[i]['name']
-        name_j = gdf.loc[j]['name']
-        graph_increment_edge(graph, name_i, name_j, v)
+    graph_add_weighted_edges(graph, names[I], names[J], V)
 
     return graph
 
@@ -105,31 +138,93 @@ def build_graph_from_matrix(gdf, matrix, graph=None):
     n, m = matrix.shape
     assert(n == m)
 
-    if graph is None:
-        logger.info("Generating new graph from dataframe.")
+    names = _node_names(gdf, n)
 
-        graph = nx.DiGraph()
-        for i in range(n):
-            name = gdf.loc[i]['name']
-            graph_add_node(graph, name)
+    if graph is None:
+        graph = _new_graph(names)
 
-    for i in range(n):
-        for j in range(n):
-            if matrix[i][j] > 0:
-                name_i = gdf.loc[i]['name']
-                name_j = gdf.loc[j]['name']
-                graph_increment_edge(graph, name_i, name_j, matrix[i][j])
+    I, J = np.nonzero(matrix > 0)
+    graph_add_weighted_edges(graph, names[I], names[J], matrix[I, J])
 
     return graph
 
+def sparse_lookup(matrix, rows, cols):
+    """
+    Look up many entries of a sparse matrix at once, returning zero for entries which are not stored.
+
+    :param matrix: matrix with sorted indices
+    :type matrix: scipy.sparse.csr.csr_matrix
+    :param rows: row of each entry
+    :type rows: numpy.ndarray
+    :param cols: column of each entry
+    :type cols: numpy.ndarray
+
+    :return: value of each entry
+    :rtype: numpy.ndarray
+    """
+
+    n, m = matrix.shape
+    keys = np.repeat(np.arange(n, dtype=np.int64), np.diff(matrix.indptr)) * m + matrix.indices
+    query = np.asarray(rows, dtype=np.int64) * m + np.asarray(cols, dtype=np.int64)
+
+    position = np.searchsorted(keys, query)
+    found = position < len(keys)
+    found[found] = keys[position[found]] == query[found]
+
+    out = np.zeros(len(query), dtype=matrix.dtype)
+    out[found] = matrix.data[position[found]]
+    return out
+
+def load_npz_files(files, max_workers=None):
+    """
+    Load a number of sparse matrices from NPZ files and sum them.
+
+    Files are read on a pool of threads, and the matrices are summed with a single concatenation of their entries
+    rather than one addition per file.
+    Files which do not exist are skipped and returned so that the caller can report them.
+
+    :param files: files to load
+    :type files: list(pathlib.Path) or list(str)
+    :param max_workers: maximum number of threads used to read files, defaults to the ThreadPoolExecutor default
+    :type max_workers: int, optional
+
+    :return: summed matrix (None if no files could be loaded) and list of missing files
+    :rtype: tuple(scipy.sparse.csr.csr_matrix, list)
+    """
+
+    def load(f):
+        try:
+            return sparse.load_npz(f).tocoo()
+        except FileNotFoundError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        matrices = list(executor.map(load, files))
+
+    missing = [f for f, matrix in zip(files, matrices) if matrix is None]
+    matrices = [matrix for matrix in matrices if matrix is not None]
+
+    if len(matrices) == 0:
+        return None, missing
+
+    shape = matrices[0].shape
+    if any(matrix.shape != shape for matrix in matrices):
+        raise ValueError("All matrices must have the same shape.")
+
+    rows = np.concatenate([matrix.row for matrix in matrices])
+    cols = np.concatenate([matrix.col for matrix in matrices])
+    data = np.concatenate([matrix.data for matrix in matrices])
+
+    return sparse.coo_matrix((data, (rows, cols)), shape=shape).tocsr(), missing
+
 def save_graph_to_file(gdf, matrix, graph_json=None, graph_yaml=None, graph_npz=None):
     """
-    Given a graph represented as a 2D numpy array, save it to the specified files in the correct formats.
+    Given a graph represented as a 2D numpy array or sparse matrix, save it to the specified files in the correct formats.
 
     :param gdf: dataframe for the graph's airspace
     :type gdf: geopandas.geodataframe.GeoDataFrame
     :param matrix: matrix representing the graph
-    :type matrix: numpy.ndarray
+    :type matrix: numpy.ndarray or scipy.sparse.csr.csr_matrix
     :param graph_json: location of JSON output
     :type graph_json: pathlib.Path or str, optional
     :param graph_yaml: location of YAML output
@@ -138,25 +233,106 @@ def save_graph_to_file(gdf, matrix, graph_json=None, graph_yaml=None, graph_npz=
     :type graph_npz: pathlib.Path or str, optional
     """
 
+    is_sparse = sparse.issparse(matrix)
+
     if graph_json is not None:
         check_file(graph_json)
         logger.info("Saving graph as JSON to {}.".format(graph_json))
+        matrix_dense = matrix.toarray() if is_sparse else matrix
         with open(graph_json, "w") as outfile:
-            outfile.write(json.dumps(dict(graph=matrix.tolist()), indent=0))
+            outfile.write(json.dumps(dict(graph=matrix_dense.tolist()), indent=0))
 
     if graph_yaml is not None:
         check_file(graph_yaml)
         logger.info("Saving graph as YAML to {}.".format(graph_yaml))
-        graph = build_graph_from_matrix(gdf, matrix) # TODO this can be done better
+        if is_sparse:
+            graph = build_graph_from_sparse_matrix(gdf, matrix)
+        else:
+            graph = build_graph_from_matrix(gdf, matrix) # TODO this can be done better
         nx.write_yaml(graph, str(graph_yaml))
 
     if graph_npz is not None:
         check_file(graph_npz)
-        logger.info("Converting graph to sparse matrix.")
-        matrix_sparse = sparse.csr_matrix(matrix)
+        if is_sparse:
+            matrix_sparse = matrix.tocsr()
+        else:
+            logger.info("Converting graph to sparse matrix.")
+            matrix_sparse = sparse.csr_matrix(matrix)
         logger.info("Saving graph as NPZ to {}.".format(graph_npz))
         sparse.save_npz(str(graph_npz), matrix_sparse)
 
+def add_airspaces(handler, gdf, index_location=None):
+    """
+    Add every airspace in a dataframe to an AirspaceHandler C++ object, in order, returning the identifier of each.
+
+    The geometries are passed to the C++ object in one call as well-known binary,
+    which it parses on several threads before bulk-loading its R-tree.
+    If a saved index of the same airspaces exists at `index_location` it is loaded instead,
+    which skips parsing the geometries altogether.
+    Otherwise an index is saved there for next time.
+
+    :param handler: empty C++ object to add the airspaces to
+    :type handler: AirspaceHandler
+    :param gdf: dataframe of airspaces, with `lower_limit` and `upper_limit` columns
+    :type gdf: geopandas.geodataframe.GeoDataFrame
+    :param index_location: location of the saved index, which must only ever hold these airspaces
+    :type index_location: pathlib.Path or str, optional
+
+    :return: identifier of each airspace
+    :rtype: numpy.ndarray
+    """
+
+    if index_location is not None and Path(index_location).exists():
+        logger.info("Loading airspace index from {}.".format(index_location))
+        try:
+            count = handler.load_index(str(index_location))
+        except RuntimeError as e:
+            logger.warning("Could not load airspace index, rebuilding it: {}".format(e))
+            count = None
+
+        if count == len(gdf):
+            return np.arange(count)
+        if count is not None:
+            raise ValueError("Airspace index at {} holds {} airspaces, not {}.".format(index_location, count, len(gdf)))
+
+    logger.info("Adding {} airspaces to AirspaceHandler C++ object.".format(len(gdf)))
+    first = handler.size()
+    wkbs = [geometry.wkb if geometry is not None else None for geometry in gdf.geometry]
+    lower = np.asarray(gdf['lower_limit'], dtype=np.int32)
+    upper = np.asarray(gdf['upper_limit'], dtype=np.int32)
+    if handler.add_airspaces(wkbs, lower, upper) != len(gdf):
+        raise ValueError("Could not add airspaces to AirspaceHandler C++ object.")
+    idents = np.arange(first, first + len(gdf), dtype=np.int64)
+
+    if index_location is not None:
+        logger.info("Saving airspace index to {}.".format(index_location))
+        path_tmp = Path(index_location).with_suffix(".tmp")
+        try:
+            path_tmp.parent.mkdir(parents=True, exist_ok=True)
+            handler.save_index(str(path_tmp))
+            os.replace(path_tmp, index_location)
+        except (RuntimeError, OSError) as e:
+            logger.warning("Could not save airspace index: {}".format(e))
+
+    return idents
+
+def project_airspaces(handler, projection):
+    """
+    Switch an AirspaceHandler C++ object to planar mode, in which its airspaces are projected once with the given projection
+    and each flight is projected as it is processed, so that every test uses Cartesian rather than geodesic arithmetic.
+
+    This is much faster, but introduces the projection's distortion - see `GraphBuilder.projection_report`.
+
+    :param handler: C++ object holding the airspaces, before any processing
+    :type handler: AirspaceHandler
+    :param projection: local projection as a PROJ.4 string giving coordinates in metres
+    :type projection: str
+    """
+
+    logger.info("Projecting airspaces with {}.".format(projection))
+    if handler.set_projection(projection) != handler.size():
+        raise ValueError("Could not project airspaces with {}.".format(projection))
+
 def get_zone_centre(gdf, name):
     """
     Get the centre of the given airspace.
@@ -196,7 +372,14 @@ def process_dataframe(df):
     :rtype: geopandas.geodataframe.GeoDataFrame
     """
 
-    if isinstance(df, pd.DataFrame):
+    # checked first, as every GeoDataFrame is also a DataFrame
+    if isinstance(df, geopandas.GeoDataFrame):
+        df2 = df.copy()
+        required_columns = {'name', 'lower_limit', 'upper_limit'}
+        if not required_columns <= set(df2.columns):
+            raise ValueError("GeoDataFrame must contain columns 'name', 'lower_limit', 'upper_limit'.")
+        gdf = df2
+    elif isinstance(df, pd.DataFrame):
         df2 = df.copy()
         required_columns = {'name', 'wkt', 'lower_limit', 'upper_limit'}
         if not required_columns <= set(df2.columns):
@@ -205,15 +388,6 @@ def process_dataframe(df):
             logger.info("Converting WKT representation of geometry to geometry objects.")
             df2['geometry'] = df2.wkt.apply(shapely.wkt.loads)
         gdf = geopandas.GeoDataFrame(df2, geometry=df2.geometry)
-    elif isinstance(df, geopandas.GeoDataFrame):
-        df2 = df.copy()
-        required_columns = {'name', 'lower_limit', 'upper_limit'}
-        if not required_columns <= set(df2.columns):
-            raise ValueError("GeoDataFrame must contain columns 'name', 'lower_limit', 'upper_limit'.")
-        if not 'wkt' in list(df2.columns):
-            logger.info("Converting geometry objects to their WKT representations.")
-            df2['wkt'] = df2.geometry.apply(lambda g: g.wkt)
-        gdf = df2
     else:
         raise ValueError("df must be a DataFrame or GeoDataFrame!")
 
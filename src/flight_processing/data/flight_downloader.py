@@ -3,9 +3,10 @@ from ..utils import DataConfig, check_file, execute_bulk, execute_bulk_between
 from datetime import timedelta
 from dateutil import parser
 
-from traffic.data import opensky
 import simplejson
+import numpy as np
 
+import struct
 import sys
 import logging
 
@@ -13,6 +14,9 @@ logger = logging.getLogger(__name__)
 
 timestring_traffic = "%Y-%m-%d %H:%M"
 
+binary_magic = b"FPFD"
+binary_version = 1
+
 def flights_to_json(flights):
     """
     Convert flights to JSON for exporting.
@@ -36,6 +40,106 @@ def flights_to_json(flights):
 
     return simplejson.dumps(dict(flights=flight_coords), indent=0, ignore_nan=True)
 
+def flight_to_arrays(flight):
+    """
+    Convert a single flight to columns of coordinates.
+
+    Positions without a longitude are dropped, and unknown altitudes are NaN.
+    Columns which are already stored as ``float32`` or ``float64`` are taken from the flight's data without copying where possible,
+    and `AirspaceHandler` reads them in place.
+
+    :param flight: flight to convert
+    :type flight: traffic.core.flight.Flight
+
+    :return: longitudes, latitudes and altitudes
+    :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+
+    data = flight.data
+    known = data["longitude"].notna().to_numpy()
+    if not known.all():
+        data = data[known]
+
+    xs = float_column(data["longitude"])
+    ys = float_column(data["latitude"])
+    hs = float_column(data["altitude"]) if "altitude" in data.columns else np.zeros(len(data))
+    return xs, ys, hs
+
+def float_column(column):
+    """
+    Get a column of a dataframe as a floating point array, converting it to ``float64`` only if it has another type.
+
+    :param column: column to convert
+    :type column: pandas.core.series.Series
+
+    :rtype: numpy.ndarray
+    """
+
+    if column.dtype == np.float32 or column.dtype == np.float64:
+        return column.to_numpy()
+    return column.astype(float).to_numpy(dtype=np.float64)
+
+def flights_to_arrays(flights):
+    """
+    Convert flights to flat arrays of coordinates, with offsets marking where each flight starts and ends.
+
+    Positions without a longitude are dropped, and unknown altitudes are NaN.
+    Flight `k` occupies entries `offsets[k]` to `offsets[k+1]` of the coordinate arrays.
+
+    :param flights: flights to convert
+    :type flights: traffic.core.traffic.Traffic
+
+    :return: longitudes, latitudes, altitudes, offsets and the identifier of each flight (its position in the collection if it has no ``flight_id``)
+    :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray, list)
+    """
+
+    columns = ([], [], [])
+    offsets = [0]
+    flight_ids = []
+
+    if flights is not None:
+        for i, flight in enumerate(flights):
+            flight_ids.append(flight.flight_id if flight.flight_id is not None else i)
+            for column, values in zip(columns, flight_to_arrays(flight)):
+                column.append(values)
+            offsets.append(offsets[-1] + len(values))
+
+    xs, ys, hs = (np.concatenate(column) if len(column) > 0 else np.zeros(0) for column in columns)
+
+    return xs, ys, hs, np.asarray(offsets, dtype=np.int64), flight_ids
+
+def flights_to_binary(flights):
+    """
+    Convert flights to the binary flight dump format for exporting.
+
+    The output consists of a header (magic ``FPFD``, format version, number of flights and number of points),
+    an array of ``uint64`` offsets marking where each flight starts and ends,
+    followed by contiguous ``float32`` columns of longitude, latitude and altitude.
+    All values are little-endian.
+    Unknown altitudes are stored as NaN.
+
+    :param flights: flights to save
+    :type flights: traffic.core.traffic.Traffic
+
+    :return: binary output
+    :rtype: bytes
+    """
+
+    logger.info("Converting flights to columns of coordinates.")
+    xs, ys, hs, offsets, _ = flights_to_arrays(flights)
+
+    num_flights = len(offsets) - 1
+    num_points = offsets[-1]
+
+    logger.info("Packing {} flights ({} points) into binary dump.".format(num_flights, num_points))
+
+    header = struct.pack("<4sIQQ", binary_magic, binary_version, num_flights, num_points)
+    body = [offsets.astype("<u8").tobytes()]
+    for column in (xs, ys, hs):
+        body.append(column.astype("<f4").tobytes())
+
+    return header + b"".join(body)
+
 class FlightDownloader:
     """
     Download flight data from the OpenSky impala shell using the traffic library.
@@ -50,6 +154,7 @@ class FlightDownloader:
         - downloading:
           `download_flights <#flight_processing.data.FlightDownloader.download_flights>`_,
           `save_traffic <#flight_processing.data.FlightDownloader.save_traffic>`_,
+          `save_traffic_binary <#flight_processing.data.FlightDownloader.save_traffic_binary>`_,
           `dump_flights <#flight_processing.data.FlightDownloader.dump_flights>`_,
           `dump_flights_bulk <#flight_processing.data.FlightDownloader.dump_flights_bulk>`_
     """
@@ -97,6 +202,9 @@ class FlightDownloader:
 
         logger.info("Downloading flights between {} and {} from OpenSky.".format(t_start, t_end))
 
+        # importing traffic's data sources reads its config and is slow, so only do so when downloading
+        from traffic.data import opensky
+
         flights = opensky.history(
             string_start,
             string_end,
@@ -130,7 +238,28 @@ class FlightDownloader:
         with open(location, "w") as outfile:
             outfile.write(out)
 
-    def dump_flights(self, time_start, time_end):
+    def save_traffic_binary(self, traffic, location):
+        """
+        Save the passed in flights to the specified location in the binary flight dump format.
+
+        Binary dumps are several times smaller than JSON dumps and are memory-mapped by the C++ core without any parsing.
+
+        :param traffic: flights to save
+        :type traffic: traffic.core.traffic.Traffic
+        :param location: location to save the flights to
+        :type location: pathlib.Path or str
+        """
+
+        out = flights_to_binary(traffic)
+
+        check_file(location)
+
+        logger.info("Saving binary flights to {}.".format(location))
+
+        with open(location, "wb") as outfile:
+            outfile.write(out)
+
+    def dump_flights(self, time_start, time_end, binary=False):
         """
         Download flights within the specified time interval, saving the flights to a file.
 
@@ -139,10 +268,14 @@ class FlightDownloader:
         - `dataset` is the name of the dataset as specified on construction,
         - `date` and `time` are determined by `time_start`.
 
+        If `binary` is set the flights are instead saved in the binary flight dump format to `{time}.bin` in the same directory.
+
         :param time_start: start time
         :type time_start: datetime.datetime or str
         :param time_end: end time
         :type time_end: datetime.datetime or str
+        :param binary: save flights in the binary format rather than JSON, default False
+        :type binary: bool, optional
         """
 
         t_start = parser.parse(str(time_start))
@@ -150,11 +283,14 @@ class FlightDownloader:
 
         flights = self.download_flights(t_start, t_end)
 
-        location = self.__data_config.data_flights(t_start)
-
-        self.save_traffic(flights, location)
+        if binary:
+            location = self.__data_config.data_flights_binary(t_start)
+            self.save_traffic_binary(flights, location)
+        else:
+            location = self.__data_config.data_flights(t_start)
+            self.save_traffic(flights, location)
 
-    def dump_flights_bulk(self, time_start, time_end):
+    def dump_flights_bulk(self, time_start, time_end, binary=False, executor=None, max_workers=None, retries=0):
         """
         Download flights within the specified time interval, saving the flights to a file.
 
@@ -164,6 +300,17 @@ class FlightDownloader:
         :type time_start: datetime.datetime or str
         :param time_end: end time
         :type time_end: datetime.datetime or str
+        :param binary: save flights in the binary format rather than JSON, default False
+        :type binary: bool, optional
+        :param executor: how to run each hour's download - ``"serial"``, ``"thread"``, ``"process"`` or a `concurrent.futures.Executor`, defaults to serially
+        :type executor: str or concurrent.futures.Executor, optional
+        :param max_workers: maximum number of threads or processes
+        :type max_workers: int, optional
+        :param retries: number of times to retry an hour which fails, default 0
+        :type retries: int, optional
+
+        :return: status of each hour, as returned by `flight_processing.utils.run_intervals`
+        :rtype: list(dict)
         """
 
         t_start = parser.parse(str(time_start))
@@ -171,4 +318,4 @@ class FlightDownloader:
 
         logger.info("Downloading flights in bulk between {} and {}.".format(t_start, t_end))
 
-        execute_bulk_between(lambda t1, t2: self.dump_flights(t1, t2), t_start, t_end)
+        return execute_bulk_between(lambda t1, t2: self.dump_flights(t1, t2, binary=binary), t_start, t_end, executor=executor, max_workers=max_workers, retries=retries)
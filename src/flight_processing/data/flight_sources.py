@@ -0,0 +1,86 @@
+from ..utils import timestring_date, timestring_time
+from .flight_downloader import FlightDownloader
+
+from dateutil import parser
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+class OpenSkySource:
+    """
+    Source of flights for `GraphBuilder.process_pipeline <#flight_processing.data.GraphBuilder.process_pipeline>`_
+    which downloads each interval from the OpenSky impala shell using `FlightDownloader`.
+
+    A source is any callable taking the start and end time of an interval and returning a `traffic.core.traffic.Traffic`
+    (or None if there were no flights), so other sources can be substituted freely.
+    """
+
+    def __init__(self, dataset, limit=None):
+        """
+        Initialise the source with a given dataset.
+
+        :param dataset: dataset name or specification
+        :type dataset: str or DataConfig
+        :param limit: maximum number of position values to download per interval
+        :type limit: int, optional
+
+        :return: object
+        :rtype: OpenSkySource
+        """
+
+        self.__downloader = FlightDownloader(dataset)
+        self.__limit = limit
+
+    def __call__(self, time_start, time_end):
+        return self.__downloader.download_flights(time_start, time_end, limit=self.__limit)
+
+class TrafficDirectorySource:
+    """
+    Source of flights for `GraphBuilder.process_pipeline <#flight_processing.data.GraphBuilder.process_pipeline>`_
+    which reads previously saved `traffic.core.traffic.Traffic` files from a directory, so that the pipeline can be run offline.
+
+    Files are found by formatting `pattern` with the `date` and `time` of the start of each interval,
+    in the same format used for flight dumps (e.g. `20200101` and `0000`).
+    Any format which `Traffic.from_file` understands can be used.
+    """
+
+    def __init__(self, directory, pattern="{date}/{time}.parquet"):
+        """
+        Initialise the source with a directory of saved flights.
+
+        :param directory: directory containing the files
+        :type directory: pathlib.Path or str
+        :param pattern: location of each file within the directory, default `{date}/{time}.parquet`
+        :type pattern: str, optional
+
+        :return: object
+        :rtype: TrafficDirectorySource
+        """
+
+        self.__directory = Path(directory)
+        self.__pattern = pattern
+
+    def location(self, time):
+        """
+        Get the location of the file for the interval starting at the given time.
+
+        :param time: start time
+        :type time: datetime.datetime or str
+
+        :return: location of file (may not exist)
+        :rtype: pathlib.Path
+        """
+
+        t = parser.parse(str(time))
+        return self.__directory / self.__pattern.format(date=t.strftime(timestring_date), time=t.strftime(timestring_time))
+
+    def __call__(self, time_start, time_end):
+        from traffic.core.traffic import Traffic
+
+        location = self.location(time_start)
+        if not location.exists():
+            raise FileNotFoundError("No saved flights at {}.".format(location))
+
+        logger.info("Loading saved flights from {}.".format(location))
+        return Traffic.from_file(location)
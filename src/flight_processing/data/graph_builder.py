@@ -1,7 +1,11 @@
-from ..utils import DataConfig, check_file, execute_bulk, execute_bulk_between
-from ..process_flights import AirspaceHandler
+from ..utils import DataConfig, check_file, execute_bulk, execute_bulk_between, run_intervals, attempt_interval
+from ..process_flights import AirspaceHandler, METRE_IN_FT
 from ..scalebar import scale_bar
-from .data_utils import graph_add_node, graph_increment_edge, build_graph_from_sparse_matrix, build_graph_from_matrix, get_zone_centre, save_graph_to_file, process_dataframe
+from .data_utils import graph_add_node, graph_increment_edge, build_graph_from_sparse_matrix, build_graph_from_matrix, get_zone_centre, save_graph_to_file, process_dataframe, add_airspaces, project_airspaces
+from .handover_store import HandoverStore
+from .graph_manifest import GraphManifest, airspace_dataset_hash
+from .flight_downloader import FlightDownloader, flight_to_arrays, flights_to_arrays
+from .flight_sources import OpenSkySource
 
 from datetime import datetime, timedelta
 from dateutil import parser
@@ -11,13 +15,10 @@ import numpy as np
 import geopandas
 from shapely.geometry import Point
 import shapely.wkt
-import tempfile, os
-from traffic.core.flight import Flight
-from traffic.core.traffic import Traffic
-import matplotlib.pyplot as plt
-import cartopy
-import cartopy.crs as ccrs
-import cartopy.io.img_tiles as cimgt
+import threading
+import queue
+import time
+import traceback
 import networkx as nx
 import logging
 
@@ -35,27 +36,45 @@ class GraphBuilder:
           `__init__ <#flight_processing.data.GraphBuilder.\_\_init\_\_>`_,
           `from_dataframe <#flight_processing.data.GraphBuilder.from_dataframe>`_
         - properties:
-          `gdf <#flight_processing.data.GraphBuilder.gdf>`_
+          `gdf <#flight_processing.data.GraphBuilder.gdf>`_,
+          `dataset_hash <#flight_processing.data.GraphBuilder.dataset_hash>`_
         - processing:
           `process_single_flight <#flight_processing.data.GraphBuilder.process_single_flight>`_,
           `process_flights <#flight_processing.data.GraphBuilder.process_flights>`_,
-          `process_flights_bulk <#flight_processing.data.GraphBuilder.process_flights_bulk>`_
+          `process_flights_bulk <#flight_processing.data.GraphBuilder.process_flights_bulk>`_,
+          `process_traffic <#flight_processing.data.GraphBuilder.process_traffic>`_,
+          `process_pipeline <#flight_processing.data.GraphBuilder.process_pipeline>`_
+        - accuracy:
+          `projection_report <#flight_processing.data.GraphBuilder.projection_report>`_
         - visualisation:
           `draw_map <#flight_processing.data.GraphBuilder.draw_map>`_
     """
 
-    def __add_airspace(self, row):
-        logger.debug("Adding airspace {} to AirspaceHandler C++ object.".format(row['name']))
-        return self.__airspaces.add_airspace(row.wkt, row.lower_limit, row.upper_limit)
-
-    def __init__(self, dataset, dataset_location=None):
+    def __init__(self, dataset, dataset_location=None, df=None, use_index=True, planar=False):
         """
-        Initialise the graph builder with a given dataset from file.
+        Initialise the graph builder with a given dataset, either from a file or directly from a dataframe.
+
+        By default the dataframe will be loaded from a file as specified in the config.
+        A dataframe which is passed in must be in the format described in
+        `from_dataframe <#flight_processing.data.GraphBuilder.from_dataframe>`_.
+
+        Unless `use_index` is disabled, the parsed airspaces are saved to `DataConfig.data_airspace_index` for the dataset's hash
+        the first time they are loaded, and read back from there by later instances.
+
+        In planar mode the airspaces and flights are projected with the dataset's `DataConfig.projection`,
+        and handovers are found with Cartesian rather than geodesic arithmetic, which is several times faster.
+        Use `projection_report <#flight_processing.data.GraphBuilder.projection_report>`_ to check that the projection is accurate enough.
 
         :param dataset: dataset name or specification
         :type dataset: str or DataConfig
         :param dataset_location: location of saved dataframe
         :type dataset_location: pathlib.Path or str, optional
+        :param df: dataframe of airspaces
+        :type df: pandas.core.frame.DataFrame or geopandas.geodataframe.GeoDataFrame, optional
+        :param use_index: reuse a saved index of the airspaces, default True
+        :type use_index: bool, optional
+        :param planar: process in planar mode, default False
+        :type planar: bool, optional
 
         :return: object
         :rtype: GraphBuilder
@@ -71,17 +90,32 @@ class GraphBuilder:
         else:
             raise ValueError("Argument 'dataset' must be of type DataConfig or str.")
 
-        if dataset_location is None:
-            dataset_location = self.__data_config.dataset_location
+        if df is not None:
+            logger.info("Loading airspace data from passed in dataframe.")
+            # numbered from 0 like a dataframe read from file, since airspaces are looked up by index
+            self.__gdf = process_dataframe(df).reset_index(drop=True)
+        else:
+            if dataset_location is None:
+                dataset_location = self.__data_config.dataset_location
 
-        logger.info("Loading airspace data from {}.".format(dataset_location))
-        self.__gdf = geopandas.read_file(dataset_location)
+            logger.info("Loading airspace data from {}.".format(dataset_location))
+            self.__gdf = geopandas.read_file(dataset_location)
 
         logger.info("Initialising AirspaceHandler C++ object.")
         self.__airspaces = AirspaceHandler()
 
+        self.__dataset_hash = airspace_dataset_hash(self.__gdf)
+        self.__index_location = self.__data_config.data_airspace_index(self.__dataset_hash) if use_index else None
+
         logger.info("Adding airspace data to AirspaceHandler C++ object.")
-        self.__gdf['ident'] = self.__gdf.apply(self.__add_airspace, axis=1)
+        self.__gdf['ident'] = add_airspaces(self.__airspaces, self.__gdf, self.__index_location)
+
+        if planar:
+            if self.__data_config.projection is None:
+                raise ValueError("Dataset {} has no projection for planar mode.".format(self.dataset))
+            project_airspaces(self.__airspaces, self.__data_config.projection)
+            # graphs built in planar mode are recorded in the manifest separately from geodesic ones
+            self.__dataset_hash = airspace_dataset_hash(self.__gdf, self.__data_config.projection)
 
     @classmethod
     def from_dataframe(cls, dataset, df):
@@ -105,21 +139,8 @@ class GraphBuilder:
         :rtype: GraphBuilder
         """
 
-        logger.info("Preprocessing dataframe.")
-        gdf = process_dataframe(df)
-
-        fd, path = tempfile.mkstemp(suffix='.json')
-
-        logger.info("Saving dataframe to temporary file at {}.".format(path))
-        gdf.to_file(path, driver="GeoJSON")
-
         logger.info("Instantiating GraphBuilder object.")
-        out = cls(dataset, dataset_location=path)
-
-        logger.info("Removing temporary file at {}.".format(path))
-        os.remove(path)
-
-        return out
+        return cls(dataset, df=df)
 
     @property
     def gdf(self):
@@ -132,6 +153,17 @@ class GraphBuilder:
 
         return self.__gdf
 
+    @property
+    def dataset_hash(self):
+        """
+        Returns the hash of the airspaces (and of the projection in planar mode), recorded in the dataset's `GraphManifest` for each hour processed.
+
+        :return: hexadecimal digest
+        :rtype: str
+        """
+
+        return self.__dataset_hash
+
     def process_single_flight(self, flight):
         """
         Process a single flight, returning an ordered list of airspace handovers.
@@ -144,18 +176,19 @@ class GraphBuilder:
         """
 
         logger.info("Converting flight to arrays of coordinates.")
-        xs = np.array([c[0] for c in list(flight.coords)])
-        ys = np.array([c[1] for c in list(flight.coords)])
-        hs = np.array([c[2] for c in list(flight.coords)])
+        xs, ys, hs = flight_to_arrays(flight)
 
         logger.info("Processing flight using AirspaceHandler C++ object.")
         return self.__airspaces.process_single_flight(xs, ys, hs)
 
-    def process_flights(self, time, npz=True, json=False, yaml=False):
+    def process_flights(self, time, npz=True, json=False, yaml=False, num_threads=None, store=False):
         """
         Process a file containing flights which have been saved to disk by FlightDownloader,
         saving the resulting graph to disk.
 
+        A binary flight dump is used in preference to a JSON one if both exist.
+        The hour is recorded in the dataset's `GraphManifest` once its outputs have been saved.
+
         Graphs will be saved to `{data_prefix}/graphs/{dataset}/{date}/{time}.json`, where:
         - `data_prefix` is specified by the `DataConfig` object passed in on construction, or the `data_location` config value is used by default,
         - `dataset` is the name of the dataset as specified on construction,
@@ -169,36 +202,112 @@ class GraphBuilder:
         :type json: bool, optional
         :param yaml: save output as YAML, default False
         :type yaml: bool, optional
+        :param num_threads: number of threads used to process the flights, defaults to all available cores
+        :type num_threads: int, optional
+        :param store: also append the graph to the dataset's `HandoverStore`, default False
+        :type store: bool, optional
+
+        :return: matrix of handovers
+        :rtype: scipy.sparse.csr.csr_matrix
         """
 
         t = parser.parse(str(time))
 
         logger.info("Processing downloaded flight data for time {}.".format(t))
 
-        data_flights = str(self.__data_config.data_flights(t))
+        data_flights = self.__flights_location(t)
+
+        # each call counts its own handovers with the GIL released, so several hours can be processed from different threads at once
+        logger.info("Calling AirspaceHandler C++ object to process file at {}.".format(data_flights))
+        matrix = self.__to_matrix(self.__airspaces.count_flights_file(str(data_flights), num_threads if num_threads is not None else 0))
+
+        outputs = self.__save_result(t, matrix, npz, json, yaml, store)
+
+        if len(outputs) > 0:
+            GraphManifest.for_dataset(self.__data_config).record(t, data_flights, self.__dataset_hash, outputs)
+
+        return matrix
+
+    def process_traffic(self, time, traffic, npz=True, json=False, yaml=False, num_threads=None, store=False):
+        """
+        Process flights held in memory, saving the resulting graph to disk as
+        `process_flights <#flight_processing.data.GraphBuilder.process_flights>`_ would.
+
+        The flights are passed straight to the C++ object without being written to a flight dump first.
+
+        :param time: time of flights to process, used to name the outputs
+        :type time: datetime.datetime or str
+        :param traffic: flights to process
+        :type traffic: traffic.core.traffic.Traffic
+        :param npz: save output as NPZ, default True
+        :type npz: bool, optional
+        :param json: save output as JSON, default False
+        :type json: bool, optional
+        :param yaml: save output as YAML, default False
+        :type yaml: bool, optional
+        :param num_threads: number of threads used to process the flights, defaults to all available cores
+        :type num_threads: int, optional
+        :param store: also append the graph to the dataset's `HandoverStore`, default False
+        :type store: bool, optional
+
+        :return: matrix of handovers
+        :rtype: scipy.sparse.csr.csr_matrix
+        """
+
+        t = parser.parse(str(time))
+
+        logger.info("Converting flights for time {} to columns of coordinates.".format(t))
+        xs, ys, hs, offsets, _ = flights_to_arrays(traffic)
+
+        logger.info("Calling AirspaceHandler C++ object to process {} flights.".format(len(offsets) - 1))
+        matrix = self.__to_matrix(self.__airspaces.count_flights_arrays(xs, ys, hs, offsets, num_threads if num_threads is not None else 0))
+
+        self.__save_result(t, matrix, npz, json, yaml, store)
+
+        return matrix
+
+    def __flights_location(self, t):
+        data_flights_binary = self.__data_config.data_flights_binary(t)
+        if data_flights_binary.exists():
+            return data_flights_binary
+        return self.__data_config.data_flights(t)
+
+    def __to_matrix(self, result):
+        rows, cols, counts = result
+        n = self.__airspaces.size()
+        return sparse.csr_matrix((counts, (rows, cols)), shape=(n, n))
 
+    def __save_result(self, t, matrix, npz, json, yaml, store):
         graph_npz = self.__data_config.data_graph_npz(t) if npz else None
         graph_json = self.__data_config.data_graph_json(t) if json else None
         graph_yaml = self.__data_config.data_graph_yaml(t) if yaml else None
 
-        logger.info("Calling AirspaceHandler C++ object to process file at {}.".format(data_flights))
-        self.__airspaces.reset_result()
-        self.__airspaces.process_flights_file(data_flights)
-
-        logger.info("Retrieving result.")
-        matrix = self.__airspaces.get_result()
-
         logger.info("Saving to file(s).")
         check_file(graph_npz)
         check_file(graph_json)
         check_file(graph_yaml)
         save_graph_to_file(self.__gdf, matrix, graph_json, graph_yaml, graph_npz)
 
-    def process_flights_bulk(self, time_start, time_end, npz=True, json=False, yaml=False):
+        if store:
+            logger.info("Appending to handover store.")
+            HandoverStore.for_dataset(self.__data_config, matrix.shape[0]).append(t, matrix)
+
+        outputs = dict(npz=graph_npz, json=graph_json, yaml=graph_yaml)
+        return {kind: path for kind, path in outputs.items() if path is not None}
+
+    def process_flights_bulk(self, time_start, time_end, npz=True, json=False, yaml=False, num_threads=None, store=False, executor=None, max_workers=None, retries=0, incremental=True):
         """
         Process multiple files containing flights which have been saved to disk by FlightDownloader,
         saving the resulting graphs to disk.
 
+        When `incremental` is set, hours whose outputs the dataset's `GraphManifest` shows to be current are skipped:
+        those produced from the same flight dump and airspaces, with every requested output still in place.
+        Each hour is recorded as soon as it is finished, so an interrupted run carries on where it stopped when repeated.
+        Skipped hours appear in the report as successful with 0 attempts and no result.
+
+        With the ``"thread"`` executor, hours are processed concurrently by the same C++ object, which releases the GIL while processing;
+        `num_threads` is then best set so that `max_workers` times `num_threads` does not exceed the number of cores.
+
         :param time_start: start time for processing
         :type time_start: datetime.datetime or str
         :param time_end: end time for processing
@@ -209,14 +318,260 @@ class GraphBuilder:
         :type json: bool, optional
         :param yaml: save output as YAML, default False
         :type yaml: bool, optional
+        :param num_threads: number of threads used to process each file, defaults to all available cores
+        :type num_threads: int, optional
+        :param store: also append the graphs to the dataset's `HandoverStore` and rebuild its rollups, default False
+        :type store: bool, optional
+        :param executor: how to run each hour's processing - ``"serial"``, ``"thread"``, ``"process"`` or a `concurrent.futures.Executor`, defaults to serially
+        :type executor: str or concurrent.futures.Executor, optional
+        :param max_workers: maximum number of threads or processes
+        :type max_workers: int, optional
+        :param retries: number of times to retry an hour which fails, default 0
+        :type retries: int, optional
+        :param incremental: skip hours whose outputs are current, default True
+        :type incremental: bool, optional
+
+        :return: status of each hour, as returned by `flight_processing.utils.run_intervals`
+        :rtype: list(dict)
         """
 
         t_start = parser.parse(str(time_start))
         t_end = parser.parse(str(time_end))
+        t_delta = timedelta(hours=1)
 
         logger.info("Processing downloaded flights in bulk between {} and {}.".format(t_start, t_end))
 
-        execute_bulk_between(lambda t1, t2: self.process_flights(t1, npz=npz, yaml=yaml, json=json), t_start, t_end)
+        intervals = []
+        t = t_start
+        while t + t_delta <= t_end:
+            intervals.append((t, t + t_delta))
+            t += t_delta
+
+        skipped = []
+        if incremental:
+            manifest = GraphManifest.for_dataset(self.__data_config)
+            outputs = [kind for kind, required in (("npz", npz), ("json", json), ("yaml", yaml)) if required]
+            current = [manifest.is_current(t1, self.__flights_location(t1), self.__dataset_hash, outputs) for t1, _ in intervals]
+            skipped = [dict(time_start=t1, time_end=t2, success=True, attempts=0, error=None, result=None) for (t1, t2), c in zip(intervals, current) if c]
+            intervals = [interval for interval, c in zip(intervals, current) if not c]
+            logger.info("Skipping {} hours which are current, processing {}.".format(len(skipped), len(intervals)))
+
+        # the store is only written from this process, once every hour has been processed
+        report = run_intervals(lambda t1, t2: self.process_flights(t1, npz=npz, yaml=yaml, json=json, num_threads=num_threads), intervals, executor=executor, max_workers=max_workers, retries=retries)
+        report = sorted(report + skipped, key=lambda status: status['time_start'])
+
+        if incremental:
+            manifest.compact()
+
+        if store:
+            handover_store = HandoverStore.for_dataset(self.__data_config, self.__airspaces.size())
+
+            logger.info("Appending to handover store.")
+            for status in report:
+                if not status['success']:
+                    continue
+                if status['attempts'] == 0:
+                    handover_store.import_npz(self.__data_config, status['time_start'], status['time_end'])
+                    continue
+                if handover_store.contains(status['time_start']):
+                    logger.warning("Hour {} is already in the handover store, skipping.".format(status['time_start']))
+                    continue
+                handover_store.append(status['time_start'], status['result'])
+
+            logger.info("Rebuilding handover store rollups.")
+            handover_store.build_rollups()
+
+        return report
+
+    def process_pipeline(self, time_start, time_end, source=None, dump=None, queue_size=2, npz=True, json=False, yaml=False, num_threads=None, store=False, retries=0):
+        """
+        Fetch and process flights hour by hour, fetching the next hour while the current one is being processed.
+
+        Flights are fetched on a background thread and passed to
+        `process_traffic <#flight_processing.data.GraphBuilder.process_traffic>`_ in memory,
+        so no flight dumps are needed.
+        At most `queue_size` fetched hours wait to be processed at any time, after which fetching pauses.
+
+        By default flights are downloaded from OpenSky, but `source` may be any callable taking the start and end time of an hour
+        and returning its flights as a `traffic.core.traffic.Traffic` - for example a `TrafficDirectorySource` to run offline.
+
+        :param time_start: start time for processing
+        :type time_start: datetime.datetime or str
+        :param time_end: end time for processing
+        :type time_end: datetime.datetime or str
+        :param source: source of flights, defaults to an `OpenSkySource` for this dataset
+        :type source: function, optional
+        :param dump: also save the fetched flights as a flight dump, either ``"json"`` or ``"binary"``
+        :type dump: str, optional
+        :param queue_size: maximum number of fetched hours waiting to be processed, default 2
+        :type queue_size: int, optional
+        :param npz: save output as NPZ, default True
+        :type npz: bool, optional
+        :param json: save output as JSON, default False
+        :type json: bool, optional
+        :param yaml: save output as YAML, default False
+        :type yaml: bool, optional
+        :param num_threads: number of threads used to process each hour, defaults to all available cores
+        :type num_threads: int, optional
+        :param store: also append the graphs to the dataset's `HandoverStore` and rebuild its rollups, default False
+        :type store: bool, optional
+        :param retries: number of times to retry fetching an hour which fails, default 0
+        :type retries: int, optional
+
+        :return: status of each hour, as returned by `flight_processing.utils.run_intervals`
+        :rtype: list(dict)
+        """
+
+        if dump not in (None, "json", "binary"):
+            raise ValueError("Argument 'dump' must be None, 'json' or 'binary'.")
+
+        t_start = parser.parse(str(time_start))
+        t_end = parser.parse(str(time_end))
+        t_delta = timedelta(hours=1)
+
+        source = source if source is not None else OpenSkySource(self.__data_config)
+        downloader = FlightDownloader(self.__data_config)
+
+        intervals = []
+        t = t_start
+        while t + t_delta <= t_end:
+            intervals.append((t, t + t_delta))
+            t += t_delta
+
+        logger.info("Processing {} hours of flights in a pipeline between {} and {}.".format(len(intervals), t_start, t_end))
+
+        fetched = queue.Queue(maxsize=max(queue_size, 1))
+
+        def fetch():
+            for t1, t2 in intervals:
+                fetched.put(attempt_interval(source, t1, t2, retries))
+            fetched.put(None)
+
+        fetcher = threading.Thread(target=fetch, daemon=True)
+        fetcher.start()
+
+        report = []
+        while True:
+            status = fetched.get()
+            if status is None:
+                break
+
+            if status['success']:
+                traffic = status['result']
+                status['result'] = None
+                try:
+                    if dump == "json":
+                        downloader.save_traffic(traffic, self.__data_config.data_flights(status['time_start']))
+                    elif dump == "binary":
+                        downloader.save_traffic_binary(traffic, self.__data_config.data_flights_binary(status['time_start']))
+
+                    status['result'] = self.process_traffic(status['time_start'], traffic, npz=npz, json=json, yaml=yaml, num_threads=num_threads, store=store)
+                except Exception:
+                    status['success'] = False
+                    status['error'] = traceback.format_exc()
+                    logger.warning("Processing interval starting {} failed.".format(status['time_start']))
+
+            report.append(status)
+
+        fetcher.join()
+
+        failed = [status for status in report if not status['success']]
+        if len(failed) > 0:
+            logger.error("{} of {} intervals failed: {}".format(len(failed), len(report), ", ".join(str(status['time_start']) for status in failed)))
+
+        if store:
+            logger.info("Rebuilding handover store rollups.")
+            HandoverStore.for_dataset(self.__data_config, self.__airspaces.size()).build_rollups()
+
+        return report
+
+    def projection_report(self, flights, k=5, num_threads=None):
+        """
+        Measure the error of processing the given flights in planar mode, against processing them geodesically,
+        to check that the dataset's `DataConfig.projection` is accurate enough to use.
+
+        Both modes are run on the same flights, comparing the handovers found along each flight,
+        the airspaces containing each position, and the distance from each position to its `k` nearest airspaces.
+
+        :param flights: flights to compare, ideally a representative sample of the dataset
+        :type flights: traffic.core.traffic.Traffic
+        :param k: number of nearest airspaces to compare distances to
+        :type k: int, optional
+        :param num_threads: number of threads to process with, defaults to all available cores
+        :type num_threads: int, optional
+
+        :return: report with the keys `projection`, `flights`, `positions`,
+            `handovers_geodesic`, `handovers_planar`, `flights_differing` (flights whose handovers differ),
+            `positions_differing` (positions placed in different airspaces),
+            `distances`, `distance_error_max` (in feet), `distance_error_relative_max` and `distance_error_relative_mean`
+            (relative to the distance, or to a kilometre for closer airspaces),
+            `time_geodesic` and `time_planar` (seconds spent finding handovers)
+        :rtype: dict
+        """
+
+        projection = self.__data_config.projection
+        if projection is None:
+            raise ValueError("Dataset {} has no projection for planar mode.".format(self.dataset))
+
+        num_threads = num_threads if num_threads is not None else 0
+        xs, ys, hs, offsets, flight_ids = flights_to_arrays(flights)
+        positions = np.arange(len(xs))
+
+        results = dict()
+        for mode in ("geodesic", "planar"):
+            logger.info("Processing {} flights in {} mode.".format(len(flight_ids), mode))
+            handler = AirspaceHandler()
+            add_airspaces(handler, self.__gdf, self.__index_location)
+            if mode == "planar":
+                project_airspaces(handler, projection)
+
+            start = time.perf_counter()
+            handovers = handler.process_flights_batch(xs, ys, hs, offsets, num_threads)
+            elapsed = time.perf_counter() - start
+
+            at_offsets, at_ids = handler.airspaces_at_points(xs, ys, hs, False, num_threads)
+            near_offsets, near_ids, near_distances = handler.airspaces_near_points(xs, ys, hs, k, False, num_threads)
+
+            results[mode] = dict(
+                handovers=_split_pairs(*handovers),
+                at=pd.DataFrame(dict(position=np.repeat(positions, np.diff(at_offsets)), ident=at_ids)),
+                near=pd.DataFrame(dict(position=np.repeat(positions, np.diff(near_offsets)), ident=near_ids, distance=near_distances)),
+                time=elapsed
+            )
+
+        geodesic, planar = results["geodesic"], results["planar"]
+
+        flights_differing = sum(a != b for a, b in zip(geodesic["handovers"], planar["handovers"]))
+
+        at = geodesic["at"].merge(planar["at"], how="outer", on=["position", "ident"], indicator=True)
+        positions_differing = at.loc[at["_merge"] != "both", "position"].nunique()
+
+        # only airspaces near a position in both modes can be compared
+        near = geodesic["near"].merge(planar["near"], on=["position", "ident"], suffixes=("_geodesic", "_planar"))
+        error = np.abs(near["distance_planar"].to_numpy() - near["distance_geodesic"].to_numpy())
+        # positions right by an edge would otherwise dominate, so relative errors are taken against at least a kilometre
+        error_relative = error / np.maximum(near["distance_geodesic"].to_numpy(), 1000 * METRE_IN_FT)
+
+        report = dict(
+            projection=projection,
+            flights=len(flight_ids),
+            positions=len(xs),
+            handovers_geodesic=sum(len(h) for h in geodesic["handovers"]),
+            handovers_planar=sum(len(h) for h in planar["handovers"]),
+            flights_differing=int(flights_differing),
+            positions_differing=int(positions_differing),
+            distances=len(near),
+            distance_error_max=float(error.max()) if len(error) > 0 else 0.0,
+            distance_error_relative_max=float(error_relative.max()) if len(error_relative) > 0 else 0.0,
+            distance_error_relative_mean=float(error_relative.mean()) if len(error_relative) > 0 else 0.0,
+            time_geodesic=geodesic["time"],
+            time_planar=planar["time"]
+        )
+
+        logger.info("Planar mode differs in the handovers of {} of {} flights and the airspaces of {} of {} positions, with distances up to {:.2%} out.".format(
+            report["flights_differing"], report["flights"], report["positions_differing"], report["positions"], report["distance_error_relative_max"]))
+
+        return report
 
     def draw_map(self, flight=None, subset=None, file_out=None):
         """
@@ -233,6 +588,13 @@ class GraphBuilder:
         :type file_out: pathlib.Path or str, optional
         """
 
+        # the plotting libraries are slow to import, so are only loaded when a map is drawn
+        from traffic.core.flight import Flight
+        from traffic.core.traffic import Traffic
+        import matplotlib.pyplot as plt
+        import cartopy.crs as ccrs
+        import cartopy.io.img_tiles as cimgt
+
         fig = plt.figure(dpi=300, figsize=(7,7))
 
         logger.info("Downloading terrain data from Stamen.")
@@ -279,3 +641,7 @@ class GraphBuilder:
             plt.savefig(file_out, bbox_inches='tight', transparent=True)
 
         plt.show()
+
+def _split_pairs(offsets, airspace1, airspace2):
+    # handovers along each flight, from the flat arrays returned by AirspaceHandler.process_flights_batch
+    return [list(zip(airspace1[offsets[i]:offsets[i+1]], airspace2[offsets[i]:offsets[i+1]])) for i in range(len(offsets) - 1)]
@@ -0,0 +1,355 @@
+from ..utils import DataConfig
+from .handover_store import time_to_hour, hour_to_time
+
+from contextlib import contextmanager
+from pathlib import Path
+import hashlib
+import json
+import os
+import logging
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks (e.g. on Windows), so compact must not run while other processes record hours
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+manifest_version = 1
+
+hash_block_size = 1 << 20
+
+def file_hash(path):
+    """
+    Compute the SHA-256 hash of a file's contents.
+
+    :param path: file to hash
+    :type path: pathlib.Path or str
+
+    :return: hexadecimal digest
+    :rtype: str
+    """
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(hash_block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def file_identity(path, known=None):
+    """
+    Describe a file by its location, size, modification time and hash, as recorded in a `GraphManifest`.
+
+    :param path: file to describe
+    :type path: pathlib.Path or str
+    :param known: identity recorded earlier, whose hash is reused rather than reading the file again if its location, size and modification time still match
+    :type known: dict, optional
+
+    :return: identity with the keys `path`, `size`, `mtime_ns` and `sha256`
+    :rtype: dict
+    """
+
+    stat = os.stat(path)
+    identity = dict(path=str(path), size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    if known is not None and all(known[key] == identity[key] for key in identity):
+        identity['sha256'] = known['sha256']
+    else:
+        identity['sha256'] = file_hash(path)
+    return identity
+
+def airspace_dataset_hash(gdf, projection=None):
+    """
+    Compute a hash identifying a dataframe of airspaces, from the name, limits and geometry of each airspace in order.
+
+    Any change to the airspaces which could change the output of `GraphBuilder` changes the hash.
+    Graphs built in planar mode differ slightly from those built geodesically, so are identified by including the projection.
+
+    :param gdf: dataframe of airspaces
+    :type gdf: geopandas.geodataframe.GeoDataFrame
+    :param projection: projection used in planar mode
+    :type projection: str, optional
+
+    :return: hexadecimal digest
+    :rtype: str
+    """
+
+    h = hashlib.sha256()
+    if projection is not None:
+        h.update(projection.encode())
+    for name, lower, upper, geometry in zip(gdf['name'], gdf['lower_limit'], gdf['upper_limit'], gdf.geometry):
+        h.update(json.dumps([str(name), float(lower), float(upper)]).encode())
+        h.update(geometry.wkb if geometry is not None else b"")
+    return h.hexdigest()
+
+class GraphManifest:
+    r"""
+    Record of how each hourly graph of a dataset was produced, so that bulk processing can skip hours whose outputs are current.
+
+    For every processed hour the manifest holds the identity (size, modification time and hash) of the flight dump which was read,
+    the hash of the airspace dataset, and the location and size of each output.
+    An hour is current only while all of these still match, so editing a flight dump or changing the airspaces
+    invalidates exactly the hours which were produced from them.
+
+    The manifest is an append-only journal with one JSON line per processed hour, where later lines replace earlier ones.
+    Each line is written with a single append as soon as its hour is finished, so several processes may record hours at once
+    and an interrupted run resumes from the last hour it completed.
+    `compact <#flight_processing.data.GraphManifest.compact>`_ rewrites the journal with only the latest line for each hour.
+    Appends and compaction are kept apart by an advisory lock on a ``.lock`` file next to the journal;
+    where advisory locks are not available, compact must only run while nothing else is recording hours.
+
+    **Summary:**
+
+        - initialisation:
+          `__init__ <#flight_processing.data.GraphManifest.\_\_init\_\_>`_,
+          `for_dataset <#flight_processing.data.GraphManifest.for_dataset>`_
+        - properties:
+          `location <#flight_processing.data.GraphManifest.location>`_
+        - reading:
+          `hours <#flight_processing.data.GraphManifest.hours>`_,
+          `entry <#flight_processing.data.GraphManifest.entry>`_,
+          `is_current <#flight_processing.data.GraphManifest.is_current>`_,
+          `stale <#flight_processing.data.GraphManifest.stale>`_
+        - writing:
+          `record <#flight_processing.data.GraphManifest.record>`_,
+          `invalidate <#flight_processing.data.GraphManifest.invalidate>`_,
+          `compact <#flight_processing.data.GraphManifest.compact>`_
+    """
+
+    def __init__(self, location):
+        """
+        Open the manifest at the given location. The file is created when the first hour is recorded.
+
+        :param location: location of the manifest file
+        :type location: pathlib.Path or str
+
+        :return: object
+        :rtype: GraphManifest
+        """
+
+        self.__location = Path(location)
+        self.__entries = {}
+        self.__read()
+
+    @classmethod
+    def for_dataset(cls, dataset):
+        """
+        Open the manifest for the given dataset, at the location given by `DataConfig.data_graph_manifest`.
+
+        :param dataset: dataset name or specification
+        :type dataset: str or DataConfig
+
+        :return: object
+        :rtype: GraphManifest
+        """
+
+        if isinstance(dataset, str):
+            dataset = DataConfig.known_dataset(dataset)
+        elif not isinstance(dataset, DataConfig):
+            raise ValueError("Argument 'dataset' must be of type DataConfig or str.")
+
+        return cls(dataset.data_graph_manifest())
+
+    @property
+    def location(self):
+        """
+        Returns the location of the manifest file.
+
+        :rtype: pathlib.Path
+        """
+
+        return self.__location
+
+    def hours(self):
+        """
+        Returns every hour recorded in the manifest, in order.
+
+        :rtype: list(datetime.datetime)
+        """
+
+        return [hour_to_time(h) for h in sorted(self.__entries)]
+
+    def entry(self, time):
+        """
+        Get the entry recorded for the hour containing the given time.
+
+        :param time: time to get
+        :type time: datetime.datetime or str
+
+        :return: entry with the keys `input`, `dataset_hash` and `outputs`, or None if the hour has not been recorded
+        :rtype: dict
+        """
+
+        return self.__entries.get(time_to_hour(time))
+
+    def is_current(self, time, input_path, dataset_hash, outputs):
+        """
+        Check whether the outputs recorded for an hour are up to date.
+
+        This is the case when the hour was produced from the same flight dump and airspace dataset,
+        and every requested output still exists as it was written.
+        The flight dump is only hashed again if its size matches but its modification time does not.
+        If its contents turn out to be unchanged, the new modification time is recorded,
+        so that later checks need not hash it again.
+
+        :param time: time of the hour to check
+        :type time: datetime.datetime or str
+        :param input_path: flight dump which would be read
+        :type input_path: pathlib.Path or str
+        :param dataset_hash: hash of the current airspace dataset, from `airspace_dataset_hash`
+        :type dataset_hash: str
+        :param outputs: kinds of output required (e.g. ``"npz"``)
+        :type outputs: list(str)
+
+        :rtype: bool
+        """
+
+        entry = self.entry(time)
+        if entry is None or entry['dataset_hash'] != dataset_hash:
+            return False
+
+        recorded = entry['input']
+        if recorded['path'] != str(input_path) or not os.path.exists(input_path):
+            return False
+
+        stat = os.stat(input_path)
+        if stat.st_size != recorded['size']:
+            return False
+        touched = stat.st_mtime_ns != recorded['mtime_ns']
+        if touched and file_hash(input_path) != recorded['sha256']:
+            return False
+
+        for kind in outputs:
+            output = entry['outputs'].get(kind)
+            if output is None or not os.path.exists(output['path']) or os.path.getsize(output['path']) != output['size']:
+                return False
+
+        if touched:
+            logger.debug("Refreshing modification time of hour {} in manifest.".format(time))
+            self.__append(time_to_hour(time), dict(entry, input=dict(recorded, mtime_ns=stat.st_mtime_ns)))
+
+        return True
+
+    def stale(self, dataset_hash):
+        """
+        Returns the recorded hours which were produced from a different airspace dataset.
+
+        :param dataset_hash: hash of the current airspace dataset, from `airspace_dataset_hash`
+        :type dataset_hash: str
+
+        :rtype: list(datetime.datetime)
+        """
+
+        return [hour_to_time(h) for h in sorted(self.__entries) if self.__entries[h]['dataset_hash'] != dataset_hash]
+
+    def record(self, time, input_path, dataset_hash, outputs):
+        """
+        Record that the hour containing the given time has been produced, replacing any previous entry for it.
+
+        The flight dump is only hashed if it differs in size or modification time from the one recorded before for the hour.
+
+        :param time: time of the hour
+        :type time: datetime.datetime or str
+        :param input_path: flight dump which was read
+        :type input_path: pathlib.Path or str
+        :param dataset_hash: hash of the airspace dataset, from `airspace_dataset_hash`
+        :type dataset_hash: str
+        :param outputs: location of each output which was written, by kind (e.g. ``"npz"``)
+        :type outputs: dict(str, pathlib.Path)
+        """
+
+        previous = self.entry(time)
+        entry = dict(
+            input=file_identity(input_path, previous['input'] if previous is not None else None),
+            dataset_hash=dataset_hash,
+            outputs={kind: dict(path=str(path), size=os.path.getsize(path)) for kind, path in outputs.items()}
+        )
+
+        logger.debug("Recording hour {} in manifest.".format(time))
+        self.__append(time_to_hour(time), entry)
+
+    def invalidate(self, time):
+        """
+        Forget the hour containing the given time, so that it is processed again.
+
+        :param time: time of the hour
+        :type time: datetime.datetime or str
+        """
+
+        self.__append(time_to_hour(time), None)
+
+    def compact(self):
+        """
+        Rewrite the journal with only the latest entry for each hour, including any hours recorded by other processes since it was opened.
+        """
+
+        if not self.__location.exists():
+            return
+
+        # no line can be appended between reading the journal and replacing it
+        with self.__locked(exclusive=True):
+            self.__read()
+
+            logger.info("Compacting manifest at {}.".format(self.__location))
+            path_tmp = self.__location.with_name(self.__location.name + ".tmp")
+            with open(path_tmp, "w") as f:
+                for hour in sorted(self.__entries):
+                    f.write(self.__line(hour, self.__entries[hour]))
+            os.replace(path_tmp, self.__location)
+
+    def __read(self):
+        self.__entries = {}
+        if not self.__location.exists():
+            return
+
+        with open(self.__location) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a line cut short by a crash, which is only ever the last one
+                    logger.warning("Ignoring incomplete line in manifest at {}.".format(self.__location))
+                    continue
+
+                if record['version'] != manifest_version:
+                    raise ValueError("Unsupported manifest version {}.".format(record['version']))
+
+                if record['entry'] is None:
+                    self.__entries.pop(record['hour'], None)
+                else:
+                    self.__entries[record['hour']] = record['entry']
+
+    @staticmethod
+    def __line(hour, entry):
+        return json.dumps(dict(version=manifest_version, hour=int(hour), entry=entry)) + "\n"
+
+    def __append(self, hour, entry):
+        self.__location.parent.mkdir(parents=True, exist_ok=True)
+
+        # a single write to a file opened for appending is not interleaved with those of other processes,
+        # so appends only need to exclude compaction
+        with self.__locked(exclusive=False):
+            fd = os.open(self.__location, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, self.__line(hour, entry).encode())
+            finally:
+                os.close(fd)
+
+        if entry is None:
+            self.__entries.pop(hour, None)
+        else:
+            self.__entries[hour] = entry
+
+    @contextmanager
+    def __locked(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+
+        self.__location.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.__location.with_name(self.__location.name + ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,451 @@
+from ..utils import DataConfig
+
+from datetime import datetime, timedelta, timezone
+from dateutil import parser
+from pathlib import Path
+from scipy import sparse
+import numpy as np
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+store_version = 1
+
+epoch = datetime(1970, 1, 1)
+hours_per_day = 24
+days_per_week = 7
+
+# Each level of the store is a set of blocks, one block per key (an hour, a day or a week since the epoch).
+# The entries of every block are appended to four flat columns, and an index maps each key to its extent.
+# The rollup levels are rewritten as a whole under a new generation number, so that readers which have
+# already mapped the previous generation are not affected; the generation before that is then removed.
+level_hours = "hours"
+level_days = "days"
+level_weeks = "weeks" # cumulative: the block for week w holds the sum of every week before w
+
+columns = (("key", "<i8"), ("i", "<i4"), ("j", "<i4"), ("count", "<i8"))
+
+def time_to_hour(time):
+    """
+    Convert a time to the number of whole hours since the epoch, in UTC.
+
+    :param time: time to convert
+    :type time: datetime.datetime or str
+
+    :return: hour
+    :rtype: int
+    """
+
+    t = parser.parse(str(time))
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return (t - epoch) // timedelta(hours=1)
+
+def hour_to_time(hour):
+    """
+    Convert a number of hours since the epoch back to a time.
+
+    :param hour: hour to convert
+    :type hour: int
+
+    :return: time
+    :rtype: datetime.datetime
+    """
+
+    return epoch + timedelta(hours=int(hour))
+
+class HandoverStore:
+    r"""
+    Append-only store of hourly handover matrices for a single dataset, kept in one place rather than one NPZ file per hour.
+
+    Entries are kept as memory-mapped COO columns (key, i, j, count) with an index from each hour to its block of entries,
+    so that several readers share the same pages.
+    Daily sums and cumulative weekly sums can be precomputed with
+    `build_rollups <#flight_processing.data.HandoverStore.build_rollups>`_,
+    after which the sum over any range of hours reads at most a few dozen blocks, however long the range.
+
+    **Summary:**
+
+        - initialisation:
+          `__init__ <#flight_processing.data.HandoverStore.\_\_init\_\_>`_,
+          `for_dataset <#flight_processing.data.HandoverStore.for_dataset>`_,
+          `exists <#flight_processing.data.HandoverStore.exists>`_
+        - properties:
+          `location <#flight_processing.data.HandoverStore.location>`_,
+          `size <#flight_processing.data.HandoverStore.size>`_,
+          `rollups_current <#flight_processing.data.HandoverStore.rollups_current>`_
+        - writing:
+          `append <#flight_processing.data.HandoverStore.append>`_,
+          `import_npz <#flight_processing.data.HandoverStore.import_npz>`_,
+          `build_rollups <#flight_processing.data.HandoverStore.build_rollups>`_
+        - reading:
+          `hours <#flight_processing.data.HandoverStore.hours>`_,
+          `contains <#flight_processing.data.HandoverStore.contains>`_,
+          `range_sum <#flight_processing.data.HandoverStore.range_sum>`_
+    """
+
+    def __init__(self, location, size=None):
+        """
+        Open the store at the given location, creating it if a size is given and no store exists there.
+
+        :param location: directory containing the store
+        :type location: pathlib.Path or str
+        :param size: number of airspaces, required when creating a new store
+        :type size: int, optional
+
+        :return: object
+        :rtype: HandoverStore
+        """
+
+        self.__location = Path(location)
+        meta = self.__location / "meta.json"
+
+        if meta.exists():
+            self.__read_meta()
+            if self.__meta['version'] != store_version:
+                raise ValueError("Unsupported handover store version {}.".format(self.__meta['version']))
+            if size is not None and size != self.__meta['size']:
+                raise ValueError("Store at {} has {} airspaces, not {}.".format(self.__location, self.__meta['size'], size))
+        elif size is not None:
+            logger.info("Creating handover store at {}.".format(self.__location))
+            self.__location.mkdir(parents=True, exist_ok=True)
+            self.__meta = dict(version=store_version, size=int(size), rollup_hours=0, rollup_generation=0)
+            self.__write_meta()
+        else:
+            raise FileNotFoundError("No handover store found at {}.".format(self.__location))
+
+    @classmethod
+    def for_dataset(cls, dataset, size=None):
+        """
+        Open the store for the given dataset, at the location given by `DataConfig.data_graph_store`.
+
+        :param dataset: dataset name or specification
+        :type dataset: str or DataConfig
+        :param size: number of airspaces, required when creating a new store
+        :type size: int, optional
+
+        :return: object
+        :rtype: HandoverStore
+        """
+
+        if isinstance(dataset, str):
+            dataset = DataConfig.known_dataset(dataset)
+        elif not isinstance(dataset, DataConfig):
+            raise ValueError("Argument 'dataset' must be of type DataConfig or str.")
+
+        return cls(dataset.data_graph_store(), size)
+
+    @staticmethod
+    def exists(location):
+        """
+        Check whether a store exists at the given location.
+
+        :param location: directory containing the store
+        :type location: pathlib.Path or str
+
+        :rtype: bool
+        """
+
+        return (Path(location) / "meta.json").exists()
+
+    @property
+    def location(self):
+        """
+        Returns the directory containing the store.
+
+        :rtype: pathlib.Path
+        """
+
+        return self.__location
+
+    @property
+    def size(self):
+        """
+        Returns the number of airspaces, so that each stored matrix has shape `(size, size)`.
+
+        :rtype: int
+        """
+
+        return self.__meta['size']
+
+    @property
+    def rollups_current(self):
+        """
+        Returns whether the daily and weekly rollups include every stored hour.
+
+        :rtype: bool
+        """
+
+        self.__read_meta()
+        return self.__meta['rollup_hours'] > 0 and self.__meta['rollup_hours'] == len(self.__index(level_hours))
+
+    def hours(self):
+        """
+        Returns every hour held in the store, in order.
+
+        :rtype: list(datetime.datetime)
+        """
+
+        return [hour_to_time(h) for h in self.__index(level_hours)[:, 0]]
+
+    def contains(self, time):
+        """
+        Check whether the hour containing the given time is held in the store.
+
+        :param time: time to check
+        :type time: datetime.datetime or str
+
+        :rtype: bool
+        """
+
+        keys = self.__index(level_hours)[:, 0]
+        hour = time_to_hour(time)
+        position = np.searchsorted(keys, hour)
+        return position < len(keys) and keys[position] == hour
+
+    def append(self, time, matrix):
+        """
+        Add the handovers for the hour containing the given time.
+
+        Each hour can only be added once. The rollups are not updated until
+        `build_rollups <#flight_processing.data.HandoverStore.build_rollups>`_
+        is called again.
+
+        :param time: time of handovers
+        :type time: datetime.datetime or str
+        :param matrix: matrix of handovers
+        :type matrix: scipy.sparse.csr.csr_matrix or numpy.ndarray
+        """
+
+        if self.contains(time):
+            raise ValueError("Hour {} is already in the store.".format(hour_to_time(time_to_hour(time))))
+
+        matrix = sparse.coo_matrix(matrix)
+        if matrix.shape != (self.size, self.size):
+            raise ValueError("Matrix must have shape ({0}, {0}).".format(self.size))
+
+        logger.debug("Appending {} entries for hour {} to handover store.".format(matrix.nnz, time))
+        self.__append_blocks(level_hours, [time_to_hour(time)], [matrix])
+
+    def import_npz(self, dataset, time_start, time_end):
+        """
+        Add the hourly NPZ graphs saved by `GraphBuilder` within a given time range, skipping hours which are already in the store.
+
+        :param dataset: dataset specification used to locate the files
+        :type dataset: DataConfig
+        :param time_start: start time
+        :type time_start: datetime.datetime or str
+        :param time_end: end time
+        :type time_end: datetime.datetime or str
+
+        :return: files which could not be found
+        :rtype: list(pathlib.Path)
+        """
+
+        missing = []
+        for hour in range(time_to_hour(time_start), time_to_hour(time_end)):
+            t = hour_to_time(hour)
+            if self.contains(t):
+                continue
+
+            file_load = dataset.data_graph_npz(t)
+            if not file_load.exists():
+                missing.append(file_load)
+                continue
+
+            logger.info("Importing saved graph from location {}.".format(file_load))
+            self.append(t, sparse.load_npz(file_load))
+
+        return missing
+
+    def build_rollups(self):
+        """
+        Recompute the daily sums and cumulative weekly sums from every stored hour.
+        """
+
+        index = self.__index(level_hours)
+        generation = self.__meta['rollup_generation'] + 1
+
+        logger.info("Building daily rollups from {} stored hours.".format(len(index)))
+        days = index[:, 0] // hours_per_day
+        day_keys, day_matrices = [], []
+        for day in np.unique(days):
+            day_keys.append(day)
+            day_matrices.append(self.__sum_blocks(level_hours, index[days == day, 0]))
+        self.__append_blocks(level_days, day_keys, day_matrices, generation)
+
+        logger.info("Building cumulative weekly rollups.")
+        week_keys, week_matrices = [], []
+        if len(day_keys) > 0:
+            weeks = np.asarray(day_keys) // days_per_week
+            total = sparse.coo_matrix((self.size, self.size), dtype=np.int64)
+            for week in range(weeks.min(), weeks.max() + 1):
+                total = (total + self.__sum_blocks(level_days, np.asarray(day_keys)[weeks == week], generation)).tocoo()
+                week_keys.append(week + 1)
+                week_matrices.append(total)
+        self.__append_blocks(level_weeks, week_keys, week_matrices, generation)
+
+        self.__meta['rollup_hours'] = len(index)
+        self.__meta['rollup_generation'] = generation
+        self.__write_meta()
+
+        for level in (level_days, level_weeks):
+            for path in self.__location.glob("{}.{}.*".format(level, generation - 2)):
+                path.unlink()
+
+    def range_sum(self, time_start, time_end):
+        """
+        Sum the handovers within a given time range.
+
+        If the rollups are current, whole weeks are taken from the difference of two cumulative sums
+        and whole days from the daily sums, so at most a few dozen blocks are read.
+        Otherwise every hour in the range is read.
+
+        :param time_start: start time
+        :type time_start: datetime.datetime or str
+        :param time_end: end time
+        :type time_end: datetime.datetime or str
+
+        :return: summed matrix and list of hours in the range which are not in the store
+        :rtype: tuple(scipy.sparse.csr.csr_matrix, list(datetime.datetime))
+        """
+
+        h_start = time_to_hour(time_start)
+        h_end = time_to_hour(time_end)
+
+        hours = np.arange(h_start, h_end)
+        days = np.zeros(0, dtype=np.int64)
+        weeks = None
+
+        if self.rollups_current:
+            d_start = -(-h_start // hours_per_day)
+            d_end = h_end // hours_per_day
+            if d_start < d_end:
+                hours = np.concatenate((np.arange(h_start, d_start * hours_per_day), np.arange(d_end * hours_per_day, h_end)))
+                days = np.arange(d_start, d_end)
+
+                w_start = -(-d_start // days_per_week)
+                w_end = d_end // days_per_week
+                if w_start < w_end:
+                    days = np.concatenate((np.arange(d_start, w_start * days_per_week), np.arange(w_end * days_per_week, d_end)))
+                    weeks = (w_start, w_end)
+
+        parts = [self.__read_blocks(level_hours, hours), self.__read_blocks(level_days, days)]
+        if weeks is not None:
+            parts.append(self.__read_cumulative(weeks[1], 1))
+            parts.append(self.__read_cumulative(weeks[0], -1))
+
+        i, j, count = (np.concatenate([part[k] for part in parts]) for k in range(3))
+        matrix = sparse.coo_matrix((count, (i, j)), shape=(self.size, self.size)).tocsr()
+        matrix.eliminate_zeros()
+
+        keys = self.__index(level_hours)[:, 0]
+        missing = [hour_to_time(h) for h in np.setdiff1d(np.arange(h_start, h_end), keys)]
+
+        return matrix, missing
+
+    def __read_meta(self):
+        self.__meta = json.loads((self.__location / "meta.json").read_text())
+
+    def __write_meta(self):
+        path = self.__location / "meta.json"
+        path_tmp = self.__location / "meta.json.tmp"
+        path_tmp.write_text(json.dumps(self.__meta))
+        os.replace(path_tmp, path)
+
+    def __prefix(self, level, generation=None):
+        if level == level_hours:
+            return level
+        if generation is None:
+            generation = self.__meta['rollup_generation']
+        return "{}.{}".format(level, generation)
+
+    def __column_path(self, prefix, column):
+        return self.__location / "{}.{}.bin".format(prefix, column)
+
+    def __index_path(self, prefix):
+        return self.__location / "{}.index.npy".format(prefix)
+
+    def __index(self, level, generation=None):
+        # rows of (key, start, end), sorted by key
+        path = self.__index_path(self.__prefix(level, generation))
+        if not path.exists():
+            return np.zeros((0, 3), dtype=np.int64)
+        return np.load(path)
+
+    def __column(self, prefix, column, dtype):
+        path = self.__column_path(prefix, column)
+        if not path.exists() or path.stat().st_size == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def __append_blocks(self, level, keys, matrices, generation=None):
+        # Columns are written before the index, so an interrupted append leaves
+        # unreferenced entries at the end of the columns rather than a corrupt index.
+        # Those entries are cut off before the next append.
+        prefix = self.__prefix(level, generation)
+        index = self.__index(level, generation)
+        start = int(index[:, 2].max()) if len(index) > 0 else 0
+
+        rows = []
+        files = []
+        try:
+            for name, dtype in columns:
+                path = self.__column_path(prefix, name)
+                f = open(path, "r+b" if path.exists() else "wb")
+                f.truncate(start * np.dtype(dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+                files.append(f)
+
+            for key, matrix in zip(keys, matrices):
+                n = matrix.nnz
+                values = (np.full(n, key), matrix.row, matrix.col, matrix.data)
+                for f, (_, dtype), value in zip(files, columns, values):
+                    f.write(np.asarray(value, dtype=dtype).tobytes())
+                rows.append((key, start, start + n))
+                start += n
+        finally:
+            for f in files:
+                f.close()
+
+        if len(rows) > 0:
+            index = np.concatenate((index, np.asarray(rows, dtype=np.int64)))
+        index = index[np.argsort(index[:, 0], kind="stable")]
+
+        path_tmp = self.__location / "{}.index.tmp.npy".format(prefix)
+        np.save(path_tmp, index)
+        os.replace(path_tmp, self.__index_path(prefix))
+
+    def __read_blocks(self, level, keys, sign=1, generation=None):
+        prefix = self.__prefix(level, generation)
+        index = self.__index(level, generation)
+        keys = np.asarray(keys, dtype=np.int64)
+        positions = np.searchsorted(index[:, 0], keys)
+        found = positions < len(index)
+        found[found] = index[positions[found], 0] == keys[found]
+        blocks = index[positions[found]]
+
+        data = [self.__column(prefix, name, dtype) for name, dtype in columns[1:]]
+        out = tuple([np.zeros(0, dtype=dtype)] for _, dtype in columns[1:])
+        for _, start, end in blocks:
+            for k in range(3):
+                out[k].append(np.asarray(data[k][start:end]))
+
+        i, j, count = (np.concatenate(part) for part in out)
+        return i, j, sign * count
+
+    def __read_cumulative(self, week, sign):
+        # sum of every week before the given one, clamped to the weeks which have been rolled up
+        keys = self.__index(level_weeks)[:, 0]
+        if len(keys) == 0 or week < keys[0]:
+            return self.__read_blocks(level_weeks, [], sign)
+        return self.__read_blocks(level_weeks, [min(week, keys[-1])], sign)
+
+    def __sum_blocks(self, level, keys, generation=None):
+        i, j, count = self.__read_blocks(level, keys, generation=generation)
+        matrix = sparse.coo_matrix((count, (i, j)), shape=(self.size, self.size)).tocsr()
+        matrix.eliminate_zeros()
+        return matrix.tocoo()
@@ -2,11 +2,11 @@
 
 
 import numpy as np
-import cartopy.crs as ccrs
-import cartopy.geodesic as cgeo
 
 def _axes_to_lonlat(ax, coords):
     """(lon, lat) from axes coordinates."""
+    import cartopy.crs as ccrs
+
     display = ax.transAxes.transform(coords)
     data = ax.transData.inverted().transform(display)
     lonlat = ccrs.PlateCarree().transform_point(*data, ax.projection)
@@ -104,6 +104,9 @@ def _point_along_line(ax, start, distance, angle=0, tol=0.01):
     # Direction vector of the line in axes coordinates.
     direction = np.array([np.cos(angle), np.sin(angle)])
 
+    # cartopy is only imported once a scale bar is drawn
+    import cartopy.geodesic as cgeo
+
     geodesic = cgeo.Geodesic()
 
     # Physical distance between points.
@@ -7,6 +7,12 @@ from appdirs import user_config_dir
 import configparser
 import numpy as np
 from math import ceil
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+import itertools
+import multiprocessing
+import threading
+import traceback
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,25 +20,72 @@ logger = logging.getLogger(__name__)
 config_dir = Path(user_config_dir("flight_processing"))
 config_file = config_dir / "flight_processing.conf"
 
-if not config_dir.exists():
-    logger.info("Config directory {} does not exist, copying config file to {}.".format(config_dir, config_file))
+# the config and data location are only loaded when first needed, so that importing the library has no side effects
+_config = None
+_data_prefix = None
+_config_lock = threading.Lock()
 
-    config_template = (Path(__file__).parent / "flight_processing.conf").read_text()
-    config_dir.mkdir(parents=True)
-    config_file.write_text(config_template)
+def get_config():
+    """
+    Returns the parsed config, copying the template config file into place first if it does not exist.
+
+    The config is only read once, on first use.
+
+    :rtype: configparser.ConfigParser
+    """
+
+    global _config
+
+    with _config_lock:
+        if _config is None:
+            if not config_dir.exists():
+                logger.info("Config directory {} does not exist, copying config file to {}.".format(config_dir, config_file))
+
+                config_template = (Path(__file__).parent / "flight_processing.conf").read_text()
+                config_dir.mkdir(parents=True, exist_ok=True)
+                config_file.write_text(config_template)
+
+            logger.info("Parsing config.")
+
+            config = configparser.ConfigParser()
+            config.read(config_file.as_posix())
+            _config = config
+
+    return _config
+
+def get_data_prefix():
+    """
+    Returns the data location specified in the config, creating any necessary folders on first use.
 
-logger.info("Parsing config.")
+    :rtype: pathlib.Path
+    """
+
+    global _data_prefix
+
+    config = get_config()
+
+    with _config_lock:
+        if _data_prefix is None:
+            data_prefix = Path(config.get("global", "data_location", fallback=""))
+
+            if not data_prefix.exists():
+                logger.info("Data location {} (as specified in config) does not exist, creating necessary folders.".format(data_prefix))
+                data_prefix.mkdir(parents=True, exist_ok=True)
+
+            _data_prefix = data_prefix
 
-config = configparser.ConfigParser()
-config.read(config_file.as_posix())
+    return _data_prefix
+
+def __getattr__(name):
+    # `config` and `data_prefix` used to be loaded on import, keep them available as module attributes
+    if name == "config":
+        return get_config()
+    if name == "data_prefix":
+        return get_data_prefix()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 # defaults
 detail = 4
-data_prefix = Path(config.get("global", "data_location", fallback=""))
-
-if not data_prefix.exists():
-    logger.info("Data location {} (as specified in config) does not exist, creating necessary folders.".format(data_prefix))
-    data_prefix.mkdir(parents=True)
 
 format_dataset_location = "regions_{dataset}_wkt.json"
 
@@ -46,7 +99,9 @@ datasets = dict(
         maxlon = 6,
         minlat = 48,
         maxlat = 61.5,
-        detail = 7
+        detail = 7,
+        # Lambert conformal conic, with standard parallels a sixth of the way in from each edge
+        projection = "+proj=lcc +lat_0=54.75 +lon_0=-2.5 +lat_1=50.25 +lat_2=59.25 +ellps=WGS84 +units=m"
     ),
     usa = dict(
         minlon = -130,
@@ -60,7 +115,9 @@ datasets = dict(
         maxlon = 10.7,
         minlat = 45.5,
         maxlat = 48,
-        detail = 8
+        detail = 8,
+        # Swiss LV95
+        projection = "+proj=somerc +lat_0=46.9524055555556 +lon_0=7.43958333333333 +k_0=1 +x_0=2600000 +y_0=1200000 +ellps=bessel +units=m"
     )
 )
 
@@ -82,15 +139,20 @@ class DataConfig:
           `detail <#flight_processing.DataConfig.detail>`_,
           `dataset_location <#flight_processing.DataConfig.dataset_location>`_,
           `bounds_opensky <#flight_processing.DataConfig.bounds_opensky>`_,
-          `bounds_plt <#flight_processing.DataConfig.bounds_plt>`_
+          `bounds_plt <#flight_processing.DataConfig.bounds_plt>`_,
+          `projection <#flight_processing.DataConfig.projection>`_
         - utility:
           `data_flights <#flight_processing.DataConfig.data_flights>`_,
+          `data_flights_binary <#flight_processing.DataConfig.data_flights_binary>`_,
           `data_graph_yaml <#flight_processing.DataConfig.data_graph_yaml>`_,
           `data_graph_json <#flight_processing.DataConfig.data_graph_json>`_,
-          `data_graph_npz <#flight_processing.DataConfig.data_graph_npz>`_
+          `data_graph_npz <#flight_processing.DataConfig.data_graph_npz>`_,
+          `data_graph_store <#flight_processing.DataConfig.data_graph_store>`_,
+          `data_graph_manifest <#flight_processing.DataConfig.data_graph_manifest>`_,
+          `data_airspace_index <#flight_processing.DataConfig.data_airspace_index>`_
     """
 
-    def __init__(self, dataset, minlon, maxlon, minlat, maxlat, detail=detail, data_prefix=data_prefix):
+    def __init__(self, dataset, minlon, maxlon, minlat, maxlat, detail=detail, data_prefix=None, projection=None):
         """
         Initialise the object with custom parameters.
 
@@ -108,11 +170,16 @@ class DataConfig:
         :type detail: int, optional
         :param data_prefix: dataset folder location, overrides config
         :type data_prefix: str, optional
+        :param projection: local projection for processing in planar mode, as a PROJ.4 string giving coordinates in metres
+        :type projection: str, optional
 
         :return: object
         :rtype: DataConfig
         """
 
+        if data_prefix is None:
+            data_prefix = get_data_prefix()
+
         self.__dataset = dataset
         self.data_prefix = data_prefix
 
@@ -121,6 +188,7 @@ class DataConfig:
         self.__minlat = minlat
         self.__maxlat = maxlat
         self.__detail = detail
+        self.__projection = projection
 
         self.__dataset_location = data_prefix / format_dataset_location.format(dataset=dataset)
 
@@ -128,7 +196,7 @@ class DataConfig:
         self.__bounds_plt = (self.__minlon, self.__maxlon, self.__minlat, self.__maxlat)
 
     @classmethod
-    def known_dataset(cls, dataset, data_prefix=data_prefix):
+    def known_dataset(cls, dataset, data_prefix=None):
         """
         Initialise the object with known parameters.
 
@@ -146,7 +214,7 @@ class DataConfig:
         if data is None:
             raise NotImplementedError("Dataset {} not recognised: specify bounds using main __init__ method.".format(dataset))
         else:
-            return cls(dataset, data['minlon'], data['maxlon'], data['minlat'], data['maxlat'], data['detail'], data_prefix)
+            return cls(dataset, data['minlon'], data['maxlon'], data['minlat'], data['maxlat'], data['detail'], data_prefix, data.get('projection'))
 
     @property
     def dataset(self):
@@ -237,6 +305,26 @@ class DataConfig:
         """
         return self.__bounds_plt
 
+    @property
+    def projection(self):
+        """
+        Returns the local projection used to process the dataset in planar mode, or None if it has none.
+
+        The known datasets small enough for a single projection to be accurate (`uk` and `switzerland`) have one.
+
+        :rtype: str
+        """
+
+        return self.__projection
+
+    def __data_flights(self, datetime, suffix):
+        dt = parser.parse(str(datetime))
+
+        date = dt.strftime(timestring_date)
+        time = dt.strftime(timestring_time)
+
+        return self.data_prefix / "flights" / self.dataset / date / "{}.{}".format(time, suffix)
+
     def data_flights(self, datetime):
         """
         Get the location of a flight dump for the given datetime.
@@ -248,12 +336,20 @@ class DataConfig:
         :rtype: pathlib.Path
         """
 
-        dt = parser.parse(str(datetime))
+        return self.__data_flights(datetime, "json")
 
-        date = dt.strftime(timestring_date)
-        time = dt.strftime(timestring_time)
+    def data_flights_binary(self, datetime):
+        """
+        Get the location of a binary flight dump for the given datetime.
+
+        :param datetime: datetime to get
+        :type datetime: datetime.datetime or str
 
-        return data_prefix / "flights" / self.dataset / date / "{}.json".format(time)
+        :return: location of file (may not exist)
+        :rtype: pathlib.Path
+        """
+
+        return self.__data_flights(datetime, "bin")
 
     def __data_graph(self, datetime, suffix):
         dt = parser.parse(str(datetime))
@@ -261,7 +357,7 @@ class DataConfig:
         date = dt.strftime(timestring_date)
         time = dt.strftime(timestring_time)
 
-        return data_prefix / "graphs" / self.dataset / date / "{}.{}".format(time, suffix)
+        return self.data_prefix / "graphs" / self.dataset / date / "{}.{}".format(time, suffix)
 
     def data_graph_yaml(self, datetime):
         """
@@ -302,6 +398,39 @@ class DataConfig:
 
         return self.__data_graph(datetime, "npz")
 
+    def data_graph_store(self):
+        """
+        Get the location of the consolidated store of hourly graphs for this dataset.
+
+        :return: location of directory (may not exist)
+        :rtype: pathlib.Path
+        """
+
+        return self.data_prefix / "graphs" / self.dataset / "store"
+
+    def data_graph_manifest(self):
+        """
+        Get the location of the manifest recording how each hourly graph of this dataset was produced.
+
+        :return: location of file (may not exist)
+        :rtype: pathlib.Path
+        """
+
+        return self.data_prefix / "graphs" / self.dataset / "manifest.jsonl"
+
+    def data_airspace_index(self, dataset_hash):
+        """
+        Get the location of the saved index of airspaces for the given version of this dataset.
+
+        :param dataset_hash: hash of the airspaces, as computed by `flight_processing.data.graph_manifest.airspace_dataset_hash`
+        :type dataset_hash: str
+
+        :return: location of file (may not exist)
+        :rtype: pathlib.Path
+        """
+
+        return self.data_prefix / "indexes" / self.dataset / "{}.bin".format(dataset_hash)
+
 
 def check_file(filename):
     """
@@ -322,14 +451,17 @@ def check_file(filename):
 
         if not p.parent.exists():
             logger.info("Directory {} does not exist, creating necessary folders.".format(str(p.parent)))
-            data_prefix.mkdir(parents=True)
+            p.parent.mkdir(parents=True, exist_ok=True)
 
-def execute_bulk(function, time_start, count, time_delta=None):
+def execute_bulk(function, time_start, count, time_delta=None, executor=None, max_workers=None, retries=0):
     """
     Execute the given function multiple times, stepping through time as its parameter.
 
     Running `execute_bulk(f, t0, 2, d)` will execute `f(t0 + 0*d, t0 + 1*d)` followed by `f(t0 + 1*d, t0 + 2*d)`.
 
+    See `run_intervals <#flight_processing.utils.run_intervals>`_ for the meaning of `executor`, `max_workers` and `retries`
+    and the format of the returned report.
+
     :param function: function to execute, must take 2 datetime arguments
     :type function: function
     :param time_start: start time
@@ -338,22 +470,33 @@ def execute_bulk(function, time_start, count, time_delta=None):
     :type count: int
     :param time_delta: amount by which to increase the time each step, defaults to datetime.timedelta(hours=1)
     :type time_delta: datetime.timedelta
+    :param executor: how to run the intervals, defaults to serially
+    :type executor: str or concurrent.futures.Executor, optional
+    :param max_workers: maximum number of threads or processes
+    :type max_workers: int, optional
+    :param retries: number of times to retry an interval which raises an exception, default 0
+    :type retries: int, optional
+
+    :return: status of each interval
+    :rtype: list(dict)
     """
 
     time_delta = time_delta if time_delta is not None else timedelta(hours=1)
 
     logger.info("Executing function {} times, with start time {} and time delta {}.".format(count, time_start, time_delta))
 
-    for i in range(count):
-        t1 = time_start + (i * time_delta)
-        t2 = time_start + ((i + 1) * time_delta)
-        function(t1, t2)
+    intervals = [(time_start + (i * time_delta), time_start + ((i + 1) * time_delta)) for i in range(count)]
+
+    return run_intervals(function, intervals, executor, max_workers, retries)
 
-def execute_bulk_between(function, time_start, time_end, time_delta=None):
+def execute_bulk_between(function, time_start, time_end, time_delta=None, executor=None, max_workers=None, retries=0):
     """
     Execute the given function multiple times, stepping through time as its parameter.
     Stops when `time_end` is reached.
 
+    See `run_intervals <#flight_processing.utils.run_intervals>`_ for the meaning of `executor`, `max_workers` and `retries`
+    and the format of the returned report.
+
     :param function: function to execute, must take 2 datetime arguments
     :type function: function
     :param time_start: start time
@@ -362,6 +505,15 @@ def execute_bulk_between(function, time_start, time_end, time_delta=None):
     :type time_end: datetime.datetime
     :param time_delta: amount by which to increase the time each step, defaults to datetime.timedelta(hours=1)
     :type time_delta: datetime.timedelta
+    :param executor: how to run the intervals, defaults to serially
+    :type executor: str or concurrent.futures.Executor, optional
+    :param max_workers: maximum number of threads or processes
+    :type max_workers: int, optional
+    :param retries: number of times to retry an interval which raises an exception, default 0
+    :type retries: int, optional
+
+    :return: status of each interval
+    :rtype: list(dict)
     """
 
     time_delta = time_delta if time_delta is not None else timedelta(hours=1)
@@ -369,13 +521,120 @@ def execute_bulk_between(function, time_start, time_end, time_delta=None):
 
     logger.info("Executing function {} times between {} and {} with time delta {}.".format(count, time_start, time_end, time_delta))
 
+    intervals = []
     t1 = time_start
     t2 = time_start + time_delta
     while t2 <= time_end:
-        function(t1, t2)
+        intervals.append((t1, t2))
         t1 += time_delta
         t2 += time_delta
 
+    return run_intervals(function, intervals, executor, max_workers, retries)
+
+def run_intervals(function, intervals, executor=None, max_workers=None, retries=0):
+    """
+    Execute the given function once for each interval, capturing errors rather than stopping at the first one.
+
+    `executor` may be:
+
+    - ``None`` or ``"serial"``, to run each interval in turn,
+    - ``"thread"``, to use a pool of threads,
+    - ``"process"``, to use a pool of forked processes (the function is inherited by each process rather than pickled, but its return value must be picklable),
+    - an existing `concurrent.futures.Executor`, which is used as-is and not shut down.
+
+    An interval which raises an exception is retried up to `retries` times.
+    The returned report holds a dictionary for each interval, in order, with the keys
+    `time_start`, `time_end`, `success`, `attempts`, `error` (the formatted exception of the last attempt, or None)
+    and `result` (the return value of the function, or None).
+
+    :param function: function to execute, must take 2 datetime arguments
+    :type function: function
+    :param intervals: start and end time of each interval
+    :type intervals: list(tuple(datetime.datetime, datetime.datetime))
+    :param executor: how to run the intervals, defaults to serially
+    :type executor: str or concurrent.futures.Executor, optional
+    :param max_workers: maximum number of threads or processes
+    :type max_workers: int, optional
+    :param retries: number of times to retry an interval which raises an exception, default 0
+    :type retries: int, optional
+
+    :return: status of each interval
+    :rtype: list(dict)
+    """
+
+    if executor is None or executor == "serial":
+        report = [attempt_interval(function, t1, t2, retries) for t1, t2 in intervals]
+    elif isinstance(executor, Executor):
+        futures = [executor.submit(attempt_interval, function, t1, t2, retries) for t1, t2 in intervals]
+        report = [future.result() for future in futures]
+    elif executor == "thread":
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            report = list(pool.map(lambda t: attempt_interval(function, t[0], t[1], retries), intervals))
+    elif executor == "process":
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise ValueError("Process executor requires the 'fork' start method, which is not available on this platform.")
+        # registered before the pool forks so that each worker inherits the function without pickling it,
+        # under a token of its own so that concurrent or nested calls do not replace each other's function
+        with _bulk_functions_lock:
+            token = next(_bulk_tokens)
+            _bulk_functions[token] = function
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                attempt = partial(_attempt_interval_forked, token)
+                report = list(pool.map(attempt, [t1 for t1, _ in intervals], [t2 for _, t2 in intervals], [retries] * len(intervals)))
+        finally:
+            with _bulk_functions_lock:
+                del _bulk_functions[token]
+    else:
+        raise ValueError("Argument 'executor' must be 'serial', 'thread', 'process' or a concurrent.futures.Executor.")
+
+    failed = [status for status in report if not status['success']]
+    if len(failed) > 0:
+        logger.error("{} of {} intervals failed: {}".format(len(failed), len(report), ", ".join(str(status['time_start']) for status in failed)))
+    else:
+        logger.info("All {} intervals completed successfully.".format(len(report)))
+
+    return report
+
+_bulk_functions = {}
+_bulk_functions_lock = threading.Lock()
+_bulk_tokens = itertools.count()
+
+def attempt_interval(function, time_start, time_end, retries=0):
+    """
+    Execute the given function for a single interval, retrying if it raises an exception.
+
+    :param function: function to execute, must take 2 datetime arguments
+    :type function: function
+    :param time_start: start time
+    :type time_start: datetime.datetime
+    :param time_end: end time
+    :type time_end: datetime.datetime
+    :param retries: number of times to retry, default 0
+    :type retries: int, optional
+
+    :return: status of the interval, as described in `run_intervals <#flight_processing.utils.run_intervals>`_
+    :rtype: dict
+    """
+
+    status = dict(time_start=time_start, time_end=time_end, success=False, attempts=0, error=None, result=None)
+
+    while status['attempts'] <= retries:
+        status['attempts'] += 1
+        try:
+            status['result'] = function(time_start, time_end)
+            status['success'] = True
+            status['error'] = None
+            break
+        except Exception:
+            status['error'] = traceback.format_exc()
+            logger.warning("Attempt {} for interval starting {} failed.".format(status['attempts'], time_start))
+
+    return status
+
+def _attempt_interval_forked(token, time_start, time_end, retries):
+    return attempt_interval(_bulk_functions[token], time_start, time_end, retries)
+
 def lerp(x, x1, x2, y1, y2):
     """
     Linearly interpolate between ``y1`` and ``y2`` according to the bounds of ``x1`` and ``x2``.
@@ -0,0 +1,38 @@
+#include "handovers.h"
+
+static uint64_t handover_key(int from, int to) {
+    return (((uint64_t) (uint32_t) from) << 32) | (uint64_t) (uint32_t) to;
+}
+
+void HandoverCounts::add(int from, int to, int count) {
+    counts[handover_key(from, to)] += count;
+}
+
+void HandoverCounts::merge(const HandoverCounts &other) {
+    for (auto const &kv : other.counts) {
+        counts[kv.first] += kv.second;
+    }
+}
+
+void HandoverCounts::clear() {
+    counts.clear();
+}
+
+long unsigned int HandoverCounts::nnz() const {
+    return counts.size();
+}
+
+void HandoverCounts::to_coo(vector<int> &rows, vector<int> &cols, vector<int> &values) const {
+    vector<pair<uint64_t, int>> sorted(counts.begin(), counts.end());
+    sort(sorted.begin(), sorted.end());
+
+    int n = sorted.size();
+    rows.resize(n);
+    cols.resize(n);
+    values.resize(n);
+    for (int i = 0; i < n; i++) {
+        rows[i] = (int) (sorted[i].first >> 32);
+        cols[i] = (int) (sorted[i].first & 0xffffffff);
+        values[i] = sorted[i].second;
+    }
+}
@@ -1,4 +1,5 @@
 #include "helpers.h"
+#include <cmath>
 
 void progress_bar(float progress, int barWidth) {
     std::cout << "[";
@@ -15,4 +16,8 @@ void progress_bar(float progress, int barWidth) {
 
 float metre_to_ft(float metres) {
     return metres * METRE_IN_FT;
-}
\ No newline at end of file
+}
+
+int metres_to_height_ft(double metres) {
+    return metre_to_ft(rint(metres));
+}
@@ -58,17 +58,15 @@ int main() {
     process_flights(flights, airspaces, id_max, out, true);
     */
 
-    int N = airspaces.size();
-    vector<vector<int>> out(N, vector<int> (N, 0));
+    HandoverCounts out;
 
     process_flights(flights, airspaces, out, true);
 
-    for (int i = 0; i < N; i++) {
-        for (int j = 0; j < N; j++) {
-            if (out[i][j] != 0) {
-                printf("%d, %d: %d\n", i, j, out[i][j]);
-            }
-        }
+    vector<int> rows, cols, counts;
+    out.to_coo(rows, cols, counts);
+
+    for (int k = 0; k < rows.size(); k++) {
+        printf("%d, %d: %d\n", rows[k], cols[k], counts[k]);
     }
 
     return 0;
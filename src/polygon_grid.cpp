@@ -0,0 +1,143 @@
+#include "polygon_grid.h"
+
+// cells not yet reached by the flood fill
+static const int8_t GRID_UNKNOWN = 2;
+
+// Liang-Barsky clip of segment ab against the box [xmin, xmax] x [ymin, ymax]
+static bool segment_intersects_box(double ax, double ay, double bx, double by, double xmin, double ymin, double xmax, double ymax) {
+    double t0 = 0, t1 = 1;
+    double ddx = bx - ax, ddy = by - ay;
+    double p[4] = {-ddx, ddx, -ddy, ddy};
+    double q[4] = {ax - xmin, xmax - ax, ay - ymin, ymax - ay};
+
+    for (int k = 0; k < 4; k++) {
+        if (p[k] == 0) {
+            if (q[k] < 0) return false;
+        } else {
+            double t = q[k] / p[k];
+            if (p[k] < 0) t0 = max(t0, t);
+            else t1 = min(t1, t);
+            if (t0 > t1) return false;
+        }
+    }
+    return true;
+}
+
+// Edges are geodesics rather than straight lines in longitude/latitude, so
+// may bulge away from the straight segment by up to this factor of its length
+// squared. Edges in projected coordinates are straight.
+static double edge_bulge(const point_xy &point) {
+    return 0.002;
+}
+
+static double edge_bulge(const planar_point &point) {
+    return 0;
+}
+
+template<typename MultiPolygon, typename Box>
+void PolygonGrid::build(const MultiPolygon &polygon, const Box &bounds) {
+    typedef typename bg::point_type<MultiPolygon>::type Point;
+
+    nx = 0;
+    ny = 0;
+    cells.clear();
+
+    int edges = bg::num_points(polygon);
+    if (edges < GRID_MIN_EDGES) {
+        return;
+    }
+
+    x0 = bg::get<bg::min_corner, 0>(bounds);
+    y0 = bg::get<bg::min_corner, 1>(bounds);
+    double width = bg::get<bg::max_corner, 0>(bounds) - x0;
+    double height = bg::get<bg::max_corner, 1>(bounds) - y0;
+    if (width <= 0 || height <= 0) {
+        return;
+    }
+
+    int n = min(GRID_MAX_CELLS, (int) ceil(2 * sqrt((double) edges)));
+    nx = n;
+    ny = n;
+    dx = width / nx;
+    dy = height / ny;
+    cells.assign(nx * ny, GRID_UNKNOWN);
+
+    for (auto const &poly : polygon) {
+        auto const &outer = poly.outer();
+        for (int k = 1; k < outer.size(); k++) {
+            mark_segment(outer[k-1], outer[k]);
+        }
+        for (auto const &inner : poly.inners()) {
+            for (int k = 1; k < inner.size(); k++) {
+                mark_segment(inner[k-1], inner[k]);
+            }
+        }
+    }
+
+    // No boundary passes through a run of connected non-boundary cells, so
+    // a single test of one cell centre labels the whole component.
+    vector<int> stack;
+    for (int start = 0; start < cells.size(); start++) {
+        if (cells[start] != GRID_UNKNOWN) continue;
+
+        Point centre(x0 + ((start % nx) + 0.5) * dx, y0 + ((start / nx) + 0.5) * dy);
+        int8_t label = bg::within(centre, polygon) ? GRID_INSIDE : GRID_OUTSIDE;
+
+        cells[start] = label;
+        stack.push_back(start);
+        while (!stack.empty()) {
+            int c = stack.back();
+            stack.pop_back();
+            int i = c % nx, j = c / nx;
+            int neighbours[4][2] = {{i-1, j}, {i+1, j}, {i, j-1}, {i, j+1}};
+            for (auto const &nb : neighbours) {
+                if (nb[0] < 0 || nb[0] >= nx || nb[1] < 0 || nb[1] >= ny) continue;
+                int d = nb[1] * nx + nb[0];
+                if (cells[d] == GRID_UNKNOWN) {
+                    cells[d] = label;
+                    stack.push_back(d);
+                }
+            }
+        }
+    }
+}
+
+template<typename Point>
+void PolygonGrid::mark_segment(const Point &a, const Point &b) {
+    double ax = a.x(), ay = a.y(), bx = b.x(), by = b.y();
+
+    // pad the segment by a bound on how far the edge can bulge away from it
+    double length = max(fabs(bx - ax), fabs(by - ay));
+    double pad = 1e-6 + edge_bulge(a) * length * length;
+
+    int i0 = max(0, (int) floor((min(ax, bx) - pad - x0) / dx));
+    int i1 = min(nx - 1, (int) floor((max(ax, bx) + pad - x0) / dx));
+    int j0 = max(0, (int) floor((min(ay, by) - pad - y0) / dy));
+    int j1 = min(ny - 1, (int) floor((max(ay, by) + pad - y0) / dy));
+
+    for (int j = j0; j <= j1; j++) {
+        for (int i = i0; i <= i1; i++) {
+            if (segment_intersects_box(ax, ay, bx, by,
+                    x0 + i * dx - pad, y0 + j * dy - pad,
+                    x0 + (i + 1) * dx + pad, y0 + (j + 1) * dy + pad)) {
+                cells[j * nx + i] = GRID_BOUNDARY;
+            }
+        }
+    }
+}
+
+bool PolygonGrid::built() {
+    return nx > 0;
+}
+
+int PolygonGrid::classify(double x, double y) {
+    int i = (int) floor((x - x0) / dx);
+    int j = (int) floor((y - y0) / dy);
+    if (i < 0 || i >= nx || j < 0 || j >= ny) {
+        return GRID_BOUNDARY;
+    }
+    return cells[j * nx + i];
+}
+
+template void PolygonGrid::build(const multi_polygon &polygon, const box &bounds);
+template void PolygonGrid::build(const planar_multi_polygon &polygon, const planar_box &bounds);
@@ -1,37 +1,135 @@
 #include "processing.h"
 
 
-vector<Flight> extract_flights(string location) {
-    ifstream flights_file(location);
-    json flights_json;
-    flights_file >> flights_json;
+FlightSaxHandler::FlightSaxHandler(function<void(Flight &)> callback) {
+    handle_flight = callback;
+}
 
-    vector<Flight> flights = vector<Flight>();
+bool FlightSaxHandler::null() {
+    coordinate_value(0, true);
+    return true;
+}
 
-    int N = flights_json["flights"].size();
-    for (int i = 0; i < N; i++) {
-        vector<float> xs = vector<float>();
-        vector<float> ys = vector<float>();
-        vector<int> hs = vector<int>();
-        
-        bool broken = false;
-
-        int M = flights_json["flights"][i].size();
-        for (int j = 0; j < M; j++) {
-            if (flights_json["flights"][i][j][2].is_null()) {
-                broken = true;
-                break;
-            }
+bool FlightSaxHandler::boolean(bool val) {
+    return true;
+}
 
-            xs.push_back(flights_json["flights"][i][j][0]);
-            ys.push_back(flights_json["flights"][i][j][1]);
-            hs.push_back((int) flights_json["flights"][i][j][2]);
-        }
+bool FlightSaxHandler::number_integer(number_integer_t val) {
+    coordinate_value((double) val, false);
+    return true;
+}
+
+bool FlightSaxHandler::number_unsigned(number_unsigned_t val) {
+    coordinate_value((double) val, false);
+    return true;
+}
+
+bool FlightSaxHandler::number_float(number_float_t val, const string_t &s) {
+    coordinate_value(val, false);
+    return true;
+}
+
+bool FlightSaxHandler::string(string_t &val) {
+    return true;
+}
+
+bool FlightSaxHandler::binary(binary_t &val) {
+    return true;
+}
+
+bool FlightSaxHandler::start_object(size_t elements) {
+    depth++;
+    return true;
+}
+
+bool FlightSaxHandler::key(string_t &val) {
+    if (depth == 1) {
+        flights_next = (val == "flights");
+    }
+    return true;
+}
+
+bool FlightSaxHandler::end_object() {
+    depth--;
+    return true;
+}
+
+bool FlightSaxHandler::start_array(size_t elements) {
+    if (depth == 1 && flights_next) {
+        in_flights = true;
+        flights_next = false;
+    } else if (in_flights && depth == 2) {
+        xs.clear();
+        ys.clear();
+        hs.clear();
+        broken = false;
+    } else if (in_flights && depth == 3) {
+        component = 0;
+        component_null = false;
+    }
+    depth++;
+    return true;
+}
 
+bool FlightSaxHandler::end_array() {
+    depth--;
+    if (in_flights && depth == 3) {
+        // any coordinate without a valid altitude discards the whole flight
+        if (component < 3 || component_null) {
+            broken = true;
+        } else if (!broken) {
+            xs.push_back(coordinate[0]);
+            ys.push_back(coordinate[1]);
+            hs.push_back((int) coordinate[2]);
+        }
+    } else if (in_flights && depth == 2) {
         if (!broken) {
-            flights.push_back(Flight(xs.size(), xs, ys, hs));
+            Flight flight(xs.size(), xs, ys, hs);
+            handle_flight(flight);
+        }
+    } else if (in_flights && depth == 1) {
+        in_flights = false;
+    }
+    return true;
+}
+
+bool FlightSaxHandler::parse_error(size_t position, const std::string &last_token, const nlohmann::detail::exception &ex) {
+    error = ex.what();
+    return false;
+}
+
+void FlightSaxHandler::coordinate_value(double val, bool is_null) {
+    if (!in_flights || depth != 4) {
+        return;
+    }
+    if (component < 3) {
+        if (is_null) {
+            component_null = true;
+        } else {
+            coordinate[component] = val;
         }
     }
+    component++;
+}
+
+void stream_flights(string location, function<void(Flight &)> handle_flight) {
+    ifstream flights_file(location);
+    if (!flights_file.is_open()) {
+        throw runtime_error("Could not open flights file " + location);
+    }
+
+    FlightSaxHandler handler(handle_flight);
+    if (!json::sax_parse(flights_file, &handler)) {
+        throw runtime_error("Could not parse flights file " + location + ": " + handler.error);
+    }
+}
+
+vector<Flight> extract_flights(string location) {
+    vector<Flight> flights = vector<Flight>();
+
+    stream_flights(location, [&flights](Flight &flight) {
+        flights.push_back(flight);
+    });
 
     return flights;
 }
@@ -62,15 +160,212 @@ void extract_airspaces_new(string location, MultiAirspace &airspaces) {
 }
 */
 
-void process_flights(vector<Flight> &flights, MultiAirspace &airspaces, vector<vector<int>> &out, bool progress) {
-    int num_flights = flights.size();
-    for (int i = 0; i < num_flights; i++) {
-        if (progress && i % 5 == 0) progress_bar((float) i / (float) num_flights);
-        airspaces.process_flight(flights[i], out);
+void parallel_for(int count, int num_threads, function<void(int, int)> work) {
+    if (num_threads <= 0) {
+        num_threads = default_num_threads();
+    }
+    num_threads = min(num_threads, max(count, 1));
+
+    if (num_threads == 1) {
+        for (int i = 0; i < count; i++) {
+            work(i, 0);
+        }
+        return;
+    }
+
+    // Work items vary wildly in size (e.g. flight lengths), so workers take the
+    // next unprocessed item from a shared counter rather than a fixed slice.
+    atomic<int> next(0);
+
+    // An exception escaping a thread would terminate the process, so the first one is kept,
+    // no further items are started and it is rethrown once every worker has finished.
+    exception_ptr error = nullptr;
+    mutex error_mutex;
+
+    auto worker = [&](int t) {
+        try {
+            int i;
+            while ((i = next.fetch_add(1)) < count) {
+                work(i, t);
+            }
+        } catch (...) {
+            lock_guard<mutex> lock(error_mutex);
+            if (!error) {
+                error = current_exception();
+            }
+            next = count;
+        }
+    };
+
+    vector<thread> threads;
+    for (int t = 1; t < num_threads; t++) {
+        threads.push_back(thread(worker, t));
+    }
+    worker(0);
+    for (int t = 0; t < threads.size(); t++) {
+        threads[t].join();
+    }
+
+    if (error) {
+        rethrow_exception(error);
+    }
+}
+
+void process_indexed(int count, int num_threads, HandoverCounts &out, bool progress, function<void(int, HandoverCounts &)> work) {
+    if (num_threads <= 0) {
+        num_threads = default_num_threads();
+    }
+    num_threads = min(num_threads, max(count, 1));
+
+    vector<HandoverCounts> partial(num_threads - 1);
+
+    parallel_for(count, num_threads, [&](int i, int t) {
+        if (progress && t == 0 && i % 5 == 0) progress_bar((float) i / (float) count);
+        work(i, (t == 0) ? out : partial[t - 1]);
+    });
+
+    for (int t = 0; t < partial.size(); t++) {
+        out.merge(partial[t]);
     }
 
     if (progress) {
         progress_bar(1.0);
         printf("\n");
     }
-}
\ No newline at end of file
+}
+
+void process_flights(vector<Flight> &flights, MultiAirspace &airspaces, HandoverCounts &out, bool progress, int num_threads) {
+    process_indexed(flights.size(), num_threads, out, progress, [&](int i, HandoverCounts &acc) {
+        airspaces.process_flight(flights[i], acc);
+    });
+}
+
+void process_flights_dump(FlightDump &dump, MultiAirspace &airspaces, HandoverCounts &out, int num_threads) {
+    process_indexed(dump.size(), num_threads, out, false, [&](int i, HandoverCounts &acc) {
+        if (dump.valid(i)) {
+            Flight flight = dump.flight(i);
+            airspaces.process_flight(flight, acc);
+        }
+    });
+}
+
+void process_flights_stream(string location, MultiAirspace &airspaces, HandoverCounts &out, int num_threads) {
+    if (num_threads <= 0) {
+        num_threads = default_num_threads();
+    }
+
+    if (num_threads == 1) {
+        // counted apart so that a file failing part way leaves the result untouched, as with threads
+        HandoverCounts counts;
+        stream_flights(location, [&](Flight &flight) {
+            airspaces.process_flight(flight, counts);
+        });
+        out.merge(counts);
+        return;
+    }
+
+    // The parser runs on this thread and hands flights to the workers through
+    // a bounded queue, so only a handful of flights are ever held in memory.
+    FlightQueue queue(4 * num_threads);
+    vector<HandoverCounts> partial(num_threads);
+
+    // A failing worker aborts the queue, which discards the waiting flights, wakes the parser
+    // if it is blocked on a full queue and stops it at the next flight.
+    exception_ptr worker_error = nullptr;
+    mutex error_mutex;
+
+    vector<thread> threads;
+    for (int t = 0; t < num_threads; t++) {
+        threads.push_back(thread([&, t]() {
+            try {
+                unique_ptr<Flight> flight;
+                while ((flight = queue.pop()) != nullptr) {
+                    airspaces.process_flight(*flight, partial[t]);
+                }
+            } catch (...) {
+                {
+                    lock_guard<mutex> lock(error_mutex);
+                    if (!worker_error) {
+                        worker_error = current_exception();
+                    }
+                }
+                queue.abort();
+            }
+        }));
+    }
+
+    exception_ptr error = nullptr;
+    try {
+        stream_flights(location, [&queue](Flight &flight) {
+            if (!queue.push(unique_ptr<Flight>(new Flight(flight)))) {
+                throw runtime_error("Flight processing was aborted.");
+            }
+        });
+    } catch (...) {
+        error = current_exception();
+    }
+
+    queue.close();
+    for (int t = 0; t < threads.size(); t++) {
+        threads[t].join();
+    }
+
+    // the parser only fails because of an aborted queue if a worker failed first
+    if (worker_error) {
+        rethrow_exception(worker_error);
+    }
+    if (error) {
+        rethrow_exception(error);
+    }
+
+    for (int t = 0; t < partial.size(); t++) {
+        out.merge(partial[t]);
+    }
+}
+
+FlightQueue::FlightQueue(int cap) {
+    capacity = cap;
+}
+
+bool FlightQueue::push(unique_ptr<Flight> flight) {
+    unique_lock<mutex> lock(m);
+    not_full.wait(lock, [this]() { return items.size() < capacity || aborted; });
+    if (aborted) {
+        return false;
+    }
+    items.push_back(move(flight));
+    not_empty.notify_one();
+    return true;
+}
+
+unique_ptr<Flight> FlightQueue::pop() {
+    unique_lock<mutex> lock(m);
+    not_empty.wait(lock, [this]() { return !items.empty() || closed; });
+    if (items.empty()) {
+        return nullptr;
+    }
+    unique_ptr<Flight> flight = move(items.front());
+    items.pop_front();
+    not_full.notify_one();
+    return flight;
+}
+
+void FlightQueue::close() {
+    lock_guard<mutex> lock(m);
+    closed = true;
+    not_empty.notify_all();
+}
+
+void FlightQueue::abort() {
+    lock_guard<mutex> lock(m);
+    closed = true;
+    aborted = true;
+    items.clear();
+    not_empty.notify_all();
+    not_full.notify_all();
+}
+
+int default_num_threads() {
+    int n = thread::hardware_concurrency();
+    return n > 0 ? n : 1;
+}
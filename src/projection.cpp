@@ -0,0 +1,51 @@
+#include "projection.h"
+
+#include <boost/geometry/srs/projection.hpp>
+
+#include <limits>
+
+struct Projection::Impl {
+    Impl(string definition) : projection(bg::srs::proj4(definition)) {}
+    bg::srs::projection<> projection;
+};
+
+Projection::Projection(string def) {
+    try {
+        impl = make_shared<const Impl>(def);
+    } catch (exception &e) {
+        throw runtime_error("Invalid projection \"" + def + "\": " + e.what());
+    }
+    definition = def;
+}
+
+planar_point Projection::forward(const point_xy &point) const {
+    planar_point out;
+    try {
+        impl->projection.forward(point, out);
+    } catch (bg::projection_exception &e) {
+        // outside the domain of the projection, so inside no airspace and at an unknown distance from all of them
+        double nan = numeric_limits<double>::quiet_NaN();
+        out = planar_point(nan, nan);
+    }
+    return out;
+}
+
+void Projection::forward(const multi_polygon &shape, planar_multi_polygon &out) const {
+    auto project_ring = [&](const polygon_ring &ring, planar_ring &out_ring) {
+        out_ring.clear();
+        out_ring.reserve(ring.size());
+        for (auto const &point : ring) {
+            out_ring.push_back(forward(point));
+        }
+    };
+
+    out.clear();
+    out.resize(shape.size());
+    for (int g = 0; g < shape.size(); g++) {
+        project_ring(shape[g].outer(), out[g].outer());
+        out[g].inners().resize(shape[g].inners().size());
+        for (int r = 0; r < shape[g].inners().size(); r++) {
+            project_ring(shape[g].inners()[r], out[g].inners()[r]);
+        }
+    }
+}
@@ -1,6 +1,6 @@
 #include "python_out.h"
 
-AirspaceHandler::AirspaceHandler() {
+AirspaceHandler::AirspaceHandler(bool polygon_grid) : airspaces(polygon_grid) {
 }
 
 int AirspaceHandler::size() {
@@ -9,7 +9,7 @@ int AirspaceHandler::size() {
 
 void AirspaceHandler::reset_result() {
     N = airspaces.size();
-    result = vector<vector<int>>(N, vector<int>(N, 0));
+    result.clear();
 
     ready = true;
 }
@@ -33,36 +33,129 @@ int AirspaceHandler::add_airspaces_file(string location) {
     return airspaces.add_airspaces_file(location);
 }
 
-py::list AirspaceHandler::process_single_flight(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs) {
-    py::list py_output;
+int AirspaceHandler::add_airspaces(py::object wkbs, np::ndarray &lower, np::ndarray &upper, int num_threads) {
+    if (ready) {
+        printf("Error: All airspaces must be added before processing begins.\n");
+        return -1;
+    }
 
-    int n = xs.shape(0);
-    if (ys.shape(0) != n || hs.shape(0) != n) {
+    // any iterable of WKB (e.g. a generator) is held as a list or tuple for the whole parse,
+    // which keeps each bytes object alive while its buffer is read without the GIL
+    py::object items(py::handle<>(PySequence_Fast(wkbs.ptr(), "Airspaces must be given as an iterable of WKB bytes.")));
+    int n = PySequence_Fast_GET_SIZE(items.ptr());
+    if (lower.shape(0) != n || upper.shape(0) != n) {
         printf("Error: Mismatch in array lengths.\n");
-        return py_output;
+        return -1;
     }
-    if (xs.get_dtype() != np::dtype::get_builtin<double>()
-    || ys.get_dtype() != np::dtype::get_builtin<double>()
-    || hs.get_dtype() != np::dtype::get_builtin<double>()) {
+    if (lower.get_dtype() != np::dtype::get_builtin<int>()
+    || upper.get_dtype() != np::dtype::get_builtin<int>()) {
         printf("Error: incorrect array type.\n");
-        return py_output;
+        return -1;
     }
 
-    double* xs_ptr = reinterpret_cast<double*>(xs.get_data());
-    double* ys_ptr = reinterpret_cast<double*>(ys.get_data());
-    double* hs_ptr = reinterpret_cast<double*>(hs.get_data());
-    vector<float> v_xs(n);
-    vector<float> v_ys(n);
-    vector<int> v_hs(n);
+    vector<char *> data(n, nullptr);
+    vector<Py_ssize_t> lengths(n, 0);
+    for (int i = 0; i < n; i++) {
+        PyObject *item = PySequence_Fast_GET_ITEM(items.ptr(), i);
+        if (item == Py_None) {
+            continue;
+        }
+        if (!PyBytes_Check(item)) {
+            printf("Error: Airspace %d is not given as WKB bytes.\n", i);
+            return -1;
+        }
+        PyBytes_AsStringAndSize(item, &data[i], &lengths[i]);
+    }
+
+    int* lower_ptr = reinterpret_cast<int*>(lower.get_data());
+    int* upper_ptr = reinterpret_cast<int*>(upper.get_data());
+
+    ScopedGILRelease release;
+
+    // missing geometries are left empty, as an empty WKT string would be
+    vector<multi_polygon> shapes(n);
+    vector<char> valid(n, 1);
+    parallel_for(n, num_threads, [&](int i, int t) {
+        if (data[i] != nullptr) {
+            valid[i] = read_wkb(reinterpret_cast<const unsigned char *>(data[i]), lengths[i], shapes[i]);
+        }
+    });
+
+    for (int i = 0; i < n; i++) {
+        if (!valid[i]) {
+            printf("Error: Airspace %d is not a valid WKB polygon or multipolygon.\n", i);
+            return -1;
+        }
+    }
 
+    vector<AirspaceBoost> new_airspaces;
+    new_airspaces.reserve(n);
     for (int i = 0; i < n; i++) {
-        v_xs[i] = (float) (*(xs_ptr + i));
-        v_ys[i] = (float) (*(ys_ptr + i));
-        v_hs[i] = metre_to_ft(rint(*(hs_ptr + i)));
+        new_airspaces.push_back(AirspaceBoost(move(shapes[i]), lower_ptr[i], upper_ptr[i]));
+    }
+
+    airspaces.add_airspaces(new_airspaces, num_threads);
+    return n;
+}
+
+int AirspaceHandler::save_index(string location) {
+    airspaces.save_index(location);
+    return airspaces.size();
+}
+
+int AirspaceHandler::load_index(string location) {
+    if (ready) {
+        printf("Error: All airspaces must be added before processing begins.\n");
+        return -1;
+    }
+    if (airspaces.size() > 0) {
+        printf("Error: An index can only be loaded before any airspaces are added.\n");
+        return -1;
+    }
+
+    ScopedGILRelease release;
+    return airspaces.load_index(location);
+}
+
+// A one-dimensional array read in place as a column of coordinates. Arrays which are not float32 or float64
+// are converted to float64 first, and whichever array is read is kept alive with the column.
+struct ArrayColumn {
+    ArrayColumn(np::ndarray &a) : array(a) {
+        if (array.get_dtype() == np::dtype::get_builtin<float>()) {
+            column = FlightColumn(reinterpret_cast<const float*>(array.get_data()), array.strides(0));
+        } else {
+            if (array.get_dtype() != np::dtype::get_builtin<double>()) {
+                array = array.astype(np::dtype::get_builtin<double>());
+            }
+            column = FlightColumn(reinterpret_cast<const double*>(array.get_data()), array.strides(0));
+        }
+    }
+    np::ndarray array;
+    FlightColumn column;
+};
+
+static bool check_flight_arrays(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs) {
+    if (xs.get_nd() != 1 || ys.get_nd() != 1 || hs.get_nd() != 1) {
+        printf("Error: incorrect array shape.\n");
+        return false;
+    }
+    long n = xs.shape(0);
+    if (ys.shape(0) != n || hs.shape(0) != n) {
+        printf("Error: Mismatch in array lengths.\n");
+        return false;
+    }
+    return true;
+}
+
+py::list AirspaceHandler::process_single_flight(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs) {
+    py::list py_output;
+
+    if (!check_flight_arrays(xs, ys, hs)) {
+        return py_output;
     }
 
-    Flight flight(v_xs.size(), v_xs, v_ys, v_hs);
-    //vector<pair<int, int>> output;
+    ArrayColumn c_xs(xs), c_ys(ys), c_hs(hs);
+    Flight flight(xs.shape(0), c_xs.column, c_ys.column, c_hs.column);
     vector<pair<int, int>> output = airspaces.process_single_flight(flight);
 
     for (int i = 0; i < output.size(); i++) {
@@ -80,60 +173,72 @@ void AirspaceHandler::process_flight(np::ndarray &xs, np::ndarray &ys, np::ndarr
         reset_result();
     }
 
-    int n = xs.shape(0);
-    if (ys.shape(0) != n || hs.shape(0) != n) {
-        printf("Error: Mismatch in array lengths.\n");
-        return;
-    }
-    if (xs.get_dtype() != np::dtype::get_builtin<double>()
-    || ys.get_dtype() != np::dtype::get_builtin<double>()
-    || hs.get_dtype() != np::dtype::get_builtin<double>()) {
-        printf("Error: incorrect array type.\n");
+    if (!check_flight_arrays(xs, ys, hs)) {
         return;
     }
 
-    double* xs_ptr = reinterpret_cast<double*>(xs.get_data());
-    double* ys_ptr = reinterpret_cast<double*>(ys.get_data());
-    double* hs_ptr = reinterpret_cast<double*>(hs.get_data());
-    vector<float> v_xs(n);
-    vector<float> v_ys(n);
-    vector<int> v_hs(n);
+    ArrayColumn c_xs(xs), c_ys(ys), c_hs(hs);
+    Flight flight(xs.shape(0), c_xs.column, c_ys.column, c_hs.column);
+    airspaces.process_flight(flight, result);
+}
 
-    for (int i = 0; i < n; i++) {
-        v_xs[i] = (float) (*(xs_ptr + i));
-        v_ys[i] = (float) (*(ys_ptr + i));
-        v_hs[i] = metre_to_ft(rint(*(hs_ptr + i)));
-    }
+// Export handover counts as (rows, cols, counts) arrays.
+static py::tuple counts_to_sparse(const HandoverCounts &counts) {
+    np::dtype dtype = np::dtype::get_builtin<int>();
 
-    Flight flight(v_xs.size(), v_xs, v_ys, v_hs);
-    airspaces.process_flight(flight, result);
+    vector<int> rows, cols, values;
+    counts.to_coo(rows, cols, values);
+
+    int n = rows.size();
+    py::tuple shape = py::make_tuple(n);
+    np::ndarray rows_out = np::empty(shape, dtype);
+    np::ndarray cols_out = np::empty(shape, dtype);
+    np::ndarray counts_out = np::empty(shape, dtype);
+
+    copy(rows.begin(), rows.end(), reinterpret_cast<int*>(rows_out.get_data()));
+    copy(cols.begin(), cols.end(), reinterpret_cast<int*>(cols_out.get_data()));
+    copy(values.begin(), values.end(), reinterpret_cast<int*>(counts_out.get_data()));
+
+    return py::make_tuple(rows_out, cols_out, counts_out);
+}
 
-    //assert(flight.shape(1) == 3);
-    //assert(flight.get_dtype() == np::dtype::get_builtin<double>());
+// Count the handovers of every flight in a flight dump, binary or JSON, with the GIL released.
+static void count_file(MultiAirspace &airspaces, string location, HandoverCounts &out, int num_threads) {
+    ScopedGILRelease release;
 
-    //int stride0 = flight.strides(0);
-    //int stride1 = flight.strides(1);
+    if (is_flight_dump(location)) {
+        FlightDump dump(location);
+        process_flights_dump(dump, airspaces, out, num_threads);
+    } else {
+        process_flights_stream(location, airspaces, out, num_threads);
+    }
 }
 
-void AirspaceHandler::process_flights_file(string location) {
+void AirspaceHandler::process_flights_file(string location, int num_threads) {
     if (!ready) {
         reset_result();
     }
 
-    vector<Flight> flights = extract_flights(location);
-    process_flights(flights, airspaces, result);
+    count_file(airspaces, location, result, num_threads);
 }
 
-py::list AirspaceHandler::airspaces_at_point(float x, float y, int height, bool ft) {
+py::tuple AirspaceHandler::count_flights_file(string location, int num_threads) {
     if (!ready) {
         reset_result();
     }
 
-    float height2 = (float) height;
-    if (!ft) {
-        height2 = metre_to_ft(height2);
+    HandoverCounts counts;
+    count_file(airspaces, location, counts, num_threads);
+    return counts_to_sparse(counts);
+}
+
+py::list AirspaceHandler::airspaces_at_point(float x, float y, int height, bool ft) {
+    if (!ready) {
+        reset_result();
     }
 
+    float height2 = ft ? (float) height : (float) metres_to_height_ft(height);
+
     vector<int> output = airspaces.query_point(x, y, height2);
 
     py::list py_output;
@@ -145,17 +250,14 @@ py::list AirspaceHandler::airspaces_at_point(float x, float y, int height, bool
     return py_output;
 }
 
-py::list AirspaceHandler::airspaces_near_point(float x, float y, int height, bool ft) {
+py::list AirspaceHandler::airspaces_near_point(float x, float y, int height, bool ft, int k, float max_distance_ft) {
     if (!ready) {
         reset_result();
     }
 
-    float height2 = (float) height;
-    if (!ft) {
-        height2 = metre_to_ft(height2);
-    }
+    float height2 = ft ? (float) height : (float) metres_to_height_ft(height);
 
-    vector<pair<int, float>> output = airspaces.airspaces_near_point(x, y, height2);
+    vector<pair<int, float>> output = airspaces.airspaces_near_point(x, y, height2, k, max_distance_ft);
 
     py::list py_output;
 
@@ -168,10 +270,283 @@ py::list AirspaceHandler::airspaces_near_point(float x, float y, int height, boo
     //return vector_to_list(output);
 }
 
+// Read a one-dimensional array of any numeric type as doubles.
+static vector<double> array_to_vector(np::ndarray &a) {
+    np::ndarray a64 = a.astype(np::dtype::get_builtin<double>());
+    double *ptr = reinterpret_cast<double*>(a64.get_data());
+    return vector<double>(ptr, ptr + a64.shape(0));
+}
+
+// Flatten per-point results into CSR-style offsets and values.
+template<class T>
+static void flatten_results(vector<vector<T>> &results, vector<long> &offsets, vector<T> &values) {
+    offsets.assign(results.size() + 1, 0);
+    for (int i = 0; i < results.size(); i++) {
+        offsets[i+1] = offsets[i] + results[i].size();
+    }
+    values.clear();
+    values.reserve(offsets.back());
+    for (int i = 0; i < results.size(); i++) {
+        values.insert(values.end(), results[i].begin(), results[i].end());
+    }
+}
+
+// Check flat coordinate arrays and the offsets splitting them into flights,
+// copying the offsets out. Prints an error and returns false if they do not match.
+static bool read_flight_offsets(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &offsets, vector<long> &out) {
+    if (!check_flight_arrays(xs, ys, hs)) {
+        return false;
+    }
+    long n = xs.shape(0);
+    if (offsets.shape(0) < 1) {
+        printf("Error: Mismatch in array lengths.\n");
+        return false;
+    }
+
+    np::ndarray offsets64 = offsets.astype(np::dtype::get_builtin<long>());
+    const long *offsets_ptr = reinterpret_cast<long*>(offsets64.get_data());
+    out.assign(offsets_ptr, offsets_ptr + offsets64.shape(0));
+
+    for (int i = 0; i + 1 < out.size(); i++) {
+        if (out[i] < 0 || out[i] > out[i+1] || out[i+1] > n) {
+            printf("Error: Invalid flight offsets.\n");
+            return false;
+        }
+    }
+    return true;
+}
+
+py::tuple AirspaceHandler::process_flights_batch(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &offsets, int num_threads) {
+    vector<long> v_offsets;
+    if (!read_flight_offsets(xs, ys, hs, offsets, v_offsets)) {
+        return py::make_tuple(vector_to_array(vector<long>(1, 0)), vector_to_array(vector<int>()), vector_to_array(vector<int>()));
+    }
+    int count = v_offsets.size() - 1;
+    const long *offsets_ptr = v_offsets.data();
+
+    ArrayColumn c_xs(xs), c_ys(ys), c_hs(hs);
+
+    vector<long> handover_offsets;
+    vector<pair<int, int>> handovers;
+
+    {
+        ScopedGILRelease release;
+
+        // one result list per flight, each filled exactly as process_single_flight would
+        vector<vector<pair<int, int>>> results(count);
+        parallel_for(count, num_threads, [&](int i, int t) {
+            long start = offsets_ptr[i];
+            long end = offsets_ptr[i+1];
+            Flight flight(end - start, c_xs.column.from(start), c_ys.column.from(start), c_hs.column.from(start));
+            results[i] = airspaces.process_single_flight(flight);
+        });
+
+        flatten_results(results, handover_offsets, handovers);
+    }
+
+    vector<int> from(handovers.size());
+    vector<int> to(handovers.size());
+    for (int i = 0; i < handovers.size(); i++) {
+        from[i] = handovers[i].first;
+        to[i] = handovers[i].second;
+    }
+
+    return py::make_tuple(vector_to_array(handover_offsets), vector_to_array(from), vector_to_array(to));
+}
+
+// Count the handovers of flights held in flat arrays, with the GIL released. Flights are built exactly
+// as they would be read back from a binary flight dump, and any flight with an unknown altitude is skipped.
+static bool count_arrays(MultiAirspace &airspaces, np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &offsets, HandoverCounts &out, int num_threads) {
+    vector<long> v_offsets;
+    if (!read_flight_offsets(xs, ys, hs, offsets, v_offsets)) {
+        return false;
+    }
+    int count = v_offsets.size() - 1;
+
+    ArrayColumn c_xs(xs), c_ys(ys), c_hs(hs);
+
+    ScopedGILRelease release;
+
+    process_indexed(count, num_threads, out, false, [&](int i, HandoverCounts &acc) {
+        long start = v_offsets[i];
+        long end = v_offsets[i+1];
+
+        for (long j = start; j < end; j++) {
+            if (isnan((float) c_hs.column[j])) {
+                return;
+            }
+        }
+
+        Flight flight(end - start, c_xs.column.from(start), c_ys.column.from(start), c_hs.column.from(start), false);
+        airspaces.process_flight(flight, acc);
+    });
+    return true;
+}
+
+void AirspaceHandler::process_flights_arrays(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &offsets, int num_threads) {
+    if (!ready) {
+        reset_result();
+    }
+
+    count_arrays(airspaces, xs, ys, hs, offsets, result, num_threads);
+}
+
+py::tuple AirspaceHandler::count_flights_arrays(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &offsets, int num_threads) {
+    if (!ready) {
+        reset_result();
+    }
+
+    HandoverCounts counts;
+    count_arrays(airspaces, xs, ys, hs, offsets, counts, num_threads);
+    return counts_to_sparse(counts);
+}
+
+py::tuple AirspaceHandler::airspaces_at_points(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, bool ft, int num_threads) {
+    if (!ready) {
+        reset_result();
+    }
+
+    int n = xs.shape(0);
+    if (ys.shape(0) != n || hs.shape(0) != n) {
+        printf("Error: Mismatch in array lengths.\n");
+        return py::make_tuple(vector_to_array(vector<long>(1, 0)), vector_to_array(vector<int>()));
+    }
+
+    vector<double> v_xs = array_to_vector(xs);
+    vector<double> v_ys = array_to_vector(ys);
+    vector<double> v_hs = array_to_vector(hs);
+
+    vector<long> offsets;
+    vector<int> ids;
+
+    {
+        ScopedGILRelease release;
+
+        vector<vector<int>> results(n);
+        parallel_for(n, num_threads, [&](int i, int t) {
+            float height = ft ? (float) (int) v_hs[i] : (float) metres_to_height_ft(v_hs[i]);
+            results[i] = airspaces.query_point(v_xs[i], v_ys[i], height);
+        });
+
+        flatten_results(results, offsets, ids);
+    }
+
+    return py::make_tuple(vector_to_array(offsets), vector_to_array(ids));
+}
+
+py::tuple AirspaceHandler::airspaces_near_points(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, int k, bool ft, int num_threads, float max_distance_ft) {
+    if (!ready) {
+        reset_result();
+    }
+
+    int n = xs.shape(0);
+    if (ys.shape(0) != n || hs.shape(0) != n) {
+        printf("Error: Mismatch in array lengths.\n");
+        return py::make_tuple(vector_to_array(vector<long>(1, 0)), vector_to_array(vector<int>()), vector_to_array(vector<float>()));
+    }
+
+    vector<double> v_xs = array_to_vector(xs);
+    vector<double> v_ys = array_to_vector(ys);
+    vector<double> v_hs = array_to_vector(hs);
+
+    vector<long> offsets;
+    vector<int> ids;
+    vector<float> distances;
+
+    {
+        ScopedGILRelease release;
+
+        vector<vector<pair<int, float>>> results(n);
+        parallel_for(n, num_threads, [&](int i, int t) {
+            float height = ft ? (float) (int) v_hs[i] : (float) metres_to_height_ft(v_hs[i]);
+            results[i] = airspaces.airspaces_near_point(v_xs[i], v_ys[i], height, k, max_distance_ft);
+        });
+
+        vector<pair<int, float>> pairs;
+        flatten_results(results, offsets, pairs);
+
+        ids.resize(pairs.size());
+        distances.resize(pairs.size());
+        for (int i = 0; i < pairs.size(); i++) {
+            ids[i] = pairs[i].first;
+            distances[i] = pairs[i].second;
+        }
+    }
+
+    return py::make_tuple(vector_to_array(offsets), vector_to_array(ids), vector_to_array(distances));
+}
+
 float AirspaceHandler::distance_to_airspace(float x, float y, int height, int id) {
     return airspaces.distance_to_airspace(x, y, height, id);
 }
 
+np::ndarray AirspaceHandler::distances_to_airspaces(np::ndarray &xs, np::ndarray &ys, np::ndarray &hs, np::ndarray &ids, bool outer, int num_threads) {
+    int n = xs.shape(0);
+    int m = ids.shape(0);
+    if (ys.shape(0) != n || hs.shape(0) != n || (!outer && m != n)) {
+        printf("Error: Mismatch in array lengths.\n");
+        return np::zeros(py::make_tuple(0), np::dtype::get_builtin<float>());
+    }
+
+    vector<double> v_xs = array_to_vector(xs);
+    vector<double> v_ys = array_to_vector(ys);
+    vector<double> v_hs = array_to_vector(hs);
+    np::ndarray ids32 = ids.astype(np::dtype::get_builtin<int>());
+    const int *ids_ptr = reinterpret_cast<int*>(ids32.get_data());
+
+    // pairwise: distance from point i to airspace ids[i]
+    // outer: distance from point i to every airspace in ids, as row i
+    py::tuple shape = outer ? py::make_tuple(n, m) : py::make_tuple(n);
+    np::ndarray output = np::empty(shape, np::dtype::get_builtin<float>());
+    float *out_ptr = reinterpret_cast<float*>(output.get_data());
+
+    {
+        ScopedGILRelease release;
+
+        parallel_for(n, num_threads, [&](int i, int t) {
+            if (outer) {
+                airspaces.distances_to_airspaces(v_xs[i], v_ys[i], v_hs[i], ids_ptr, m, out_ptr + (long) i * m);
+            } else {
+                airspaces.distances_to_airspaces(v_xs[i], v_ys[i], v_hs[i], ids_ptr + i, 1, out_ptr + i);
+            }
+        });
+    }
+
+    return output;
+}
+
+void AirspaceHandler::set_temporal_coherence(bool enabled) {
+    airspaces.set_temporal_coherence(enabled);
+}
+
+int AirspaceHandler::set_projection(py::object definition, int num_threads) {
+    if (ready) {
+        printf("Error: The projection must be set before processing begins.\n");
+        return -1;
+    }
+
+    string text = definition.is_none() ? string() : py::extract<string>(definition)();
+
+    shared_ptr<const Projection> projection;
+    if (!text.empty()) {
+        try {
+            projection = make_shared<const Projection>(text);
+        } catch (runtime_error &e) {
+            printf("Error: %s\n", e.what());
+            return -1;
+        }
+    }
+
+    ScopedGILRelease release;
+    airspaces.set_projection(projection, num_threads);
+    return airspaces.size();
+}
+
+string AirspaceHandler::get_projection() {
+    shared_ptr<const Projection> projection = airspaces.get_projection();
+    return projection ? projection->definition : "";
+}
+
 np::ndarray AirspaceHandler::get_result() {
     if (!ready) {
         printf("Error: Processing has not yet begun.\n");
@@ -195,23 +570,28 @@ np::ndarray AirspaceHandler::get_result() {
     //return output.copy();
 
     np::ndarray output = np::zeros(shape, dtype);
+    int *p = reinterpret_cast<int*>(output.get_data());
 
-    PyObject* pobj = output.ptr();
-    Py_buffer pybuf;
-    PyObject_GetBuffer(pobj, &pybuf, PyBUF_SIMPLE);
-    void *buf = pybuf.buf;
-    int *p = (int*)buf;
-    Py_XDECREF(pobj);
+    vector<int> rows, cols, counts;
+    result.to_coo(rows, cols, counts);
 
-    for (int i = 0; i < N; i++) {
-        for (int j = 0; j < N; j++) {
-            p[i*N+j] = result[i][j];
-        }
+    for (int k = 0; k < rows.size(); k++) {
+        p[rows[k]*N+cols[k]] = counts[k];
     }
 
     return output;
 }
 
+py::tuple AirspaceHandler::get_result_sparse() {
+    if (!ready) {
+        printf("Error: Processing has not yet begun.\n");
+        np::ndarray empty = np::zeros(py::make_tuple(0), np::dtype::get_builtin<int>());
+        return py::make_tuple(empty, empty.copy(), empty.copy());
+    }
+
+    return counts_to_sparse(result);
+}
+
 /*
 py::object get_flight() {
     py::object traffic = py::import("traffic.data");
@@ -226,21 +606,51 @@ BOOST_PYTHON_MODULE(process_flights)
 
     //py::scope().attr("version") = version;;
 
+    // the conversion used for every height given in metres, for Python code to share
+    py::scope().attr("METRE_IN_FT") = METRE_IN_FT;
+
     // Add regular functions to the module.
     //py::def("get_flight", get_flight);
 
     // Expose class
-    py::class_<AirspaceHandler>("AirspaceHandler")
+    py::class_<AirspaceHandler>("AirspaceHandler", py::init<bool>((py::arg("polygon_grid")=true)))
         .def("add_airspace", &AirspaceHandler::add_airspace)
         .def("add_airspaces_file", &AirspaceHandler::add_airspaces_file)
+        .def("add_airspaces", &AirspaceHandler::add_airspaces,
+            (py::arg("wkbs"), py::arg("lower"), py::arg("upper"), py::arg("num_threads")=0))
+        .def("save_index", &AirspaceHandler::save_index)
+        .def("load_index", &AirspaceHandler::load_index)
         .def("process_single_flight", &AirspaceHandler::process_single_flight)
+        .def("process_flights_batch", &AirspaceHandler::process_flights_batch,
+            (py::arg("xs"), py::arg("ys"), py::arg("hs"), py::arg("offsets"), py::arg("num_threads")=0))
+        .def("process_flights_arrays", &AirspaceHandler::process_flights_arrays,
+            (py::arg("xs"), py::arg("ys"), py::arg("hs"), py::arg("offsets"), py::arg("num_threads")=0))
         .def("process_flight", &AirspaceHandler::process_flight)
-        .def("process_flights_file", &AirspaceHandler::process_flights_file)
+        .def("process_flights_file", &AirspaceHandler::process_flights_file,
+            (py::arg("location"), py::arg("num_threads")=0))
+        .def("count_flights_file", &AirspaceHandler::count_flights_file,
+            (py::arg("location"), py::arg("num_threads")=0))
+        .def("count_flights_arrays", &AirspaceHandler::count_flights_arrays,
+            (py::arg("xs"), py::arg("ys"), py::arg("hs"), py::arg("offsets"), py::arg("num_threads")=0))
         .def("airspaces_at_point", &AirspaceHandler::airspaces_at_point)
-        .def("airspaces_near_point", &AirspaceHandler::airspaces_near_point)
+        .def("airspaces_near_point", &AirspaceHandler::airspaces_near_point,
+            (py::arg("x"), py::arg("y"), py::arg("height"), py::arg("ft")=true, py::arg("k")=5,
+            py::arg("max_distance_ft")=numeric_limits<float>::infinity()))
+        .def("airspaces_at_points", &AirspaceHandler::airspaces_at_points,
+            (py::arg("xs"), py::arg("ys"), py::arg("hs"), py::arg("ft")=true, py::arg("num_threads")=0))
+        .def("airspaces_near_points", &AirspaceHandler::airspaces_near_points,
+            (py::arg("xs"), py::arg("ys"), py::arg("hs"), py::arg("k")=5, py::arg("ft")=true, py::arg("num_threads")=0,
+            py::arg("max_distance_ft")=numeric_limits<float>::infinity()))
         .def("distance_to_airspace", &AirspaceHandler::distance_to_airspace)
+        .def("distances_to_airspaces", &AirspaceHandler::distances_to_airspaces,
+            (py::arg("xs"), py::arg("ys"), py::arg("hs"), py::arg("ids"), py::arg("outer")=false, py::arg("num_threads")=0))
+        .def("set_temporal_coherence", &AirspaceHandler::set_temporal_coherence)
+        .def("set_projection", &AirspaceHandler::set_projection,
+            (py::arg("definition"), py::arg("num_threads")=0))
+        .def("get_projection", &AirspaceHandler::get_projection)
         .def("reset_result", &AirspaceHandler::reset_result)
         .def("get_result", &AirspaceHandler::get_result)
+        .def("get_result_sparse", &AirspaceHandler::get_result_sparse)
         .def("size", &AirspaceHandler::size)
         ;
 }
\ No newline at end of file
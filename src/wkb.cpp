@@ -0,0 +1,172 @@
+#include "wkb.h"
+
+#define WKB_POLYGON 3
+#define WKB_MULTIPOLYGON 6
+
+#define EWKB_Z 0x80000000u
+#define EWKB_M 0x40000000u
+#define EWKB_SRID 0x20000000u
+
+namespace {
+
+class WkbReader {
+public:
+    WkbReader(const unsigned char *data, size_t length) : pos(data), end(data + length) {}
+
+    bool byte_order() {
+        if (pos == end || *pos > 1) {
+            return false;
+        }
+        little_endian = *pos == 1;
+        pos++;
+        return true;
+    }
+
+    bool u32(uint32_t &value) {
+        return read(&value, sizeof(uint32_t));
+    }
+
+    bool f64(double &value) {
+        return read(&value, sizeof(double));
+    }
+
+    bool skip(size_t bytes) {
+        if ((size_t) (end - pos) < bytes) {
+            return false;
+        }
+        pos += bytes;
+        return true;
+    }
+
+    bool at_end() {
+        return pos == end;
+    }
+
+    size_t remaining() {
+        return end - pos;
+    }
+
+private:
+    bool read(void *value, size_t size) {
+        if ((size_t) (end - pos) < size) {
+            return false;
+        }
+        unsigned char buffer[8];
+        memcpy(buffer, pos, size);
+        if (little_endian != host_little_endian()) {
+            reverse(buffer, buffer + size);
+        }
+        memcpy(value, buffer, size);
+        pos += size;
+        return true;
+    }
+
+    static bool host_little_endian() {
+        uint16_t one = 1;
+        return *reinterpret_cast<unsigned char *>(&one) == 1;
+    }
+
+    const unsigned char *pos, *end;
+    bool little_endian = true;
+};
+
+// reads a geometry header, giving the base type and the number of ordinates per point
+bool read_header(WkbReader &reader, uint32_t &type, int &dimensions) {
+    uint32_t code;
+    if (!reader.byte_order() || !reader.u32(code)) {
+        return false;
+    }
+
+    dimensions = 2;
+    if (code & (EWKB_Z | EWKB_M | EWKB_SRID)) {
+        dimensions += ((code & EWKB_Z) != 0) + ((code & EWKB_M) != 0);
+        if ((code & EWKB_SRID) && !reader.skip(sizeof(uint32_t))) {
+            return false;
+        }
+        type = code & 0x0fffffffu;
+    } else {
+        // ISO types: 1000s for Z, 2000s for M, 3000s for ZM
+        uint32_t extra = code / 1000;
+        if (extra > 3) {
+            return false;
+        }
+        dimensions += (extra == 1 || extra == 2) ? 1 : (extra == 3 ? 2 : 0);
+        type = code % 1000;
+    }
+    return true;
+}
+
+bool read_polygon_body(WkbReader &reader, int dimensions, polygon &out) {
+    uint32_t num_rings;
+    if (!reader.u32(num_rings)) {
+        return false;
+    }
+
+    for (uint32_t r = 0; r < num_rings; r++) {
+        uint32_t num_points;
+        // checked before reserving, so a corrupt count cannot cause a huge allocation
+        if (!reader.u32(num_points) || num_points > reader.remaining() / (dimensions * sizeof(double))) {
+            return false;
+        }
+
+        polygon_ring ring;
+        ring.reserve(num_points);
+        for (uint32_t k = 0; k < num_points; k++) {
+            double x, y;
+            if (!reader.f64(x) || !reader.f64(y) || !reader.skip((dimensions - 2) * sizeof(double))) {
+                return false;
+            }
+            ring.push_back(point_xy(x, y));
+        }
+
+        if (r == 0) {
+            out.outer() = move(ring);
+        } else {
+            out.inners().push_back(move(ring));
+        }
+    }
+    return true;
+}
+
+}
+
+bool read_wkb(const unsigned char *data, size_t length, multi_polygon &out) {
+    out.clear();
+    WkbReader reader(data, length);
+
+    uint32_t type;
+    int dimensions;
+    if (!read_header(reader, type, dimensions)) {
+        return false;
+    }
+
+    if (type == WKB_POLYGON) {
+        polygon poly;
+        if (!read_polygon_body(reader, dimensions, poly)) {
+            return false;
+        }
+        // an empty polygon has no rings, and is read as an empty multipolygon as with WKT
+        if (!poly.outer().empty()) {
+            out.push_back(move(poly));
+        }
+    } else if (type == WKB_MULTIPOLYGON) {
+        uint32_t num_polygons;
+        if (!reader.u32(num_polygons)) {
+            return false;
+        }
+        for (uint32_t g = 0; g < num_polygons; g++) {
+            uint32_t part_type;
+            int part_dimensions;
+            polygon poly;
+            if (!read_header(reader, part_type, part_dimensions) || part_type != WKB_POLYGON
+                || !read_polygon_body(reader, part_dimensions, poly)) {
+                return false;
+            }
+            out.push_back(move(poly));
+        }
+    } else {
+        return false;
+    }
+
+    return reader.at_end();
+}
@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+import pytest
+
+from flight_processing import AirspaceHandler
+
+# Two neighbouring airspaces below FL200 with a third above both of them.
+# Rings are clockwise, as AirspaceHandler expects.
+AIRSPACES = [
+    ("A", "MULTIPOLYGON (((0 50, 0 51, 1 51, 1 50, 0 50)))", 0, 20000),
+    ("B", "MULTIPOLYGON (((1 50, 1 51, 2 51, 2 50, 1 50)))", 0, 20000),
+    ("C", "MULTIPOLYGON (((0 50, 0 51, 2 51, 2 50, 0 50)))", 20000, 40000),
+]
+
+def make_handler(**kwargs):
+    handler = AirspaceHandler(**kwargs)
+    for _, wkt, lower, upper in AIRSPACES:
+        handler.add_airspace(wkt, lower, upper)
+    return handler
+
+def make_flights(count=50, seed=0):
+    """
+    Random straight flights across the airspaces, as lists of (longitude, latitude, altitude in metres).
+    """
+
+    rng = np.random.default_rng(seed)
+    flights = []
+    for _ in range(count):
+        n = int(rng.integers(2, 40))
+        xs = np.linspace(rng.uniform(-0.5, 2.5), rng.uniform(-0.5, 2.5), n)
+        ys = np.linspace(rng.uniform(49.8, 51.2), rng.uniform(49.8, 51.2), n)
+        hs = np.linspace(rng.uniform(0, 12000), rng.uniform(0, 12000), n).round()
+        flights.append([[float(x), float(y), float(h)] for x, y, h in zip(xs, ys, hs)])
+    return flights
+
+@pytest.fixture
+def handler():
+    return make_handler()
+
+@pytest.fixture
+def flights():
+    return make_flights()
+
+@pytest.fixture
+def flights_json(tmp_path, flights):
+    path = tmp_path / "flights.json"
+    path.write_text(json.dumps(dict(flights=flights)))
+    return path
+
+def make_traffic(flights):
+    """
+    A traffic collection with one flight per list of coordinates, with altitudes in the `altitude` column.
+    """
+
+    import pandas as pd
+    from traffic.core import Traffic
+
+    frames = []
+    for k, flight in enumerate(flights):
+        a = np.array(flight, dtype=float)
+        frames.append(pd.DataFrame(dict(
+            timestamp=pd.Timestamp("2020-01-01", tz="utc") + pd.to_timedelta(np.arange(len(a)) * 10, unit="s"),
+            longitude=a[:, 0], latitude=a[:, 1], altitude=a[:, 2],
+            icao24="a%05d" % k, callsign="C%d" % k, flight_id="F%05d" % k,
+        )))
+    return Traffic(pd.concat(frames, ignore_index=True))
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("geopandas")
+pytest.importorskip("traffic")
+from scipy import sparse
+
+from flight_processing import DataConfig
+from flight_processing.data import AirspaceGraph
+
+from conftest import AIRSPACES, make_handler, make_traffic
+
+@pytest.fixture
+def graph(tmp_path, flights_json):
+    # weights on either side of the confidence thresholds
+    handler = make_handler()
+    handler.process_flights_file(str(flights_json))
+    path = tmp_path / "graph.npz"
+    sparse.save_npz(path, sparse.csr_matrix(handler.get_result() * 20))
+
+    config = DataConfig("test", -1, 3, 49, 52, data_prefix=tmp_path)
+    df = pd.DataFrame([dict(name=name, wkt=wkt, lower_limit=lower, upper_limit=upper) for name, wkt, lower, upper in AIRSPACES])
+    graph = AirspaceGraph(config, df=df, use_index=False)
+    assert graph.load_graph_files(path) == []
+    return graph
+
+def test_traffic_matches_flights(graph, flights):
+    traffic = make_traffic(flights)
+    result = graph.test_traffic(traffic, num_threads=2)
+
+    assert len(result) > 0
+    assert result["confidence"].nunique() > 1
+    for flight in traffic:
+        rows = result[result["flight_id"] == flight.flight_id].drop(columns="flight_id").to_dict("records")
+        expected = graph.test_flight(flight)
+        assert len(rows) == len(expected)
+        for row, handover in zip(rows, expected):
+            # no distances are computed for a whole flight, which test_flight gives as None
+            assert np.isnan(row.pop("distance1")) and handover.pop("distance1") is None
+            assert np.isnan(row.pop("distance2")) and handover.pop("distance2") is None
+            assert row == pytest.approx(handover)
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from flight_processing import AirspaceHandler
+
+from conftest import AIRSPACES
+
+# the shared airspaces, with a multipolygon and a polygon with a hole, so that every offset table has interior entries
+INDEX_AIRSPACES = [(wkt, lower, upper) for _, wkt, lower, upper in AIRSPACES] + [
+    ("MULTIPOLYGON (((3 50, 3 51, 4 51, 4 50, 3 50)), ((4.5 50, 4.5 51, 5 51, 5 50, 4.5 50)))", 0, 10000),
+    ("MULTIPOLYGON (((3 52, 3 54, 5 54, 5 52, 3 52), (3.5 52.5, 4.5 52.5, 4.5 53.5, 3.5 53.5, 3.5 52.5)))", 5000, 30000),
+]
+
+header = np.dtype([("magic", "S4"), ("version", "<u4"), ("A", "<u8"), ("G", "<u8"), ("R", "<u8"), ("P", "<u8")])
+
+@pytest.fixture
+def index(tmp_path):
+    handler = AirspaceHandler()
+    for wkt, lower, upper in INDEX_AIRSPACES:
+        handler.add_airspace(wkt, lower, upper)
+
+    path = tmp_path / "airspaces.bin"
+    assert handler.save_index(str(path)) == len(INDEX_AIRSPACES)
+    return path
+
+def points():
+    rng = np.random.default_rng(3)
+    n = 2000
+    return rng.uniform(-0.5, 5.5, n), rng.uniform(49.5, 54.5, n), rng.uniform(0, 35000, n).round()
+
+def query(handler):
+    xs, ys, hs = points()
+    offsets, ids = handler.airspaces_at_points(xs, ys, hs)
+    distances = handler.distances_to_airspaces(xs, ys, hs, np.zeros(len(xs), dtype=np.int32) + 3)
+    return offsets, ids, distances
+
+def test_round_trip(index):
+    original = AirspaceHandler()
+    for wkt, lower, upper in INDEX_AIRSPACES:
+        original.add_airspace(wkt, lower, upper)
+
+    loaded = AirspaceHandler()
+    assert loaded.load_index(str(index)) == len(INDEX_AIRSPACES)
+    assert loaded.size() == len(INDEX_AIRSPACES)
+
+    expected = query(original)
+    assert len(expected[1]) > 0
+    for a, b in zip(query(loaded), expected):
+        np.testing.assert_array_equal(a, b)
+
+    # saving the loaded airspaces gives the same file
+    copy = index.with_name("copy.bin")
+    loaded.save_index(str(copy))
+    assert copy.read_bytes() == index.read_bytes()
+
+def test_load_checks_handler(index):
+    handler = AirspaceHandler()
+    handler.add_airspace(*INDEX_AIRSPACES[0])
+    assert handler.load_index(str(index)) == -1
+
+def corrupt(index, table, change):
+    data = bytearray(index.read_bytes())
+    h = np.frombuffer(bytes(data), header, 1)[0]
+    A, G, R = int(h["A"]), int(h["G"]), int(h["R"])
+
+    start = header.itemsize + 2 * 4 * A + 4 * 8 * A
+    sizes = dict(polygon=A + 1, ring=G + 1, point=R + 1)
+    for name in ("polygon", "ring", "point"):
+        if name == table:
+            break
+        start += 8 * sizes[name]
+
+    offsets = np.frombuffer(bytes(data), "<u8", sizes[table], start).copy()
+    change(offsets)
+    data[start:start + offsets.nbytes] = offsets.tobytes()
+
+    path = index.with_name("corrupt.bin")
+    path.write_bytes(bytes(data))
+    return path
+
+def swap(offsets):
+    offsets[1], offsets[2] = offsets[2] + 1, offsets[1]
+
+def past_end(offsets):
+    offsets[1] = offsets[-1] + 1000
+
+def wrong_total(offsets):
+    offsets[-1] -= 1
+
+@pytest.mark.parametrize("table", ["polygon", "ring", "point"])
+@pytest.mark.parametrize("change", [swap, past_end, wrong_total])
+def test_corrupt_offsets_raise(index, table, change):
+    path = corrupt(index, table, change)
+
+    handler = AirspaceHandler()
+    with pytest.raises(RuntimeError, match="invalid {} offsets".format(table)):
+        handler.load_index(str(path))
+    assert handler.size() == 0
+
+def test_corrupt_header_raises(index):
+    data = bytearray(index.read_bytes())
+    h = np.frombuffer(bytes(data), header, 1).copy()
+    h["P"] = 1 << 62
+    data[:header.itemsize] = h.tobytes()
+    path = index.with_name("corrupt.bin")
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(RuntimeError, match="wrong size"):
+        AirspaceHandler().load_index(str(path))
+
+    path.write_bytes(index.read_bytes()[:-8])
+    with pytest.raises(RuntimeError, match="wrong size"):
+        AirspaceHandler().load_index(str(path))
+
+    path.write_bytes(b"FPFD" + index.read_bytes()[4:])
+    with pytest.raises(RuntimeError, match="not an airspace index"):
+        AirspaceHandler().load_index(str(path))
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import multiprocessing
+import threading
+
+import pytest
+
+from flight_processing.utils import run_intervals, execute_bulk, execute_bulk_between
+
+start = datetime(2020, 1, 1)
+
+def intervals(count):
+    return [(start + timedelta(hours=h), start + timedelta(hours=h + 1)) for h in range(count)]
+
+@pytest.mark.parametrize("executor", [None, "serial", "thread", "process"])
+def test_report_order_and_results(executor):
+    if executor == "process" and "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("fork is not available")
+
+    offset = 7
+    # a closure, which the process executor cannot pickle
+    report = run_intervals(lambda t1, t2: (t2 - t1).seconds + t1.hour + offset, intervals(6), executor=executor, max_workers=3)
+
+    assert [status['time_start'] for status in report] == [t1 for t1, _ in intervals(6)]
+    assert [status['result'] for status in report] == [3600 + h + offset for h in range(6)]
+    assert all(status['success'] and status['attempts'] == 1 for status in report)
+
+def test_existing_executor():
+    with ThreadPoolExecutor(2) as pool:
+        report = run_intervals(lambda t1, t2: t1.hour, intervals(4), executor=pool)
+    assert [status['result'] for status in report] == [0, 1, 2, 3]
+
+def test_failures_are_retried_and_reported():
+    calls = {}
+
+    def function(t1, t2):
+        calls[t1] = calls.get(t1, 0) + 1
+        if t1.hour == 1 or (t1.hour == 2 and calls[t1] == 1):
+            raise RuntimeError("failed")
+        return t1.hour
+
+    report = run_intervals(function, intervals(3), retries=2)
+
+    assert [status['success'] for status in report] == [True, False, True]
+    assert [status['attempts'] for status in report] == [1, 3, 2]
+    assert "RuntimeError" in report[1]['error']
+    assert report[2]['error'] is None
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="fork is not available")
+def test_concurrent_process_runs_keep_their_functions():
+    barrier = threading.Barrier(2)
+    reports = {}
+
+    def run(name):
+        def function(t1, t2):
+            return name, t1.hour
+
+        barrier.wait()
+        reports[name] = run_intervals(function, intervals(8), executor="process", max_workers=2)
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for name in ("a", "b"):
+        assert [status['result'] for status in reports[name]] == [(name, h) for h in range(8)]
+
+def test_bulk_intervals():
+    report = execute_bulk(lambda t1, t2: (t1, t2), start, 3, timedelta(hours=2))
+    assert [status['result'] for status in report] == [(start + timedelta(hours=2 * i), start + timedelta(hours=2 * i + 2)) for i in range(3)]
+
+    # only whole intervals before the end are run
+    report = execute_bulk_between(lambda t1, t2: t1, start, start + timedelta(hours=3, minutes=30))
+    assert [status['result'] for status in report] == [start + timedelta(hours=h) for h in range(3)]
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        run_intervals(lambda t1, t2: None, intervals(1), executor="cluster")
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from flight_processing import AirspaceHandler
+
+def make_airspaces(seed=5):
+    """
+    Irregular airspaces with fewer vertices than the polygon grid needs, so every test can use the coherence cache.
+    """
+
+    rng = np.random.default_rng(seed)
+    airspaces = []
+    for _ in range(30):
+        cx, cy = rng.uniform(-1, 3), rng.uniform(49.5, 51.5)
+        n = int(rng.integers(4, 25))
+        # clockwise rings
+        angles = np.linspace(2 * np.pi, 0, n, endpoint=False)
+        r = rng.uniform(0.1, 0.6) * rng.uniform(0.6, 1, n)
+        ring = list(zip(cx + r * np.cos(angles), cy + r * np.sin(angles)))
+        wkt = "MULTIPOLYGON (((%s)))" % ", ".join("%f %f" % p for p in ring + ring[:1])
+        lower = int(rng.integers(0, 20000))
+        airspaces.append((wkt, lower, lower + int(rng.integers(5000, 30000))))
+    return airspaces
+
+def random_walks(count=100, seed=6):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        n = int(rng.integers(50, 500))
+        xs = rng.uniform(-1, 3) + rng.normal(0, 0.01, n).cumsum()
+        ys = rng.uniform(49.5, 51.5) + rng.normal(0, 0.01, n).cumsum()
+        hs = np.clip(rng.uniform(0, 12000) + rng.normal(0, 50, n).cumsum(), 0, None).round()
+        yield xs, ys, hs
+
+@pytest.mark.parametrize("polygon_grid", [False, True])
+def test_coherence_keeps_handovers(polygon_grid):
+    handlers = {}
+    for coherence in [False, True]:
+        handlers[coherence] = AirspaceHandler(polygon_grid)
+        handlers[coherence].set_temporal_coherence(coherence)
+        for wkt, lower, upper in make_airspaces():
+            handlers[coherence].add_airspace(wkt, lower, upper)
+
+    total = 0
+    for xs, ys, hs in random_walks():
+        expected = handlers[False].process_single_flight(xs, ys, hs)
+        assert handlers[True].process_single_flight(xs, ys, hs) == expected
+        total += len(expected)
+    assert total > 0
@@ -0,0 +1,92 @@
+import struct
+
+import numpy as np
+import pytest
+
+pytest.importorskip("traffic")
+
+from flight_processing.data.flight_downloader import flights_to_binary, flights_to_arrays
+
+from conftest import make_handler, make_traffic
+
+header_size = struct.calcsize("<4sIQQ")
+
+@pytest.fixture
+def traffic(flights):
+    return make_traffic(flights)
+
+@pytest.fixture
+def dump(tmp_path, traffic):
+    path = tmp_path / "flights.bin"
+    path.write_bytes(flights_to_binary(traffic))
+    return path
+
+def test_binary_layout(dump, traffic):
+    xs, ys, hs, offsets, _ = flights_to_arrays(traffic)
+    data = dump.read_bytes()
+
+    magic, version, num_flights, num_points = struct.unpack_from("<4sIQQ", data)
+    assert (magic, version, num_flights, num_points) == (b"FPFD", 1, len(offsets) - 1, offsets[-1])
+
+    read_offsets = np.frombuffer(data, "<u8", num_flights + 1, header_size)
+    columns = np.frombuffer(data, "<f4", 3 * num_points, header_size + 8 * (num_flights + 1)).reshape(3, -1)
+    np.testing.assert_array_equal(read_offsets, offsets)
+    for column, expected in zip(columns, (xs, ys, hs)):
+        np.testing.assert_array_equal(column, expected.astype(np.float32))
+
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_dump_matches_json(dump, flights_json, num_threads):
+    from_json = make_handler()
+    from_json.process_flights_file(str(flights_json), num_threads)
+    from_dump = make_handler()
+    from_dump.process_flights_file(str(dump), num_threads)
+
+    assert from_json.get_result().sum() > 0
+    np.testing.assert_array_equal(from_dump.get_result(), from_json.get_result())
+
+def test_unknown_altitude_skips_flight(tmp_path, flights):
+    flights = [list(map(list, flight)) for flight in flights]
+    flights[0][0][2] = float("nan")
+
+    path = tmp_path / "nan.bin"
+    path.write_bytes(flights_to_binary(make_traffic(flights)))
+    with_nan = make_handler()
+    with_nan.process_flights_file(str(path), 1)
+
+    path = tmp_path / "without.bin"
+    path.write_bytes(flights_to_binary(make_traffic(flights[1:])))
+    without = make_handler()
+    without.process_flights_file(str(path), 1)
+
+    np.testing.assert_array_equal(with_nan.get_result(), without.get_result())
+
+def corrupt(dump, tmp_path, change):
+    data = bytearray(dump.read_bytes())
+    num_flights, num_points = struct.unpack_from("<QQ", data, 8)
+    offsets = np.frombuffer(bytes(data), "<u8", num_flights + 1, header_size).copy()
+    change(offsets, num_points)
+    data[header_size:header_size + offsets.nbytes] = offsets.astype("<u8").tobytes()
+
+    path = tmp_path / "corrupt.bin"
+    path.write_bytes(bytes(data))
+    return path
+
+@pytest.mark.parametrize("change", [
+    lambda offsets, n: offsets.__setitem__(1, n + 1000),
+    lambda offsets, n: offsets.__setitem__(slice(1, 3), offsets[2:0:-1]),
+    lambda offsets, n: offsets.__setitem__(-1, n - 1),
+], ids=["past_end", "out_of_order", "wrong_total"])
+def test_bad_offsets_raise(dump, tmp_path, change):
+    path = corrupt(dump, tmp_path, change)
+
+    handler = make_handler()
+    with pytest.raises(RuntimeError, match="invalid offsets"):
+        handler.process_flights_file(str(path), 1)
+
+def test_truncated_dump_raises(dump, tmp_path):
+    path = tmp_path / "truncated.bin"
+    path.write_bytes(dump.read_bytes()[:-4])
+
+    handler = make_handler()
+    with pytest.raises(RuntimeError, match="wrong size"):
+        handler.process_flights_file(str(path), 1)
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+import multiprocessing
+import os
+
+import pytest
+
+from flight_processing.data import GraphManifest
+from flight_processing.data import graph_manifest
+
+start = datetime(2020, 1, 1)
+
+@pytest.fixture
+def manifest(tmp_path):
+    return GraphManifest(tmp_path / "manifest.jsonl")
+
+@pytest.fixture
+def hour(tmp_path):
+    """
+    A flight dump and an output for the first hour.
+    """
+
+    dump = tmp_path / "0000.bin"
+    dump.write_bytes(b"flights" * 100)
+    output = tmp_path / "0000.npz"
+    output.write_bytes(b"graph")
+    return dump, dict(npz=output)
+
+def test_record_and_is_current(manifest, hour):
+    dump, outputs = hour
+    assert not manifest.is_current(start, dump, "a", ["npz"])
+
+    manifest.record(start, dump, "a", outputs)
+
+    assert manifest.hours() == [start]
+    assert manifest.is_current(start + timedelta(minutes=30), dump, "a", ["npz"])
+    assert not manifest.is_current(start, dump, "b", ["npz"])
+    assert not manifest.is_current(start, dump, "a", ["npz", "json"])
+    assert not manifest.is_current(start + timedelta(hours=1), dump, "a", ["npz"])
+    assert manifest.stale("b") == [start]
+
+def test_changes_invalidate(manifest, hour):
+    dump, outputs = hour
+    manifest.record(start, dump, "a", outputs)
+
+    # touching the dump without changing it keeps the hour current
+    stat = os.stat(dump)
+    os.utime(dump, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert manifest.is_current(start, dump, "a", ["npz"])
+
+    dump.write_bytes(b"FLIGHTS" * 100)
+    assert not manifest.is_current(start, dump, "a", ["npz"])
+
+    manifest.record(start, dump, "a", outputs)
+    outputs['npz'].write_bytes(b"another graph")
+    assert not manifest.is_current(start, dump, "a", ["npz"])
+
+def test_record_reuses_hash(manifest, hour, monkeypatch):
+    dump, outputs = hour
+    manifest.record(start, dump, "a", outputs)
+
+    hashed = []
+    original = graph_manifest.file_hash
+    monkeypatch.setattr(graph_manifest, "file_hash", lambda path: hashed.append(path) or original(path))
+
+    manifest.record(start, dump, "b", outputs)
+    assert hashed == []
+    assert manifest.entry(start)['dataset_hash'] == "b"
+
+    dump.write_bytes(b"FLIGHTS" * 100)
+    manifest.record(start, dump, "b", outputs)
+    assert hashed == [dump]
+    assert manifest.entry(start)['input']['sha256'] == original(dump)
+
+def test_touched_dump_hashed_once(tmp_path, manifest, hour, monkeypatch):
+    dump, outputs = hour
+    manifest.record(start, dump, "a", outputs)
+
+    hashed = []
+    original = graph_manifest.file_hash
+    monkeypatch.setattr(graph_manifest, "file_hash", lambda path: hashed.append(path) or original(path))
+
+    stat = os.stat(dump)
+    os.utime(dump, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    for _ in range(3):
+        assert manifest.is_current(start, dump, "a", ["npz"])
+    assert hashed == [dump]
+    assert manifest.entry(start)['input']['mtime_ns'] == stat.st_mtime_ns + 10 ** 9
+
+    # the refreshed time is in the journal, so other runs only stat the dump too
+    assert GraphManifest(tmp_path / "manifest.jsonl").is_current(start, dump, "a", ["npz"])
+    assert hashed == [dump]
+
+def test_reopen_and_compact(tmp_path, manifest, hour):
+    dump, outputs = hour
+    for h in range(3):
+        manifest.record(start + timedelta(hours=h), dump, "a", outputs)
+    manifest.record(start, dump, "b", outputs)
+    manifest.invalidate(start + timedelta(hours=1))
+
+    lines = manifest.location.read_text().splitlines()
+    assert len(lines) == 5
+
+    manifest.compact()
+    assert len(manifest.location.read_text().splitlines()) == 2
+
+    reopened = GraphManifest(manifest.location)
+    assert reopened.hours() == [start, start + timedelta(hours=2)]
+    assert reopened.entry(start)['dataset_hash'] == "b"
+    assert reopened.entry(start + timedelta(hours=1)) is None
+
+def test_incomplete_last_line(manifest, hour):
+    dump, outputs = hour
+    manifest.record(start, dump, "a", outputs)
+    with open(manifest.location, "a") as f:
+        f.write('{"version": 1, "hour": 43')
+
+    assert GraphManifest(manifest.location).hours() == [start]
+
+def record_hours(location, dump, output, first, count):
+    manifest = GraphManifest(location)
+    for h in range(first, first + count):
+        manifest.record(start + timedelta(hours=h), dump, "a", dict(npz=output))
+
+@pytest.mark.skipif(graph_manifest.fcntl is None, reason="advisory locks are not available")
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="fork is not available")
+def test_compact_while_recording(manifest, hour):
+    # hours recorded by other processes while the journal is compacted are never lost
+    dump, outputs = hour
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=record_hours, args=(manifest.location, dump, outputs['npz'], 100 * k, 100)) for k in range(3)]
+    for process in processes:
+        process.start()
+    while any(process.is_alive() for process in processes):
+        manifest.compact()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    manifest.compact()
+    assert GraphManifest(manifest.location).hours() == [start + timedelta(hours=h) for h in range(300)]
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from flight_processing.data import HandoverStore
+from flight_processing.data.handover_store import time_to_hour, hour_to_time
+
+size = 6
+start = datetime(2020, 1, 1)
+
+@pytest.fixture
+def hourly():
+    # five weeks of hours with a gap of a few days, starting mid-week
+    rng = np.random.default_rng(1)
+    matrices = {}
+    for h in range(35 * 24):
+        if 9 * 24 <= h < 12 * 24 or rng.random() < 0.1:
+            continue
+        dense = rng.integers(0, 4, (size, size)) * (rng.random((size, size)) < 0.3)
+        matrices[start + timedelta(hours=h)] = dense
+    return matrices
+
+@pytest.fixture
+def store(tmp_path, hourly):
+    store = HandoverStore(tmp_path / "store", size)
+    for time, dense in hourly.items():
+        store.append(time, sparse.csr_matrix(dense))
+    return store
+
+def expected_sum(hourly, time_start, time_end):
+    total = np.zeros((size, size), dtype=np.int64)
+    for time, dense in hourly.items():
+        if time_start <= time < time_end:
+            total += dense
+    return total
+
+def ranges():
+    rng = np.random.default_rng(2)
+    fixed = [(0, 35 * 24), (0, 1), (5, 5), (24, 48), (7 * 24, 14 * 24), (-48, 40 * 24)]
+    random = [tuple(sorted(rng.integers(-30, 37 * 24, 2))) for _ in range(40)]
+    for a, b in fixed + random:
+        yield start + timedelta(hours=int(a)), start + timedelta(hours=int(b))
+
+def check_ranges(store, hourly):
+    for time_start, time_end in ranges():
+        matrix, missing = store.range_sum(time_start, time_end)
+        np.testing.assert_array_equal(matrix.toarray(), expected_sum(hourly, time_start, time_end))
+
+        expected_missing = [hour_to_time(h) for h in range(time_to_hour(time_start), time_to_hour(time_end))
+                            if hour_to_time(h) not in hourly]
+        assert missing == expected_missing
+
+def test_range_sum_from_hours(store, hourly):
+    assert not store.rollups_current
+    check_ranges(store, hourly)
+
+def test_range_sum_from_rollups(store, hourly):
+    store.build_rollups()
+    assert store.rollups_current
+    check_ranges(store, hourly)
+
+def test_rollups_outdated_by_append(store, hourly):
+    store.build_rollups()
+    time = start + timedelta(days=40)
+    dense = np.ones((size, size), dtype=np.int64)
+    store.append(time, dense)
+    hourly[time] = dense
+
+    assert not store.rollups_current
+    check_ranges(store, hourly)
+
+    store.build_rollups()
+    assert store.rollups_current
+    check_ranges(store, hourly)
+
+def test_reopen(tmp_path, store, hourly):
+    store.build_rollups()
+    reopened = HandoverStore(tmp_path / "store")
+
+    assert reopened.size == size
+    assert reopened.hours() == sorted(hourly)
+    assert reopened.rollups_current
+    check_ranges(reopened, hourly)
+
+def test_append_checks(store, hourly):
+    time = next(iter(hourly))
+    with pytest.raises(ValueError):
+        store.append(time, np.zeros((size, size)))
+    with pytest.raises(ValueError):
+        store.append(start - timedelta(days=1), np.zeros((size + 1, size + 1)))
+    with pytest.raises(ValueError):
+        HandoverStore(store.location, size + 1)
+
+def test_missing_store(tmp_path):
+    assert not HandoverStore.exists(tmp_path / "none")
+    with pytest.raises(FileNotFoundError):
+        HandoverStore(tmp_path / "none")
@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# libraries only needed for drawing or downloading, which batch processing never uses
+heavy_modules = ["cartopy", "matplotlib", "holoviews", "hvplot", "traffic.data"]
+
+# importing the whole library must stay well below the several seconds the plotting libraries take
+import_budget_seconds = 5.0
+
+script = """
+import json, sys, time
+t = time.perf_counter()
+import flight_processing
+import flight_processing.data
+from flight_processing.data import AirspaceGraph, GraphBuilder, FlightDownloader
+elapsed = time.perf_counter() - t
+import flight_processing.utils as utils
+print(json.dumps(dict(modules=sorted(sys.modules), elapsed=elapsed, config_loaded=utils._config is not None)))
+"""
+
+def run(tmp_path, code):
+    # the config directory is redirected, so that any config written is seen and the user's is untouched
+    env = dict(os.environ, XDG_CONFIG_HOME=str(tmp_path / "config"), PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+@pytest.fixture(scope="module")
+def imported(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("imports")
+    return json.loads(run(tmp_path, script)), tmp_path
+
+def test_no_heavy_imports(imported):
+    result, _ = imported
+    loaded = [name for name in result['modules'] if any(name == m or name.startswith(m + ".") for m in heavy_modules)]
+    assert loaded == []
+
+def test_config_not_read(imported):
+    result, tmp_path = imported
+    assert not result['config_loaded']
+    assert not (tmp_path / "config").exists()
+
+def test_import_budget(imported):
+    result, _ = imported
+    assert result['elapsed'] < import_budget_seconds
+
+def test_config_read_on_first_use(tmp_path):
+    code = "import flight_processing; print(flight_processing.config.sections())"
+    assert "global" in run(tmp_path, code)
+    assert (tmp_path / "config" / "flight_processing" / "flight_processing.conf").exists()
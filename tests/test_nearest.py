@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from conftest import make_handler
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(1)
+    xs = rng.uniform(-1, 3, 200)
+    ys = rng.uniform(49.5, 51.5, 200)
+    hs = rng.uniform(0, 45000, 200).astype(int).astype(float)
+    return xs, ys, hs
+
+@pytest.mark.parametrize("k, max_distance", [(1, np.inf), (2, np.inf), (5, np.inf), (2, 20000.0), (0, 30000.0)])
+def test_nearest_matches_brute_force(handler, points, k, max_distance):
+    xs, ys, hs = points
+    ids = np.arange(handler.size())
+    distances = handler.distances_to_airspaces(xs, ys, hs, ids, True)
+    at_offsets, at_ids = handler.airspaces_at_points(xs, ys, hs)
+
+    for i in range(len(xs)):
+        inside = set(at_ids[at_offsets[i]:at_offsets[i + 1]].tolist())
+        candidates = sorted((float(distances[i, j]), j) for j in ids if j not in inside and distances[i, j] <= max_distance)
+        expected = candidates[:k] if k > 0 else candidates
+
+        found = handler.airspaces_near_point(float(xs[i]), float(ys[i]), int(hs[i]), True, k, max_distance)
+        assert [j for j, _ in found] == [j for _, j in expected]
+        np.testing.assert_allclose([d for _, d in found], [d for d, _ in expected], rtol=1e-5)
+
+def test_nearest_batch_matches_single(handler, points):
+    xs, ys, hs = points
+    offsets, ids, distances = handler.airspaces_near_points(xs, ys, hs, 2, True, 0, 20000.0)
+
+    for i in range(len(xs)):
+        found = handler.airspaces_near_point(float(xs[i]), float(ys[i]), int(hs[i]), True, 2, 20000.0)
+        assert ids[offsets[i]:offsets[i + 1]].tolist() == [j for j, _ in found]
+        np.testing.assert_allclose(distances[offsets[i]:offsets[i + 1]], [d for _, d in found])
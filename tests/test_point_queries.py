@@ -0,0 +1,32 @@
+import numpy as np
+
+from flight_processing.process_flights import METRE_IN_FT
+
+def split(offsets, values):
+    return [sorted(values[offsets[i]:offsets[i + 1]].tolist()) for i in range(len(offsets) - 1)]
+
+def test_metre_heights_match_flights(handler):
+    # 6095.7 m lies below FL200 when truncated, but on it, and so also in C, when rounded as flights are
+    xs = np.array([0.5, 1.5])
+    ys = np.array([50.5, 50.5])
+    hs = np.array([6095.7, 6095.7])
+
+    at = split(*handler.airspaces_at_points(xs, ys, hs, False))
+    assert at == [[0, 2], [1, 2]]
+    assert handler.process_single_flight(xs, ys, hs) == handler.process_single_flight(xs, ys, np.rint(hs))
+
+    assert [handler.airspaces_at_point(0.5, 50.5, 6096, False)] == at[:1]
+
+def test_metre_heights_match_feet(handler):
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(-0.5, 2.5, 500)
+    ys = rng.uniform(49.8, 51.2, 500)
+    hs = rng.uniform(5800, 6400, 500)
+    hs_ft = (np.rint(hs).astype(np.float32) * np.float32(METRE_IN_FT)).astype(int).astype(float)
+
+    assert split(*handler.airspaces_at_points(xs, ys, hs, False)) == split(*handler.airspaces_at_points(xs, ys, hs_ft, True))
+
+    near = handler.airspaces_near_points(xs, ys, hs, 3, False)
+    near_ft = handler.airspaces_near_points(xs, ys, hs_ft, 3, True)
+    for a, b in zip(near, near_ft):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("shapely")
+from shapely.geometry import MultiPolygon, Polygon
+
+from flight_processing import AirspaceHandler
+
+def make_airspaces(count=10, seed=2):
+    """
+    Irregular multipolygons with many vertices and a hole each, as WKT.
+    """
+
+    rng = np.random.default_rng(seed)
+    wkts = []
+    for _ in range(count):
+        cx, cy = rng.uniform(-3, 3), rng.uniform(47, 53)
+        n = int(rng.integers(200, 1500))
+        angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+        r = rng.uniform(0.5, 2) * (1 + 0.3 * np.sin(angles * rng.integers(2, 9)) + 0.05 * rng.uniform(-1, 1, n))
+        polygon = Polygon(list(zip(cx + r * np.cos(angles), cy + r * np.sin(angles))))
+        hole = Polygon(list(zip(cx + 0.2 * r[::10] * np.cos(angles[::10]), cy + 0.2 * r[::10] * np.sin(angles[::10]))))
+        polygon = polygon.difference(hole)
+        if not polygon.is_valid:
+            polygon = polygon.buffer(0)
+        if polygon.geom_type == "Polygon":
+            polygon = MultiPolygon([polygon])
+        wkts.append(polygon.wkt)
+    return wkts
+
+@pytest.fixture(scope="module")
+def handlers():
+    wkts = make_airspaces()
+    handlers = {}
+    for grid in [False, True]:
+        handlers[grid] = AirspaceHandler(grid)
+        for wkt in wkts:
+            handlers[grid].add_airspace(wkt, 0, 50000)
+    return handlers
+
+def test_grid_points_match(handlers):
+    rng = np.random.default_rng(3)
+    xs = rng.uniform(-6, 6, 5000)
+    ys = rng.uniform(44, 56, 5000)
+    hs = np.full(5000, 1000.0)
+
+    results = [handlers[grid].airspaces_at_points(xs, ys, hs) for grid in [False, True]]
+    assert results[0][1].size > 0
+    for a, b in zip(*results):
+        np.testing.assert_array_equal(a, b)
+
+def test_grid_flights_match(handlers):
+    rng = np.random.default_rng(4)
+    for _ in range(30):
+        n = 300
+        xs = rng.uniform(-3, 3) + rng.normal(0, 0.02, n).cumsum()
+        ys = rng.uniform(47, 53) + rng.normal(0, 0.02, n).cumsum()
+        hs = np.full(n, 300.0)
+        assert handlers[False].process_single_flight(xs, ys, hs) == handlers[True].process_single_flight(xs, ys, hs)
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from flight_processing import AirspaceHandler
+
+from conftest import make_handler
+
+def test_single_flight_handover(handler):
+    # level at 1000 m (about 3300 ft) from A into B
+    xs = np.array([0.5, 0.9, 1.1, 1.5])
+    ys = np.array([50.5, 50.5, 50.5, 50.5])
+    hs = np.array([1000.0, 1000.0, 1000.0, 1000.0])
+
+    assert handler.process_single_flight(xs, ys, hs) == [[0, 1]]
+
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_file_matches_single_flights(flights, flights_json, num_threads):
+    handler = make_handler()
+    handler.process_flights_file(str(flights_json), num_threads)
+    result = handler.get_result()
+
+    expected = np.zeros_like(result)
+    single = make_handler()
+    for flight in flights:
+        a = np.array(flight)
+        for i, j in single.process_single_flight(a[:, 0].copy(), a[:, 1].copy(), a[:, 2].copy()):
+            expected[i, j] += 1
+
+    assert expected.sum() > 0
+    np.testing.assert_array_equal(result, expected)
+
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_truncated_file_raises(tmp_path, flights_json, num_threads):
+    # a parse error while workers are running surfaces as an exception rather than terminating the process
+    path = tmp_path / "truncated.json"
+    path.write_bytes(flights_json.read_bytes()[:-100])
+
+    handler = make_handler()
+    with pytest.raises(RuntimeError):
+        handler.process_flights_file(str(path), num_threads)
+
+    # flights read before the error are not counted either
+    assert not handler.get_result().any()
+
+def test_count_flights_leaves_result(flights_json, handler):
+    handler.process_flights_file(str(flights_json), 2)
+    accumulated = handler.get_result()
+
+    rows, cols, counts = handler.count_flights_file(str(flights_json), 2)
+    matrix = np.zeros_like(accumulated)
+    matrix[rows, cols] = counts
+
+    np.testing.assert_array_equal(matrix, accumulated)
+    np.testing.assert_array_equal(handler.get_result(), accumulated)
+
+def test_count_flights_from_threads(flights_json, handler):
+    # each call counts its own flights, so calls from several threads do not mix their results
+    from concurrent.futures import ThreadPoolExecutor
+
+    expected = handler.count_flights_file(str(flights_json), 1)
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: handler.count_flights_file(str(flights_json), 2), range(8)))
+
+    for result in results:
+        for a, b in zip(result, expected):
+            np.testing.assert_array_equal(a, b)
+
+def test_long_flight_handovers():
+    # a flight across a row of small airspaces meets only a few of them in each window of vertices
+    handler = AirspaceHandler()
+    for k in range(100):
+        handler.add_airspace("MULTIPOLYGON (((%f 50, %f 51, %f 51, %f 50, %f 50)))" % (k * 0.1, k * 0.1, k * 0.1 + 0.1, k * 0.1 + 0.1, k * 0.1), 0, 20000)
+
+    xs = np.linspace(0.05, 9.95, 2000)
+    ys = np.full(2000, 50.5)
+    hs = np.full(2000, 1000.0)
+
+    assert handler.process_single_flight(xs, ys, hs) == [[k, k + 1] for k in range(99)]
+
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_batch_matches_single_flights(handler, flights, num_threads):
+    arrays = [np.array(flight) for flight in flights]
+    xs, ys, hs = (np.concatenate([a[:, c] for a in arrays]) for c in range(3))
+    offsets = np.concatenate([[0], np.cumsum([len(a) for a in arrays])])
+
+    handover_offsets, from_ids, to_ids = handler.process_flights_batch(xs, ys, hs, offsets, num_threads)
+
+    assert len(handover_offsets) == len(flights) + 1
+    assert len(from_ids) > 0
+    for i, a in enumerate(arrays):
+        pairs = [[int(f), int(t)] for f, t in zip(from_ids[handover_offsets[i]:handover_offsets[i + 1]], to_ids[handover_offsets[i]:handover_offsets[i + 1]])]
+        assert pairs == handler.process_single_flight(a[:, 0].copy(), a[:, 1].copy(), a[:, 2].copy())
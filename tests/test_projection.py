@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+
+from flight_processing import AirspaceHandler
+from flight_processing.process_flights import METRE_IN_FT
+
+from conftest import AIRSPACES, make_handler, make_traffic
+
+PROJECTION = "+proj=lcc +lat_0=50.5 +lon_0=1 +lat_1=49 +lat_2=52 +ellps=WGS84 +units=m"
+
+def flight_arrays(flights):
+    xs = np.concatenate([np.array(flight)[:, 0] for flight in flights])
+    ys = np.concatenate([np.array(flight)[:, 1] for flight in flights])
+    hs = np.concatenate([np.array(flight)[:, 2] for flight in flights])
+    offsets = np.concatenate([[0], np.cumsum([len(flight) for flight in flights])])
+    return xs, ys, hs, offsets
+
+def split(offsets, values):
+    return [sorted(values[offsets[i]:offsets[i + 1]].tolist()) for i in range(len(offsets) - 1)]
+
+def planar_handler():
+    handler = make_handler()
+    assert handler.set_projection(PROJECTION) == handler.size()
+    return handler
+
+def handovers(handler, flights):
+    return [handler.process_single_flight(*(np.array(flight)[:, c].copy() for c in range(3))) for flight in flights]
+
+def test_projection_set(handler):
+    assert handler.get_projection() == ""
+    assert handler.set_projection(PROJECTION) == handler.size()
+    assert handler.get_projection() == PROJECTION
+
+def test_invalid_projection(handler):
+    assert handler.set_projection("+proj=nonsense") == -1
+    assert handler.get_projection() == ""
+
+def test_projection_after_processing(handler, flights):
+    handler.airspaces_at_points(*flight_arrays(flights)[:3])
+    assert handler.set_projection(PROJECTION) == -1
+
+def test_planar_handovers_match(flights):
+    geodesic = handovers(make_handler(), flights)
+    assert sum(len(h) for h in geodesic) > 0
+    assert handovers(planar_handler(), flights) == geodesic
+
+def test_planar_file_matches(flights_json):
+    results = []
+    for handler in [make_handler(), planar_handler()]:
+        handler.process_flights_file(str(flights_json), 2)
+        results.append(handler.get_result())
+    np.testing.assert_array_equal(*results)
+
+def test_planar_points_match(flights):
+    xs, ys, hs, _ = flight_arrays(flights)
+    geodesic = split(*make_handler().airspaces_at_points(xs, ys, hs, False))
+    assert split(*planar_handler().airspaces_at_points(xs, ys, hs, False)) == geodesic
+
+def test_planar_distances_close(flights):
+    # within 0.5% of the geodesic distance, or 5 m for airspaces closer than a kilometre
+    xs, ys, hs, _ = flight_arrays(flights)
+    ids = np.arange(len(AIRSPACES))
+    geodesic = make_handler().distances_to_airspaces(xs, ys, hs, ids, True)
+    planar = planar_handler().distances_to_airspaces(xs, ys, hs, ids, True)
+
+    error = np.abs(planar - geodesic) / np.maximum(geodesic, 1000 * METRE_IN_FT)
+    assert geodesic.max() > 0
+    assert error.max() < 0.005
+
+@pytest.mark.parametrize("bulk", [False, True], ids=["wkt", "wkb"])
+def test_airspaces_added_after_projection(flights, bulk):
+    handler = AirspaceHandler()
+    handler.set_projection(PROJECTION)
+    # added after the projection was set, so projected on arrival
+    if bulk:
+        wkt_module = pytest.importorskip("shapely.wkt")
+        wkbs = [wkt_module.loads(wkt).wkb for _, wkt, _, _ in AIRSPACES]
+        lowers = np.array([lower for _, _, lower, _ in AIRSPACES], dtype=np.int32)
+        uppers = np.array([upper for _, _, _, upper in AIRSPACES], dtype=np.int32)
+        assert handler.add_airspaces(wkbs, lowers, uppers) == len(AIRSPACES)
+    else:
+        for _, wkt, lower, upper in AIRSPACES:
+            handler.add_airspace(wkt, lower, upper)
+
+    xs, ys, hs, _ = flight_arrays(flights)
+    planar = planar_handler()
+    assert split(*handler.airspaces_at_points(xs, ys, hs, False)) == split(*planar.airspaces_at_points(xs, ys, hs, False))
+    assert handovers(handler, flights) == handovers(planar, flights)
+
+def test_index_loaded_after_projection(tmp_path, flights):
+    path = tmp_path / "airspaces.idx"
+    make_handler().save_index(str(path))
+
+    handler = AirspaceHandler()
+    handler.set_projection(PROJECTION)
+    assert handler.load_index(str(path)) == len(AIRSPACES)
+    assert handler.get_projection() == PROJECTION
+
+    xs, ys, hs, _ = flight_arrays(flights)
+    planar = planar_handler()
+    assert split(*handler.airspaces_at_points(xs, ys, hs, False)) == split(*planar.airspaces_at_points(xs, ys, hs, False))
+    np.testing.assert_array_equal(
+        handler.distances_to_airspaces(xs, ys, hs, np.arange(len(AIRSPACES)), True),
+        planar.distances_to_airspaces(xs, ys, hs, np.arange(len(AIRSPACES)), True))
+
+@pytest.mark.parametrize("definition", [None, ""])
+def test_projection_unset(flights, definition):
+    handler = planar_handler()
+    handler.set_projection(definition)
+    assert handler.get_projection() == ""
+
+    xs, ys, hs, _ = flight_arrays(flights)
+    geodesic = make_handler()
+    assert handovers(handler, flights) == handovers(geodesic, flights)
+    np.testing.assert_array_equal(
+        handler.distances_to_airspaces(xs, ys, hs, np.arange(len(AIRSPACES)), True),
+        geodesic.distances_to_airspaces(xs, ys, hs, np.arange(len(AIRSPACES)), True))
+
+def make_builder(tmp_path, projection=PROJECTION, planar=False):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("geopandas")
+    from flight_processing import DataConfig
+    from flight_processing.data import GraphBuilder
+
+    config = DataConfig("test", -1, 3, 49, 52, data_prefix=tmp_path, projection=projection)
+    df = pd.DataFrame([dict(name=name, wkt=wkt, lower_limit=lower, upper_limit=upper) for name, wkt, lower, upper in AIRSPACES])
+    return GraphBuilder(config, df=df, use_index=False, planar=planar)
+
+def test_planar_builder_needs_projection(tmp_path):
+    with pytest.raises(ValueError):
+        make_builder(tmp_path, projection=None, planar=True)
+
+def test_projection_report(tmp_path, flights):
+    pytest.importorskip("traffic")
+
+    report = make_builder(tmp_path).projection_report(make_traffic(flights), k=2, num_threads=2)
+
+    assert report["projection"] == PROJECTION
+    assert report["flights"] == len(flights)
+    assert report["positions"] == sum(len(flight) for flight in flights)
+    assert report["handovers_geodesic"] == report["handovers_planar"] > 0
+    assert report["flights_differing"] == 0
+    assert report["positions_differing"] == 0
+    assert report["distances"] > 0
+    assert report["distance_error_relative_max"] < 0.005
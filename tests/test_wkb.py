@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+shapely = pytest.importorskip("shapely")
+import shapely.wkt
+from shapely.geometry import Polygon
+
+from flight_processing import AirspaceHandler
+
+from conftest import AIRSPACES
+
+limits = (np.array([lower for _, _, lower, _ in AIRSPACES], dtype=np.int32),
+          np.array([upper for _, _, _, upper in AIRSPACES], dtype=np.int32))
+
+def geometries():
+    return [shapely.wkt.loads(wkt) for _, wkt, _, _ in AIRSPACES]
+
+def query(handler):
+    rng = np.random.default_rng(4)
+    n = 1000
+    xs, ys, hs = rng.uniform(-0.5, 2.5, n), rng.uniform(49.5, 51.5, n), rng.uniform(0, 45000, n).round()
+    return handler.airspaces_at_points(xs, ys, hs)
+
+@pytest.fixture
+def expected():
+    handler = AirspaceHandler()
+    for _, wkt, lower, upper in AIRSPACES:
+        handler.add_airspace(wkt, lower, upper)
+    return query(handler)
+
+def check(wkbs, expected):
+    handler = AirspaceHandler()
+    assert handler.add_airspaces(wkbs, *limits) == len(AIRSPACES)
+    for a, b in zip(query(handler), expected):
+        np.testing.assert_array_equal(a, b)
+
+@pytest.mark.parametrize("encode", [
+    lambda g: g.wkb,
+    lambda g: shapely.to_wkb(g, byte_order=0),
+    lambda g: shapely.force_3d(g, 100).wkb,
+    lambda g: shapely.to_wkb(shapely.set_srid(g, 4326), include_srid=True),
+    lambda g: g.geoms[0].wkb,
+], ids=["little_endian", "big_endian", "3d", "srid", "polygon"])
+def test_encodings(expected, encode):
+    check([encode(g) for g in geometries()], expected)
+
+def test_generator(expected):
+    # every bytes object is only referenced by the generator while it is produced
+    check((g.wkb for g in geometries()), expected)
+    check(tuple(g.wkb for g in geometries()), expected)
+
+def test_missing_geometry_is_empty():
+    handler = AirspaceHandler()
+    wkbs = [g.wkb for g in geometries()]
+    wkbs[0] = None
+    assert handler.add_airspaces(wkbs, *limits) == len(AIRSPACES)
+    assert handler.airspaces_at_point(0.5, 50.5, 1000, True) == []
+    assert handler.airspaces_at_point(1.5, 50.5, 1000, True) == [1]
+
+@pytest.mark.parametrize("bad", [
+    b"\x01\x03\x00\x00",
+    Polygon([(0, 0), (1, 0), (1, 1)]).exterior.wkb,
+], ids=["truncated", "linestring"])
+def test_invalid_wkb(bad):
+    wkbs = [g.wkb for g in geometries()]
+    wkbs[1] = bad
+    assert AirspaceHandler().add_airspaces(wkbs, *limits) == -1
+
+def test_invalid_arguments():
+    wkbs = [g.wkb for g in geometries()]
+    assert AirspaceHandler().add_airspaces(wkbs[:2], *limits) == -1
+    assert AirspaceHandler().add_airspaces(["not bytes"] + wkbs[1:], *limits) == -1
+    with pytest.raises(TypeError):
+        AirspaceHandler().add_airspaces(3, *limits)